@@ -0,0 +1,32 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import sys
+
+import vfp2py.bench
+
+
+def stage_benchmark_test():
+    cases = vfp2py.bench.input_cases([], [2])
+    results = vfp2py.bench.run_benchmark(cases, repeat=1, warmup=0)
+    result = results['cases']['synthetic:2']
+    assert list(result['stages']) == list(vfp2py.bench.STAGES)
+    assert result['ll_fallbacks'] == 0
+    assert result['tokens'] > result['lines'] > 30
+    assert vfp2py.bench.compare(results, results) == []
+    slower = {'cases': {'synthetic:2': dict(result, stages=dict(result['stages'], parse=result['stages']['parse'] * 2 + 1))}}
+    assert vfp2py.bench.compare(results, slower) == [
+        ('synthetic:2', 'parse', result['stages']['parse'], result['stages']['parse'] * 2 + 1),
+        ('TOTAL', 'parse', result['stages']['parse'], result['stages']['parse'] * 2 + 1),
+    ]
+
+
+def import_time_test():
+    seconds, loaded = vfp2py.bench.import_time('vfp2py.vfp2py', repeat=1)
+    assert seconds > 0
+    assert loaded == ['antlr4', 'vfp2py.VisualFoxpro9Parser']
+    if sys.version_info >= (3, 7):
+        assert vfp2py.bench.import_time('vfp2py.__main__', repeat=1)[1] == []
+    results = {'imports': {'vfp2py.vfp2py': seconds}}
+    slower = {'imports': {'vfp2py.vfp2py': seconds * 2 + 1}}
+    assert vfp2py.bench.compare(dict(results, cases={}), dict(slower, cases={})) == [('import', 'vfp2py.vfp2py', seconds, seconds * 2 + 1)]
@@ -1088,3 +1088,34 @@ vfpfunc.report_form(None)
         print(''.join(diff))
         raise
 
+
+def Test21():
+    input_str = '''
+?FILE(\'test.txt\')
+?JUSTPATH(\'c:\\dir\\test.txt\')
+?SQRT(4)
+'''.strip()
+    output_str = '''
+from __future__ import division, print_function
+
+import math
+import os
+
+from vfp2py import vfpfunc
+from vfp2py.vfpfunc import DB, Array, C, F, M, S, lparameters, parameters, vfpclass
+
+
+@lparameters()
+def MAIN():
+    print(os.path.isfile(\'test.txt\'))
+    print(os.path.dirname(\'c:\\\\dir\\\\test.txt\'))
+    print(math.sqrt(4))
+'''.strip()
+    test_output_str = vfp2py.vfp2py.prg2py(input_str).strip()
+    try:
+        assert test_output_str == output_str
+    except AssertionError:
+        diff = difflib.unified_diff((test_output_str + '\n').splitlines(1), (output_str + '\n').splitlines(1))
+        print(''.join(diff))
+        raise
+
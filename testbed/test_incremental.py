@@ -0,0 +1,73 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import vfp2py.vfp2py
+from vfp2py.incremental import IncrementalProgram
+
+SOURCE = '''#DEFINE LIMIT 10
+x = first(LIMIT)
+
+PROCEDURE first
+   LPARAMETERS n
+   RETURN n + 1
+ENDPROC
+
+DEFINE CLASS widget AS custom
+   size = LIMIT
+   PROCEDURE grow
+      this.size = this.size + first(1)
+   ENDPROC
+ENDDEFINE
+
+PROCEDURE second
+   RETURN first(LIMIT) * 2
+ENDPROC
+'''
+
+
+def full(source):
+    return vfp2py.vfp2py.prg2py(source, input_filename='main')
+
+
+def edit(program, old, new):
+    start = program.source.index(old)
+    output = program.edit(start, start + len(old), new)
+    assert output == full(program.source)
+    return output
+
+
+def counting_parses(program):
+    parsed = []
+    parse = program.parse
+    def counted(chunk, memory):
+        parsed.append(chunk)
+        return parse(chunk, memory)
+    program.parse = counted
+    return parsed
+
+
+def incremental_edit_test():
+    program = IncrementalProgram(SOURCE, 'main')
+    assert program.output() == full(SOURCE)
+    parsed = counting_parses(program)
+    edit(program, 'n + 1', 'n + 2')
+    assert len(parsed) == 1 and 'PROCEDURE first' in parsed[0].text
+    del parsed[:]
+    assert 'LIMIT' not in edit(program, '#DEFINE LIMIT 10', '#DEFINE LIMIT 20')
+    assert len(parsed) == len(program.chunks)
+    edit(program, 'PROCEDURE second', 'PROCEDURE third')
+    edit(program, 'this.size + first(1)', 'this.size + third()')
+    edit(program, '   ENDPROC\nENDDEFINE', '   ENDPROC\n   PROCEDURE shrink\n   ENDPROC\nENDDEFINE')
+    edit(program, 'x = first(LIMIT)\n', 'x = first(LIMIT)\nPROCEDURE zeroth\n')
+
+
+def incremental_error_test():
+    program = IncrementalProgram(SOURCE, 'main')
+    start = program.source.index('RETURN n + 1')
+    try:
+        program.edit(start, start, 'IF (\n')
+        assert False, 'expected the syntax error to be raised'
+    except Exception:
+        pass
+    assert program.edit(start, start + len('IF (\n'), '') == full(SOURCE)
+    assert program.offset(5, 3) == start
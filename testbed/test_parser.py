@@ -0,0 +1,196 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import os
+import re
+import shutil
+import tempfile
+
+import antlr4
+from antlr4.dfa.DFA import DFA
+from antlr4.ListTokenSource import ListTokenSource
+
+import vfp2py
+import vfp2py.dfacache
+import vfp2py.exprparser
+import vfp2py.parseprofile
+
+CODE = '''procedure _program_main
+x = 1
+DEFINE CLASS form AS custom
+   PROCEDURE init
+   ENDPROC
+ENDDEFINE
+* comment
+PROTECTED PROCEDURE a
+SET PROCEDURE TO b
+ENDPROC
+FUNCTION b
+ENDFUNC
+'''
+
+def tokenize(data):
+    stream = antlr4.CommonTokenStream(vfp2py.vfp2py.VisualFoxpro9Lexer(antlr4.InputStream(data)))
+    stream.fill()
+    return stream.tokens
+
+def split_prg_tokens_test():
+    chunks = vfp2py.vfp2py.split_prg_tokens(tokenize(CODE))
+    assert [''.join(token.text for token in chunk if token.type != antlr4.Token.EOF) for chunk in chunks] == [
+        'procedure _program_main\nx = 1\n',
+        'DEFINE CLASS form AS custom\n   PROCEDURE init\n   ENDPROC\nENDDEFINE\n* comment\n',
+        'PROTECTED PROCEDURE a\nSET PROCEDURE TO b\nENDPROC\n',
+        'FUNCTION b\nENDFUNC\n',
+    ]
+    code = 'procedure _program_main\nTEXT TO x NOSHOW\nPROCEDURE inside\nDEFINE CLASS a AS b\nENDT\ntext = 1\nTEXT\nPROCEDURE c\nENDTEXT\nPROCEDURE after\nENDPROC\n'
+    chunks = vfp2py.vfp2py.split_prg_tokens(tokenize(code))
+    assert [''.join(token.text for token in chunk if token.type != antlr4.Token.EOF) for chunk in chunks] == [
+        'procedure _program_main\nTEXT TO x NOSHOW\nPROCEDURE inside\nDEFINE CLASS a AS b\nENDT\ntext = 1\nTEXT\nPROCEDURE c\nENDTEXT\n',
+        'PROCEDURE after\nENDPROC\n',
+    ]
+
+def chunked_parse_test():
+    tree = vfp2py.vfp2py.parse_prg_chunks(tokenize(CODE))
+    assert [child.getChild(0).getChild(0).getText() for child in tree.children[:-1]] == ['procedure', 'DEFINE', 'PROTECTED', 'FUNCTION']
+    assert tree.children[-1].symbol.type == antlr4.Token.EOF
+    assert all(child.parentCtx is tree for child in tree.children[:-1])
+
+def chunked_parse_error_line_test():
+    try:
+        vfp2py.vfp2py.prg2py('x = 1\nPROCEDURE a\ny = 2\nENDPROC\nPROCEDURE b\n? 1 +\nENDPROC\n')
+    except Exception as err:
+        assert str(err) == 'Syntax Error on line 7: ? 1 +'
+    else:
+        assert False
+
+def chunked_parse_fallback_test():
+    output = vfp2py.vfp2py.prg2py('PROCEDURE a\nfunc = 2\n? func\nENDPROC\n')
+    assert 'S.func = 2\n    print(S.func)\n' in output
+
+def preprocessed_tokens_test():
+    code = '#define TWO 1 + 1\r\nx = TWO\r\n  && note\r\nTEXT TO y\r\nTWO\r\nENDTEXT\r\nz = TWO * TWO\r\n'
+    tokens = vfp2py.vfp2py.lex_code('procedure _program_main\n') + vfp2py.vfp2py.preprocess_code(code).tokens
+    data = ''.join(token.text.replace('\r', '') for token in tokens)
+    copied = vfp2py.vfp2py.program_tokens(tokens)
+    offset = 0
+    for token in copied:
+        line_start = data.rfind('\n', 0, offset) + 1
+        assert data[offset:offset + len(token.text)] == token.text
+        assert (token.line, token.column) == (data.count('\n', 0, offset) + 1, offset - line_start)
+        offset += len(token.text)
+    assert offset == len(data)
+    assert len(set(map(id, copied))) == len(copied)
+    assert vfp2py.vfp2py.prg2py(code) == vfp2py.vfp2py.prg2py_after_preproc(data, 'prg', '')
+    assert '# a\n    S.x = 1\n    S.y = 2\n' in vfp2py.vfp2py.prg2py('x = 1 && a ;\ny = 2\n')
+
+def parser_profile_test():
+    vfp2py.parseprofile.ENABLED = True
+    try:
+        vfp2py.vfp2py.prg2py('PROCEDURE a\nfunc = 2\n? func\nENDPROC\n')
+        profile = vfp2py.parseprofile.take()
+    finally:
+        vfp2py.parseprofile.ENABLED = False
+    assert vfp2py.parseprofile.take() == {'decisions': {}, 'sll_failures': {}}
+    assert profile['sll_failures'] == {'identifier': 1}
+    report = vfp2py.parseprofile.report(vfp2py.parseprofile.merge([profile, profile]), vfp2py.vfp2py.VisualFoxpro9Parser)
+    predictions = sum(counts[vfp2py.parseprofile.PREDICTIONS] for counts in profile['decisions'].values())
+    assert report['totals']['predictions'] == 2 * predictions
+    assert report['totals']['sll_failures'] == 2
+    rules = {stats['rule']: stats for stats in report['rules']}
+    assert rules['identifier']['sll_failures'] == 2
+    assert rules['expr']['predictions'] > 0
+    assert all(stats['max_lookahead'] >= 1 and stats['lookahead'] >= stats['predictions'] for stats in report['decisions'])
+
+def dfa_snapshot_test():
+    code = 'procedure _program_main\nx = 1\n? x + 2\n'
+    recognizers = [vfp2py.vfp2py.VisualFoxpro9Lexer, vfp2py.vfp2py.VisualFoxpro9Parser]
+    def parse(lexer_class, parser_class):
+        stream = antlr4.CommonTokenStream(lexer_class(antlr4.InputStream(code)))
+        return vfp2py.vfp2py.run_parser(stream, parser_class(stream), 'prg').toStringTree(recog=parser_class)
+    expected = parse(*recognizers)
+    fresh = [type(recognizer.__name__, (recognizer,), {
+        '__module__': recognizer.__module__,
+        'decisionsToDFA': [DFA(state, i) for i, state in enumerate(recognizer.atn.decisionToState)],
+    }) for recognizer in recognizers]
+    version = vfp2py.dfacache.SNAPSHOT_VERSION
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'test.dfa')
+        vfp2py.dfacache.save(recognizers, filename)
+        assert vfp2py.dfacache.load(fresh, filename)
+        for recognizer, restored in zip(recognizers, fresh):
+            for dfa in recognizer.decisionsToDFA:
+                assert len(restored.decisionsToDFA[dfa.decision].states) == len(dfa.states)
+        assert parse(*fresh) == expected
+        vfp2py.dfacache.SNAPSHOT_VERSION = version + 1
+        assert not vfp2py.dfacache.load(fresh, filename)
+    finally:
+        vfp2py.dfacache.SNAPSHOT_VERSION = version
+        shutil.rmtree(directory)
+
+def corpus_tokens():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(directory, 'conversion.vfp2py')) as fid:
+        sections = re.findall(r'@begin=vfp@(?:&&(\w*))?\r?\n(.*?)@end=vfp@', fid.read(), re.S)
+    with open(os.path.join(directory, 'test_lib.prg')) as fid:
+        sections.append(('', fid.read()))
+    for parser_start, code in sections:
+        if parser_start:
+            yield parser_start, vfp2py.vfp2py.lex_code(code)
+        else:
+            yield 'prg', vfp2py.vfp2py.lex_code('procedure _program_main\n') + vfp2py.vfp2py.preprocess_code(code).tokens
+
+def token_stream(tokens):
+    stream = antlr4.CommonTokenStream(ListTokenSource(vfp2py.vfp2py.program_tokens(tokens)))
+    stream.fill()
+    return stream
+
+def tree_structure(node):
+    if isinstance(node, antlr4.tree.Tree.TerminalNode):
+        return node.symbol.tokenIndex
+    children = list(node.getChildren())
+    token_index = lambda token: token.tokenIndex if token is not None else None
+    return (type(node).__name__, token_index(node.start), token_index(node.stop), token_index(getattr(node, 'op', None)),
+            all(child.parentCtx is node for child in children), [tree_structure(child) for child in children])
+
+def subtrees(node):
+    yield node
+    for child in getattr(node, 'children', None) or []:
+        for subtree in subtrees(child):
+            yield subtree
+
+def converted(tree):
+    return repr(vfp2py.vfp2py.PythonConvertVisitor('').visit(tree))
+
+def hand_parser_differential_test():
+    parser_class = vfp2py.vfp2py.VisualFoxpro9Parser
+    parse = lambda stream, parser_start: vfp2py.vfp2py.run_parser(stream, parser_class(stream), parser_start)
+    parsed = fallbacks = 0
+    for parser_start, tokens in corpus_tokens():
+        stream = token_stream(tokens)
+        tree = parse(stream, parser_start)
+        for ctx in subtrees(tree):
+            if isinstance(ctx, parser_class.ConstantContext):
+                rule = 'constant'
+            elif isinstance(ctx, parser_class.ExprContext) and not isinstance(ctx.parentCtx, parser_class.ExprContext):
+                rule = 'expr'
+            else:
+                continue
+            expression = ctx.parser.getTokenStream().tokens[ctx.start.tokenIndex:ctx.stop.tokenIndex+1]
+            hand = vfp2py.exprparser.parse(parser_class(token_stream(expression)), rule)
+            if hand is None:
+                fallbacks += 1
+                continue
+            expected = getattr(parser_class(token_stream(expression)), rule)()
+            assert tree_structure(hand) == tree_structure(expected)
+            assert converted(hand) == converted(expected)
+            parsed += 1
+
+        pathname = vfp2py.exprparser.pathname
+        vfp2py.exprparser.pathname = lambda parser, start, stop: None
+        try:
+            expected = converted(parse(token_stream(tokens), parser_start))
+        finally:
+            vfp2py.exprparser.pathname = pathname
+        assert converted(tree) == expected
+    assert fallbacks * 100 < parsed
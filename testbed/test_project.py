@@ -0,0 +1,388 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import dbf
+
+import vfp2py
+import vfp2py.depgraph
+import vfp2py.pathindex
+import vfp2py.shard
+import vfp2py.timings
+import vfp2py.watch
+
+
+STREAM_PRG = '''#DEFINE GREETING 'hello'
+? GREETING
+later(1)
+PROCEDURE first
+   TEXT TO x NOSHOW
+PROCEDURE not_a_procedure
+   ENDTEXT
+   RETURN x
+ENDPROC
+* comment after first
+
+#IF .T.
+PROCEDURE inside_if
+   ? GREETING
+ENDPROC
+#ENDIF
+DEFINE CLASS thing AS custom
+   value = GREETING
+   PROCEDURE init
+      ? this.value
+   ENDPROC
+ENDDEFINE
+FUNCTION later(a, ;
+               b)
+   o = CREATEOBJECT('thing')
+   RETURN a
+ENDFUNC
+'''
+
+def write_file(filename, data):
+    with open(filename, 'w') as fid:
+        fid.write(data)
+
+
+def read_tree(directory):
+    contents = {}
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            filename = os.path.join(root, name)
+            with open(filename) as fid:
+                contents[os.path.relpath(filename, directory)] = fid.read()
+    return contents
+
+
+def make_project(directory):
+    os.mkdir(os.path.join(directory, 'lib'))
+    write_file(os.path.join(directory, 'defs.h'), '#define MYCONST 42\n')
+    write_file(os.path.join(directory, 'main.prg'), '#include "defs.h"\nDO util IN util\n? MYCONST\n')
+    write_file(os.path.join(directory, 'lib', 'util.prg'), 'PROCEDURE util\n? 1 + 2\nENDPROC\n')
+    write_file(os.path.join(directory, 'lib', 'broken.prg'), 'DEFINE CLASS form AS custom\nENDDEFINE\n')
+    project = os.path.join(directory, 'proj')
+    table = dbf.Table(project, 'name M; type C(1); exclude L; mainprog L', dbf_type='vfp')
+    table.open(mode=dbf.READ_WRITE)
+    table.append(('main.prg\x00', 'P', False, True))
+    table.append(('lib\\util.prg\x00', 'P', False, False))
+    table.append(('lib\\broken.prg\x00', 'P', False, False))
+    table.append(('defs.h\x00', 'P', False, False))
+    table.close()
+    os.rename(project + '.dbf', project + '.pjx')
+    os.rename(project + '.fpt', project + '.pjt')
+    return project + '.pjx'
+
+
+def convert_project(jobs):
+    directory = tempfile.mkdtemp()
+    search_path = vfp2py.vfp2py.SEARCH_PATH[:]
+    try:
+        vfp2py.vfp2py.SEARCH_PATH[:] = [directory]
+        project = make_project(directory)
+        vfp2py.vfp2py.convert_project(project, os.path.join(directory, 'out'), jobs=jobs)
+        return read_tree(os.path.join(directory, 'out'))
+    finally:
+        vfp2py.vfp2py.SEARCH_PATH[:] = search_path
+        shutil.rmtree(directory)
+
+
+def parallel_project_test():
+    serial = convert_project(1)
+    parallel = convert_project(2)
+    assert sorted(serial) == sorted(parallel)
+    assert serial == parallel
+    assert os.path.join('out', 'broken.py') not in serial
+    assert 'print(42)' in serial[os.path.join('out', 'main.py')]
+
+
+def line_diagnostics_test():
+    directory = tempfile.mkdtemp()
+    try:
+        jobs = []
+        for name in ('first.prg', 'second.prg'):
+            write_file(os.path.join(directory, name), '? 1\nx = SUBSTR(a)\n')
+            jobs.append((name, os.path.join(directory, name), directory))
+        failures, records = vfp2py.vfp2py.run_project_jobs(jobs, 2)
+        assert failures == []
+        for record in records:
+            [diagnostic] = record['diagnostics']
+            assert diagnostic['level'] == 'ERROR' and '"x = SUBSTR(a)"' in diagnostic['message']
+            assert 'IndexError' in diagnostic['traceback']
+    finally:
+        shutil.rmtree(directory)
+
+
+def sharded_project_test():
+    directory = tempfile.mkdtemp()
+    search_path = vfp2py.vfp2py.SEARCH_PATH[:]
+    try:
+        vfp2py.vfp2py.SEARCH_PATH[:] = [directory]
+        project = make_project(directory)
+        shared = os.path.join(directory, 'shared')
+        manifest = vfp2py.shard.write_manifest(project, os.path.join(directory, 'out'), shared, 2)
+        assert len(manifest['shards']) == 2
+        assert sorted(job[0] for shard in manifest['shards'] for job in shard['jobs']) == ['broken.prg', 'defs.h', 'main.prg', 'util.prg']
+        try:
+            vfp2py.shard.merge(shared)
+            assert False
+        except ValueError:
+            pass
+        workers = [multiprocessing.Process(target=vfp2py.shard.work, args=(shared,)) for i in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert vfp2py.shard.work(shared) == []
+        assert sorted(os.listdir(os.path.join(shared, 'reports'))) == ['shard0000.json', 'shard0001.json']
+        failures = vfp2py.shard.merge(shared)
+        assert [name for name, error in failures] == ['broken.prg']
+        sharded = read_tree(os.path.join(directory, 'out'))
+    finally:
+        vfp2py.vfp2py.SEARCH_PATH[:] = search_path
+        shutil.rmtree(directory)
+    assert sharded == convert_project(1)
+
+
+def timings_report_test():
+    directory = tempfile.mkdtemp()
+    search_path = vfp2py.vfp2py.SEARCH_PATH[:]
+    reset_peak_memory = vfp2py.timings.reset_peak_memory
+    resets = []
+    try:
+        vfp2py.vfp2py.SEARCH_PATH[:] = [directory]
+        vfp2py.timings.reset_peak_memory = lambda: resets.append(reset_peak_memory())
+        project = make_project(directory)
+        vfp2py.vfp2py.convert_project(project, os.path.join(directory, 'plain'))
+        assert resets == []
+        vfp2py.vfp2py.TIMINGS = os.path.join(directory, 'timings.json')
+        vfp2py.timings.MEMORY = True
+        vfp2py.vfp2py.convert_project(project, os.path.join(directory, 'out'))
+        assert len(resets) == 4
+        with open(vfp2py.vfp2py.TIMINGS) as fid:
+            report = json.load(fid)
+        records = {record['file']: record for record in report['files']}
+        assert sorted(records) == ['broken.prg', 'defs.h', 'main.prg', 'util.prg']
+        assert records['broken.prg']['failed']
+        main = records['main.prg']
+        assert sorted(main['stages']) == ['convert', 'format', 'lex', 'parse', 'preprocess', 'write']
+        assert main['tokens'] > 0 and main['output_bytes'] > 0 and main['peak_memory'] > 0
+        assert main['ll_fallbacks'] == 0
+        assert records['defs.h']['stages'] == {}
+        assert report['totals']['files'] == 4
+        assert len(report['slowest']) == 4
+    finally:
+        vfp2py.vfp2py.SEARCH_PATH[:] = search_path
+        vfp2py.vfp2py.TIMINGS = None
+        vfp2py.timings.MEMORY = False
+        vfp2py.timings.reset_peak_memory = reset_peak_memory
+        shutil.rmtree(directory)
+
+
+def dependency_graph_test():
+    directory = tempfile.mkdtemp()
+    scan_file = vfp2py.depgraph.scan_file
+    scanned = []
+    def record_scan(filename):
+        scanned.append(os.path.basename(filename))
+        return scan_file(filename)
+    try:
+        files = {
+            'defs.h': '#define MYCONST 42\n',
+            'main.prg': '#include "defs.h"\nSET PROCEDURE TO util ADDITIVE\nDO FORM entry\nx = NEWOBJECT("widget", "widgets.prg")\nDO missing IN gone\n',
+            'util.prg': 'PROCEDURE util\n? 1\nENDPROC\n',
+            'widgets.prg': 'DEFINE CLASS base AS custom\nENDDEFINE\nDEFINE CLASS widget AS base\nENDDEFINE\n',
+            'other.prg': 'DEFINE CLASS fancy AS widget\nENDDEFINE\n',
+        }
+        project_files = {'entry.scx': None}
+        for name, data in files.items():
+            project_files[name] = os.path.join(directory, name)
+            write_file(project_files[name], data)
+        cache_dir = os.path.join(directory, 'cache')
+        project = os.path.join(directory, 'proj.pjx')
+        graph = vfp2py.depgraph.load_graph(project, project_files, cache_dir)
+        edges, unresolved = graph.edges()
+        assert edges['main.prg'] == ['defs.h', 'entry.scx', 'util.prg', 'widgets.prg']
+        assert unresolved['main.prg'] == ['gone']
+        assert edges['other.prg'] == ['widgets.prg'] and edges['widgets.prg'] == []
+        assert graph.dependents(['defs.h']) == set(['main.prg'])
+        assert graph.dependents(['widgets.prg']) == set(['main.prg', 'other.prg'])
+        graph.record_costs([{'file': 'util.prg', 'wall': 5.0, 'failed': False, 'cached': False}])
+        assert graph.schedule(sorted(project_files))[0] == 'util.prg'
+        vfp2py.depgraph.save_graph(graph, cache_dir)
+
+        vfp2py.depgraph.GRAPHS.clear()
+        vfp2py.depgraph.scan_file = record_scan
+        write_file(project_files['util.prg'], 'PROCEDURE util\n? 12\nENDPROC\n')
+        graph = vfp2py.depgraph.load_graph(project, project_files, cache_dir)
+        assert scanned == ['util.prg']
+        assert graph.cost('util.prg') == 5.0
+
+        graph.write(os.path.join(directory, 'graph.json'))
+        with open(os.path.join(directory, 'graph.json')) as fid:
+            assert json.load(fid)['files']['other.prg']['depends'] == ['widgets.prg']
+        graph.write(os.path.join(directory, 'graph.dot'))
+        with open(os.path.join(directory, 'graph.dot')) as fid:
+            assert '"main.prg" -> "defs.h";' in fid.read()
+    finally:
+        vfp2py.depgraph.scan_file = scan_file
+        vfp2py.depgraph.GRAPHS.clear()
+        shutil.rmtree(directory)
+
+
+def path_index_test():
+    directory = tempfile.mkdtemp()
+    search_path = vfp2py.vfp2py.SEARCH_PATH[:]
+    listdir = os.listdir
+    listed = []
+    def record_listdir(path):
+        listed.append(path)
+        return listdir(path)
+    try:
+        os.mkdir(os.path.join(directory, 'Lib'))
+        write_file(os.path.join(directory, 'Lib', 'Util.PRG'), '')
+        write_file(os.path.join(directory, 'DEFS.H'), '')
+        for path in (directory, os.path.join(directory, 'Lib')):
+            os.utime(path, (0, 1000))
+        vfp2py.vfp2py.SEARCH_PATH[:] = [directory]
+        os.listdir = record_listdir
+        assert vfp2py.vfp2py.find_full_path('lib\\util.prg', directory) == (os.path.join(directory, 'Lib', 'Util.PRG'), False)
+        assert vfp2py.vfp2py.find_full_path('lib\\gone.prg', directory) == (os.path.join(directory, 'Lib', 'gone.prg'), True)
+        assert vfp2py.vfp2py.which('defs.h') == os.path.join(directory, 'DEFS.H')
+        assert vfp2py.vfp2py.which('lib/util.prg') == os.path.join(directory, 'Lib', 'Util.PRG')
+        assert vfp2py.vfp2py.which('other.h') == 'other.h'
+        assert sorted(listed) == [directory, os.path.join(directory, 'Lib')]
+
+        del listed[:]
+        write_file(os.path.join(directory, 'Other.h'), '')
+        os.utime(directory, (0, 2000))
+        assert vfp2py.vfp2py.which('other.h') == os.path.join(directory, 'Other.h')
+        assert listed == [directory]
+
+        del listed[:]
+        files = [os.path.join(directory, 'file{}.prg'.format(i)) for i in range(5)]
+        for filename in files:
+            write_file(filename, '')
+        os.utime(directory, (0, 3000))
+        vfp2py.vfp2py.SEARCH_PATH[:] = files + [directory]
+        assert vfp2py.vfp2py.which('defs.h') == os.path.join(directory, 'DEFS.H')
+        assert vfp2py.vfp2py.which('missing.h') == 'missing.h'
+        assert listed == [directory]
+        assert sorted(vfp2py.pathindex.NOT_DIRECTORIES) == sorted(files)
+    finally:
+        os.listdir = listdir
+        vfp2py.vfp2py.SEARCH_PATH[:] = search_path
+        vfp2py.pathindex.clear()
+        shutil.rmtree(directory)
+
+
+def watch_test():
+    directory = tempfile.mkdtemp()
+    search_path = vfp2py.vfp2py.SEARCH_PATH[:]
+    try:
+        vfp2py.vfp2py.SEARCH_PATH[:] = [directory]
+        project = make_project(directory)
+        watcher = vfp2py.watch.Watcher(project, os.path.join(directory, 'out'))
+        assert watcher.poll() == ['broken.prg', 'defs.h', 'main.prg', 'util.prg']
+        assert os.path.isfile(os.path.join(directory, 'out', 'out', '__main__.py'))
+        assert watcher.poll() == []
+        write_file(os.path.join(directory, 'defs.h'), '#define MYCONST 4300\n')
+        assert watcher.poll() == ['defs.h', 'main.prg']
+        with open(os.path.join(directory, 'out', 'out', 'main.py')) as fid:
+            assert 'print(4300)' in fid.read()
+        write_file(os.path.join(directory, 'lib', 'broken.prg'), 'PROCEDURE broken\nENDPROC\n')
+        assert watcher.poll() == ['broken.prg']
+        assert os.path.isfile(os.path.join(directory, 'out', 'out', 'broken.py'))
+    finally:
+        vfp2py.vfp2py.SEARCH_PATH[:] = search_path
+        vfp2py.vfp2py.INCLUDE.clear()
+        shutil.rmtree(directory)
+
+
+def conversion_cache_test():
+    directory = tempfile.mkdtemp()
+    search_path = vfp2py.vfp2py.SEARCH_PATH[:]
+    convert_tokens = vfp2py.vfp2py.convert_tokens
+    def fail_conversion(*args):
+        raise Exception('file should have been read from cache')
+    try:
+        vfp2py.vfp2py.SEARCH_PATH[:] = [directory]
+        vfp2py.vfp2py.CACHE_DIR = os.path.join(directory, 'cache')
+        make_project(directory)
+        infile = os.path.join(directory, 'main.prg')
+        outfile = os.path.join(directory, 'main.py')
+        vfp2py.vfp2py.convert_file(infile, outfile)
+        with open(outfile) as fid:
+            output = fid.read()
+        assert 'print(42)' in output
+        os.remove(outfile)
+
+        vfp2py.vfp2py.convert_tokens = fail_conversion
+        vfp2py.vfp2py.convert_file(infile, outfile)
+        with open(outfile) as fid:
+            assert fid.read() == output
+        vfp2py.vfp2py.convert_tokens = convert_tokens
+
+        write_file(os.path.join(directory, 'defs.h'), '#define MYCONST 4300\n')
+        vfp2py.vfp2py.convert_file(infile, outfile)
+        with open(outfile) as fid:
+            assert 'print(4300)' in fid.read()
+    finally:
+        vfp2py.vfp2py.convert_tokens = convert_tokens
+        vfp2py.vfp2py.SEARCH_PATH[:] = search_path
+        vfp2py.vfp2py.CACHE_DIR = None
+        vfp2py.vfp2py.INCLUDE.clear()
+        shutil.rmtree(directory)
+
+
+def precompiled_header_test():
+    directory = tempfile.mkdtemp()
+    preprocess_file = vfp2py.vfp2py.preprocess_file
+    def fail_preprocess(filename):
+        raise Exception('header should have been read from cache')
+    try:
+        vfp2py.vfp2py.CACHE_DIR = os.path.join(directory, 'cache')
+        header = os.path.join(directory, 'defs.h')
+        write_file(header, '#define MYCONST 42 && the answer\n#define OTHER MYCONST\n')
+        visitor = vfp2py.vfp2py.include_file(header)
+        vfp2py.vfp2py.INCLUDE.clear()
+        vfp2py.vfp2py.preprocess_file = fail_preprocess
+        cached_visitor = vfp2py.vfp2py.include_file(header)
+        assert cached_visitor is not visitor
+        assert sorted(cached_visitor.memory) == ['myconst', 'other']
+        for name in visitor.memory:
+            assert [(t.type, t.text) for t in visitor.memory[name]] == [(t.type, t.text) for t in cached_visitor.memory[name]]
+        assert [t.text for t in visitor.tokens] == [t.text for t in cached_visitor.tokens]
+        assert vfp2py.vfp2py.include_file(header) is cached_visitor
+    finally:
+        vfp2py.vfp2py.preprocess_file = preprocess_file
+        vfp2py.vfp2py.CACHE_DIR = None
+        vfp2py.vfp2py.INCLUDE.clear()
+        shutil.rmtree(directory)
+
+def streaming_conversion_test():
+    directory = tempfile.mkdtemp()
+    try:
+        infile = os.path.join(directory, 'stream.prg')
+        write_file(infile, STREAM_PRG)
+        chunks = list(vfp2py.vfp2py.prg_chunks(STREAM_PRG.splitlines(True)))
+        assert [chunk.splitlines()[0] for chunk in chunks] == ["#DEFINE GREETING 'hello'", 'PROCEDURE first', 'DEFINE CLASS thing AS custom', 'FUNCTION later(a, ;']
+        assert vfp2py.vfp2py.prg_definitions(STREAM_PRG.splitlines(True), 'stream') == (['Thing'], ['first', 'inside_if', 'later'])
+        outputs = []
+        for stream in (False, True):
+            vfp2py.vfp2py.STREAM = stream
+            outfile = os.path.join(directory, 'stream{}.py'.format(int(stream)))
+            vfp2py.vfp2py.convert_file(infile, outfile)
+            with open(outfile) as fid:
+                outputs.append(fid.read())
+        assert outputs[0] == outputs[1]
+        assert 'S.o = Thing()' in outputs[1]
+    finally:
+        vfp2py.vfp2py.STREAM = False
+        shutil.rmtree(directory)
@@ -0,0 +1,110 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import vfp2py.serve
+
+
+def requests(directory):
+    infile = os.path.join(directory, 'main.prg')
+    with open(infile, 'w') as fid:
+        fid.write('? 1 + 2\n')
+    return [
+        {'id': 1, 'op': 'prg2py', 'source': 'x = 1 + 2', 'parser_start': 'line', 'prepend_data': ''},
+        {'id': 2, 'op': 'convert_file', 'infile': infile, 'outfile': os.path.join(directory, 'main.py')},
+        {'id': 3, 'op': 'prg2py', 'source': 'DEFINE CLASS form AS custom\nENDDEFINE\n'},
+        {'id': 4, 'op': 'compile'},
+    ]
+
+
+def check_responses(responses, directory):
+    responses = {response['id']: response for response in responses}
+    assert sorted(responses, key=str) == [1, 2, 3, 4, None]
+    assert responses[1]['ok'] and responses[1]['output'].strip() == 'S.x = 1 + 2'
+    assert responses[1]['timings']['tokens'] > 0 and responses[1]['diagnostics'] == []
+    assert responses[2]['ok'] and responses[2]['includes'] == []
+    with open(os.path.join(directory, 'main.py')) as fid:
+        assert 'print(1 + 2)' in fid.read()
+    assert not responses[3]['ok'] and 'reserved classname' in responses[3]['error']
+    assert responses[3]['diagnostics'][-1]['level'] == 'ERROR'
+    assert responses[4]['error'] == 'ValueError: unknown op compile'
+    assert responses[None]['error'].startswith('invalid request')
+
+
+def serve_stream_test():
+    directory = tempfile.mkdtemp()
+    try:
+        lines = [json.dumps(request) for request in requests(directory)] + ['{not json']
+        with tempfile.TemporaryFile('w+') as infile, tempfile.TemporaryFile('w+') as outfile:
+            infile.write('\n'.join(lines) + '\n')
+            infile.seek(0)
+            vfp2py.serve.serve_stream(vfp2py.serve.Server(), infile, outfile)
+            outfile.seek(0)
+            responses = [json.loads(line) for line in outfile]
+        check_responses(responses, directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def serve_socket_test():
+    directory = tempfile.mkdtemp()
+    server = vfp2py.serve.Server(jobs=2)
+    path = os.path.join(directory, 'vfp2py.sock')
+    unix_server = vfp2py.serve.socket_server(server, path)
+    thread = threading.Thread(target=unix_server.serve_forever)
+    thread.start()
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+        lines = [json.dumps(request) for request in requests(directory)] + ['{not json']
+        client.sendall(('\n'.join(lines) + '\n').encode('utf-8'))
+        reader = client.makefile('rb')
+        responses = [json.loads(reader.readline().decode('utf-8')) for line in lines]
+        client.close()
+        assert [response['id'] for response in responses] == [1, 2, 3, 4, None]
+        check_responses(responses, directory)
+    finally:
+        unix_server.shutdown()
+        unix_server.server_close()
+        thread.join()
+        server.close()
+        shutil.rmtree(directory)
+
+
+def serve_parallel_test():
+    server = vfp2py.serve.Server(jobs=2)
+    source = ''.join('x{0} = {0} + 2\n'.format(i) for i in range(20))
+    responses = []
+    done = threading.Event()
+    def respond(response):
+        responses.append(response)
+        if len(responses) == 2:
+            done.set()
+    try:
+        start = time.time()
+        for request_id in (1, 2):
+            server.submit(json.dumps({'id': request_id, 'op': 'prg2py', 'source': source}), respond)
+        assert done.wait(60)
+        elapsed = time.time() - start
+    finally:
+        server.close()
+    assert all(response['ok'] for response in responses)
+    assert elapsed < sum(response['timings']['wall'] for response in responses)
+
+
+def serve_document_test():
+    server = vfp2py.serve.Server()
+    open_request = {'id': 1, 'op': 'open', 'document': 'main.prg', 'source': 'x = 1\n', 'input_filename': 'main'}
+    assert server.handle(json.dumps(open_request))['ok']
+    edit_request = {'id': 2, 'op': 'edit', 'document': 'main.prg', 'start': {'line': 0, 'character': 4}, 'end': 5, 'text': '2'}
+    response = server.handle(json.dumps(edit_request))
+    assert response['ok'] and response['output'] == vfp2py.vfp2py.prg2py('x = 2\n', input_filename='main')
+    assert server.handle(json.dumps({'id': 3, 'op': 'close', 'document': 'main.prg'}))['ok']
+    assert 'not open' in server.handle(json.dumps(edit_request))['error']
@@ -0,0 +1,148 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import os
+import shutil
+import tempfile
+
+import dbf
+
+import vfp2py.vfp2py
+import vfp2py.vfptable
+
+
+def make_table(filename, specs, rows, table_ext, memo_ext, deleted=()):
+    basename = os.path.splitext(filename)[0]
+    table = dbf.Table(basename, specs, dbf_type='vfp', codepage='cp1252')
+    table.open(mode=dbf.READ_WRITE)
+    for row in rows:
+        table.append(row)
+    for index in deleted:
+        dbf.delete(table[index])
+    table.close()
+    os.rename(basename + '.dbf', basename + table_ext)
+    os.rename(basename + '.fpt', basename + memo_ext)
+    return basename + table_ext
+
+
+def read_table_test():
+    directory = tempfile.mkdtemp()
+    try:
+        rows = [
+            (u'main.prg', u'P', False, True, 12, 3.5, u'one\r\ntwo'),
+            (u'caf\xe9.prg', u'P', True, False, -4, 0, u''),
+            (u'gone.prg', u'P', None, False, 0, 1.25, u'x' * 1000),
+        ]
+        filename = make_table(os.path.join(directory, 'proj'), 'name M; type C(1); exclude L; mainprog L; count I; size N(6,2); notes M', rows, '.pjx', '.pjt', deleted=[2])
+        with vfp2py.vfptable.Table(filename, os.path.join(directory, 'proj.pjt')) as table:
+            assert table.field_names == ['name', 'type', 'exclude', 'mainprog', 'count', 'size', 'notes']
+            assert len(table) == 3
+            assert [[record[name] for name in table.field_names] for record in table] == [list(row) for row in rows]
+            assert [record.deleted for record in table] == [False, False, True]
+            assert table[1].name == u'caf\xe9.prg' and table[-1].count == 0
+    finally:
+        shutil.rmtree(directory)
+
+
+def convert_vcx_test():
+    directory = tempfile.mkdtemp()
+    vcx_class_code = vfp2py.vfp2py.vcx_class_code
+    try:
+        properties = u'Name = "thing"\r\ncaption = hello\r\ncolor = 1,2,3\r\nexpr = (1+2)\r\n'
+        rows = [
+            (u'COMMENT', u'', u'', u'', u'', u''),
+            (u'WINDOWS', u'custom', u'thing', properties, u'PROCEDURE init\r\n? this.caption\r\nENDPROC\r\n', u'defs.h'),
+        ]
+        filename = make_table(os.path.join(directory, 'lib'), 'platform C(8); class M; objname M; properties M; methods M; reserved8 M', rows, '.vcx', '.vct')
+        assert vfp2py.vfp2py.convert_vcx_to_vfp_code(filename) == [
+            u'#include "defs.h"\nDEFINE CLASS thing AS custom\nName = "thing"\ncaption = "hello"\ncolor = RGB(1,2,3)\nexpr = (1+2)\n\n'
+            u'PROCEDURE init\n? this.caption\nENDPROC\nENDDEFINE\n\n'
+        ]
+        library = vfp2py.vfp2py.load_class_library(filename)
+
+        def fail_class_code(record):
+            raise Exception('class should have been reused')
+        vfp2py.vfp2py.vcx_class_code = fail_class_code
+        os.utime(filename, (0, 0))
+        assert vfp2py.vfp2py.convert_vcx_to_vfp_code(filename) == library.codes()
+        reloaded = vfp2py.vfp2py.load_class_library(filename)
+        assert reloaded is not library and list(reloaded.code.values()) == library.codes()
+
+        vfp2py.vfp2py.vcx_class_code = vcx_class_code
+        rows[1] = rows[1][:3] + (properties.replace('hello', 'goodbye'),) + rows[1][4:]
+        make_table(os.path.join(directory, 'lib'), 'platform C(8); class M; objname M; properties M; methods M; reserved8 M', rows, '.vcx', '.vct')
+        changed = vfp2py.vfp2py.load_class_library(filename)
+        assert len(changed.code) == 1 and 'caption = "goodbye"' in changed.codes()[0]
+    finally:
+        vfp2py.vfp2py.vcx_class_code = vcx_class_code
+        vfp2py.vfp2py.CLASSLIBS.clear()
+        shutil.rmtree(directory)
+
+
+def classify_constant_test():
+    values = ['12', '.5', '1.5e3', '0x1F', '0h0A', '12abc', '12&x', '$12', '$x', '.T.', '.f.', '.N.', '.NULL.', '.T', '.',
+              'NULL', 'null', 'nullable', 'Arial', '_x', 'T', u'\xe9', '{}', '{^2020-01-02}', '{^2020-01-02 10:00}', '{//}',
+              '"abc"', '"abc', "'a'b", '[x]', '[x', '"a&b"', 'a&b', ' 12', '', '*', '&& x', ';']
+    reused = vfp2py.vfp2py.ConstantParser()
+    for value in values:
+        expected = vfp2py.vfp2py.ConstantParser().parses(value)
+        assert vfp2py.vfp2py.classify_constant(value) in (None, expected), value
+        assert reused.parses(value) == expected, value
+    assert [vfp2py.vfp2py.vcx_property_value(value) for value in ('Arial', '-12', '.T.', '', '1,2,3', '(1)', 'a"b', "'a\"b'", '[a]\'"')] == [
+        '"Arial"', '-12', '.T.', '""', 'RGB(1,2,3)', '(1)', "'a\"b'", "'a\"b'", '[a]\'"']
+
+
+def form_property_assignment_test():
+    values = ['12', '007', '.5', '1.', '1.5e3', '0x1F', '12abc', '$12', '.T.', '.f.', '.N.', '.NULL.', '.T', '"abc"', "'a\"b'",
+              '[x]', '"a" + "b"', '"a&b"', '"a\\b"', '{^2020-01-02}', '{}', 'Arial', '-12', '-.5', '-"a"', '--3', '12345678901234567890']
+    for value in values:
+        line = '   Value = ' + value
+        assignment = vfp2py.vfp2py.form_property_assignment(line)
+        try:
+            tree = vfp2py.vfp2py.parse_form_property(line)
+        except vfp2py.vfp2py.FormPropertyError:
+            assert assignment is None, value
+            continue
+        expected = vfp2py.vfp2py.PythonConvertVisitor('form').class_property_assignments(tree.cmd())
+        assert assignment is None or [assignment] == expected, value
+    assert vfp2py.vfp2py.form_property_assignment('Class = 1') == 'self.classtype = 1'
+    assert vfp2py.vfp2py.form_property_assignment('Do = 1') is None
+    assert vfp2py.vfp2py.form_property_assignment('a.b = 1') is None
+
+
+def convert_scx_test():
+    directory = tempfile.mkdtemp()
+    parse_form_property = vfp2py.vfp2py.parse_form_property
+    try:
+        specs = 'platform C(8); class M; baseclass M; objname M; parent M; properties M; methods M'
+        def scx_outputs(name, properties, methods):
+            rows = [
+                (u'WINDOWS', u'dataenvironment', u'dataenvironment', u'Dataenvironment', u'', u'Top = 0\r\n', u''),
+                (u'WINDOWS', u'form', u'form', u'Form1', u'', properties, methods),
+                (u'WINDOWS', u'commandbutton', u'commandbutton', u'Command1', u'Form1', u'Caption = "OK"\r\n', u'PROCEDURE Click\r\nthisform.release\r\nENDPROC\r\n'),
+            ]
+            filename = make_table(os.path.join(directory, name), specs, rows, '.scx', '.sct')
+            outfile = os.path.join(directory, name + '.py')
+            vfp2py.vfp2py.convert_file(filename, outfile)
+            with open(outfile, 'rb') as fid:
+                output = fid.read().decode('utf-8')
+            expected = u'# coding=utf-8\n' + vfp2py.vfp2py.prg2py(vfp2py.vfp2py.convert_scx_to_vfp_code(filename), input_filename=name)
+            return vfp2py.vfp2py.convert_scx_lines(vfp2py.vfp2py.scx_form_lines(filename), name), output, expected
+
+        properties = u'Caption = "Form1"\r\nStart = {^2020-01-02}\r\nLeft = Left + 1\r\n\r\nTag = [x]\r\nTop = -12\r\nVisible = .T.\r\n'
+        parsed = []
+        def record_parse(line):
+            parsed.append(line.strip())
+            return parse_form_property(line)
+        vfp2py.vfp2py.parse_form_property = record_parse
+        converted, output, expected = scx_outputs('direct', properties, u'PROCEDURE Load\r\n? 1 && note\r\nENDPROC\r\n')
+        assert converted is not None
+        assert output == expected
+        assert parsed == [u'Start = {^2020-01-02}', u'Left = Left + 1'] * 2
+        assert vfp2py.vfp2py.convert_scx_lines([(u'DEFINE CLASS form1 AS form', u''), (u'   Top = 1', u'form2'), (u'ENDDEFINE', u'')], 'unused') is None
+        converted, output, expected = scx_outputs('define', properties, u'#DEFINE X 1\r\nPROCEDURE Load\r\n? X\r\nENDPROC\r\n')
+        assert converted is None
+        assert output == expected
+    finally:
+        vfp2py.vfp2py.parse_form_property = parse_form_property
+        shutil.rmtree(directory)
@@ -1,5 +1,16 @@
 # coding=utf-8
 from __future__ import absolute_import, division, print_function
 
-from . import vfpfunc
-from . import vfp2py
+import importlib
+import sys
+
+SUBMODULES = ('vfpfunc', 'vfp2py')
+
+def __getattr__(name):
+    '''import the runtime and the converter the first time they are used so the command line starts without loading them'''
+    if name in SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+if sys.version_info < (3, 7):
+    from . import vfp2py
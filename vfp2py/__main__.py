@@ -3,28 +3,56 @@ from __future__ import absolute_import, division, print_function
 
 import argparse
 import logging
-
-from . import vfp2py
+import sys
 
 def parse_args(argv=None):
-    parser = argparse.ArgumentParser(description='Tool for rewriting Foxpro code in Python')
+    parser = argparse.ArgumentParser(description='Tool for rewriting Foxpro code in Python', epilog='"vfp2py serve" starts a conversion server instead, see "vfp2py serve --help", and "vfp2py shard" converts a project on several hosts, see "vfp2py shard --help"')
     parser.add_argument("--logging", help="output logging information", action='store_true')
     parser.add_argument("--profile", help="turn on profiling", action='store_true')
+    parser.add_argument("--jobs", "-j", help="number of processes to use when converting a project, 0 uses all cpus", type=int, default=1)
+    parser.add_argument("--cache-dir", help="directory used to cache converted files between runs so only changed files are converted again", type=str)
+    parser.add_argument("--stream", help="convert prg files one procedure or class at a time to limit memory use, bypasses the cache", action='store_true')
+    parser.add_argument("--timings", help="write a json report of the time, tokens, output size and peak memory of each file when converting a project and list the slowest files", type=str, metavar='REPORT')
+    parser.add_argument("--graph", help="write the dependencies between the files of a project to a json file, or to a graphviz file when it ends in .dot", type=str, metavar='GRAPH')
+    parser.add_argument("--parser-profile", help="write a json report of the predictions made at each decision of the grammar, their lookahead, time, full context predictions and ambiguities, by rule and by decision, and list the slowest decisions", type=str, metavar='REPORT')
+    parser.add_argument("--watch", help="keep running after converting and convert files again when they or the files they include change", action='store_true')
+    parser.add_argument("--interval", help="seconds between checks for changed files when watching", type=float, default=1.0)
     parser.add_argument("infile", help="file to convert - supported file types are prg, mpr, spr, scx, vcx, or pjx,", type=str)
     parser.add_argument("outpath", help="path to output converted code, will be a filename for all but pjx which will be a directory", type=str)
     parser.add_argument("search", help="directory to search for included files", type=str, nargs='*')
     return parser.parse_args(argv)
 
 def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['serve']:
+        from . import serve
+        return serve.main(argv[1:])
+    if argv[:1] == ['shard']:
+        from . import shard
+        return shard.main(argv[1:])
     args = parse_args(argv)
     if args.logging:
         logging.basicConfig(level=logging.DEBUG)
+    from . import vfp2py
     vfp2py.SEARCH_PATH += args.search
-    if args.profile:
+    vfp2py.CACHE_DIR = args.cache_dir
+    vfp2py.STREAM = args.stream
+    vfp2py.TIMINGS = args.timings
+    vfp2py.GRAPH = args.graph
+    vfp2py.PARSER_PROFILE = args.parser_profile
+    vfp2py.parseprofile.ENABLED = bool(args.parser_profile)
+    vfp2py.timings.MEMORY = bool(args.timings)
+    if args.watch:
+        from . import watch
+        watch.watch(args.infile, args.outpath, args.interval)
+    elif args.profile:
         import cProfile
-        cProfile.runctx('vfp2py.convert_file(args.infile, args.outpath)', globals(), locals())
+        cProfile.runctx('vfp2py.convert_file(args.infile, args.outpath, jobs=args.jobs)', globals(), locals())
     else:
-        vfp2py.convert_file(args.infile, args.outpath)
+        vfp2py.convert_file(args.infile, args.outpath, jobs=args.jobs)
+    if args.parser_profile and not args.watch and not args.infile.lower().endswith('.pjx'):
+        vfp2py.write_parser_profile([vfp2py.parseprofile.take()])
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,245 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import timeit
+from collections import OrderedDict
+
+import antlr4
+from antlr4.ListTokenSource import ListTokenSource
+
+from . import dfacache
+from . import timings
+from . import vfp2py
+from .emitter import emit
+
+STAGES = ('read', 'preprocess', 'lex', 'parse', 'convert', 'format', 'write')
+PRG_PREPEND = 'procedure _program_main\n'
+CONVERSION_TESTS = os.path.join('testbed', 'conversion.vfp2py')
+CONVERSION_CASE = re.compile(r'^@begin=vfp@(?:&&(\w*))?\r?\n(.*?)^@end=vfp@', re.M | re.S)
+IMPORT_MODULES = ('vfp2py.__main__', 'vfp2py.vfp2py')
+HEAVY_MODULES = ('antlr4', 'dbf', 'pyodbc', 'PySide', 'vfp2py.VisualFoxpro9Parser', 'vfp2py.vfpfunc')
+IMPORT_SCRIPT = '''import sys, timeit
+start = timeit.default_timer()
+import {}
+print(timeit.default_timer() - start)
+print(' '.join(sys.modules))
+'''
+
+def conversion_cases(filename):
+    '''read the foxpro side of each test in a conversion test file'''
+    with io.open(filename, encoding='utf-8') as fid:
+        data = fid.read()
+    cases = []
+    for i, match in enumerate(CONVERSION_CASE.finditer(data)):
+        parser_start = match.group(1) or 'prg'
+        prepend_data = '' if match.group(1) else PRG_PREPEND
+        name = '{}:Test{}'.format(os.path.basename(filename), i)
+        cases.append((name, lambda code=match.group(2).strip(): [code], parser_start, prepend_data))
+    return cases
+
+def synthetic_program(procedures):
+    '''build a program with the given number of procedures to measure how stages scale with input size'''
+    lines = ['LOCAL total', 'total = 0']
+    for i in range(procedures):
+        lines += [
+            '* synthetic procedure {}'.format(i),
+            'PROCEDURE proc{}(a, b)'.format(i),
+            '   LOCAL x, y',
+            '   x = a + b * {} - LEN("text {}")'.format(i, i),
+            '   y = SUBSTR(ALLTRIM(STR(x)), 1, 3)',
+            '   IF x > {} AND NOT EMPTY(y)'.format(i),
+            "      ? 'large', x",
+            '   ELSE',
+            '      y = UPPER(y) + CHR(13)',
+            '   ENDIF',
+            '   FOR x = 1 TO 10',
+            '      y = y + TRANSFORM(x)',
+            '   ENDFOR',
+            '   RETURN proc{}(x, y)'.format(max(i - 1, 0)),
+            'ENDPROC',
+        ]
+    return '\n'.join(lines) + '\n'
+
+def read_source(filename):
+    file_ext = os.path.splitext(filename.lower())[1]
+    if file_ext == '.vcx':
+        vfp2py.CLASSLIBS.clear()
+        return vfp2py.convert_vcx_to_vfp_code(filename)
+    elif file_ext == '.scx':
+        return [vfp2py.convert_scx_to_vfp_code(filename)]
+    with open(filename, 'rb') as fid:
+        return [fid.read().decode('cp1252')]
+
+def input_cases(inputs, synthetic):
+    cases = []
+    for filename in inputs:
+        if filename.endswith('.vfp2py'):
+            cases += conversion_cases(filename)
+        else:
+            cases.append((filename, lambda filename=filename: read_source(filename), 'prg', PRG_PREPEND))
+    for procedures in synthetic:
+        name = 'synthetic:{}'.format(procedures)
+        cases.append((name, lambda procedures=procedures: [synthetic_program(procedures)], 'prg', PRG_PREPEND))
+    return cases
+
+def time_stages(read, parser_start='prg', prepend_data=PRG_PREPEND, input_filename='bench'):
+    '''run each stage of a conversion on its own and return the seconds spent in each'''
+    times = OrderedDict()
+    stats = {}
+    timer = [timeit.default_timer()]
+    def lap(stage):
+        now = timeit.default_timer()
+        times[stage] = now - timer[0]
+        timer[0] = now
+
+    datas = read()
+    lap('read')
+
+    tokens = [token for data in datas for token in vfp2py.preprocess_code(data).tokens]
+    lap('preprocess')
+
+    tokens = vfp2py.program_tokens(vfp2py.lex_code(prepend_data) + tokens)
+    stream = antlr4.CommonTokenStream(ListTokenSource(tokens))
+    stream.fill()
+    stats['tokens'] = len(stream.tokens)
+    lap('lex')
+
+    ll_fallbacks = timings.COUNTS.get('ll_fallbacks', 0)
+    tree = vfp2py.run_parser(stream, vfp2py.VisualFoxpro9Parser(stream), parser_start)
+    stats['ll_fallbacks'] = timings.COUNTS.get('ll_fallbacks', 0) - ll_fallbacks
+    lap('parse')
+
+    output_tree = vfp2py.PythonConvertVisitor(input_filename).visit(tree)
+    lap('convert')
+
+    output = emit(output_tree) if isinstance(output_tree, list) else output_tree
+    lap('format')
+
+    with tempfile.TemporaryFile() as fid:
+        fid.write(('# coding=utf-8\n' + output).encode('utf-8'))
+    lap('write')
+
+    stats['lines'] = sum(token.text.count('\n') for token in tokens)
+    stats['output_bytes'] = len(output)
+    return times, stats
+
+def import_time(module, repeat=3):
+    '''seconds a fresh interpreter takes to import a module, along with the heavy modules it loaded'''
+    best = None
+    for i in range(max(repeat, 1)):
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT.format(module)]).decode('utf-8').splitlines()
+        seconds = float(output[0])
+        best = seconds if best is None else min(best, seconds)
+    loaded = set(output[1].split())
+    return best, [name for name in HEAVY_MODULES if name in loaded]
+
+def import_times(modules=IMPORT_MODULES, repeat=3):
+    return OrderedDict((module, import_time(module, repeat)[0]) for module in modules)
+
+def run_benchmark(cases, repeat=3, warmup=1):
+    '''time every case, keeping the fastest of the repeated runs for each stage'''
+    results = OrderedDict()
+    for name, read, parser_start, prepend_data in cases:
+        for i in range(warmup):
+            time_stages(read, parser_start, prepend_data)
+        best = None
+        for i in range(max(repeat, 1)):
+            times, stats = time_stages(read, parser_start, prepend_data)
+            best = times if best is None else OrderedDict((stage, min(best[stage], times[stage])) for stage in best)
+        result = OrderedDict(stats)
+        result['stages'] = best
+        result['total'] = sum(best.values())
+        results[name] = result
+    totals = OrderedDict((stage, sum(result['stages'][stage] for result in results.values())) for stage in STAGES)
+    return OrderedDict([
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('repeat', repeat),
+        ('warmup', warmup),
+        ('cases', results),
+        ('totals', totals),
+    ])
+
+def compare(baseline, results, threshold=0.1, noise=0.001):
+    '''list the stages that got slower than the baseline by more than threshold'''
+    names = sorted(set(baseline['cases']) & set(results['cases']))
+    regressions = []
+    imports = baseline.get('imports', {})
+    for module, new in results.get('imports', {}).items():
+        old = imports.get(module)
+        if old is not None and new - old > noise and new > old * (1 + threshold):
+            regressions.append(('import', module, old, new))
+    for name in names + ['TOTAL']:
+        for stage in STAGES:
+            if name == 'TOTAL':
+                old = sum(baseline['cases'][case]['stages'].get(stage, 0) for case in names)
+                new = sum(results['cases'][case]['stages'].get(stage, 0) for case in names)
+            elif stage in baseline['cases'][name]['stages']:
+                old, new = baseline['cases'][name]['stages'][stage], results['cases'][name]['stages'][stage]
+            else:
+                continue
+            if new - old > noise and new > old * (1 + threshold):
+                regressions.append((name, stage, old, new))
+    return regressions
+
+def print_results(results, fid=None):
+    print('{:<40}'.format('case') + ''.join('{:>11}'.format(stage) for stage in STAGES + ('total',)), file=fid)
+    cases = list(results['cases'].items()) + [('TOTAL', {'stages': results['totals'], 'total': sum(results['totals'].values())})]
+    for name, result in cases:
+        times = [result['stages'][stage] for stage in STAGES] + [result['total']]
+        print('{:<40}'.format(name[-40:]) + ''.join('{:>11.4f}'.format(seconds) for seconds in times), file=fid)
+    for module, seconds in results.get('imports', {}).items():
+        print('{:<40}{:>11.4f}'.format('import ' + module, seconds), file=fid)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Time each stage of converting Foxpro code to Python')
+    parser.add_argument("inputs", help="prg, vcx or scx files or conversion test files (.vfp2py) to time, defaults to {}".format(CONVERSION_TESTS), type=str, nargs='*')
+    parser.add_argument("--synthetic", help="number of procedures in each generated program to time", type=int, nargs='*', default=[])
+    parser.add_argument("--repeat", help="number of timed runs of each input, the fastest is kept", type=int, default=3)
+    parser.add_argument("--warmup", help="number of untimed runs of each input before timing", type=int, default=1)
+    parser.add_argument("--search", help="directory to search for included files", type=str, action='append', default=[])
+    parser.add_argument("--output", "-o", help="file to write the json results to", type=str)
+    parser.add_argument("--compare", help="json results of an earlier run to check for regressions against", type=str)
+    parser.add_argument("--save-dfa", help="save the parser prediction DFAs warmed up by the inputs to a snapshot loaded by later runs, defaults to {}".format(dfacache.SNAPSHOT), type=str, nargs='?', const=dfacache.SNAPSHOT, metavar='SNAPSHOT')
+    parser.add_argument("--imports", help="also time importing the command line and the converter in a fresh interpreter", action='store_true')
+    parser.add_argument("--threshold", help="fraction a stage may slow down before it is reported as a regression", type=float, default=0.1)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    vfp2py.SEARCH_PATH += args.search
+    inputs = args.inputs
+    if not inputs and not args.synthetic and os.path.isfile(CONVERSION_TESTS):
+        inputs = [CONVERSION_TESTS]
+    results = run_benchmark(input_cases(inputs, args.synthetic), args.repeat, args.warmup)
+    if args.imports:
+        results['imports'] = import_times(repeat=args.repeat)
+    if args.output:
+        with open(args.output, 'w') as fid:
+            json.dump(results, fid, indent=2)
+    print_results(results)
+    if args.save_dfa:
+        dfacache.save([vfp2py.VisualFoxpro9Lexer, vfp2py.VisualFoxpro9Parser], args.save_dfa)
+        print('saved prediction DFAs to {}'.format(args.save_dfa))
+    if args.compare:
+        with open(args.compare) as fid:
+            baseline = json.load(fid)
+        regressions = compare(baseline, results, args.threshold)
+        for name, stage, old, new in regressions:
+            print('regression in {} {}: {:.4f}s -> {:.4f}s'.format(name, stage, old, new))
+        if regressions:
+            return 1
+        print('no regressions against {}'.format(args.compare))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
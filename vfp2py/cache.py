@@ -0,0 +1,92 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+import glob
+import hashlib
+import tempfile
+
+CONVERTER_VERSION = None
+
+def file_digest(filename):
+    try:
+        with open(filename, 'rb') as fid:
+            return hashlib.sha1(fid.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+def converter_version():
+    '''hash of the converter sources so that any change to the converter invalidates cached output'''
+    global CONVERTER_VERSION
+    if CONVERTER_VERSION is None:
+        digest = hashlib.sha1()
+        for filename in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+            with open(filename, 'rb') as fid:
+                digest.update(fid.read())
+        CONVERTER_VERSION = digest.hexdigest()
+    return CONVERTER_VERSION
+
+def atomic_write(filename, data):
+    directory = os.path.dirname(filename)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+    fd, tmpname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as fid:
+        fid.write(data)
+    try:
+        os.rename(tmpname, filename)
+    except OSError:
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmpname, filename)
+
+class ConversionCache(object):
+    '''On disk store of converted python code and precompiled headers.
+
+    Entries are keyed by the converter version, the search path and the bytes of
+    the source file and its memo file. Each entry records the includes resolved
+    while preprocessing along with their digests, so an entry is only reused
+    while every include still resolves to the same unchanged file.'''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def key(self, filenames, search_path):
+        digest = hashlib.sha1()
+        digest.update(converter_version().encode('utf-8'))
+        for path in filter(None, search_path):
+            digest.update(os.path.abspath(path).encode('utf-8'))
+            digest.update(b'\0')
+        for filename in filenames:
+            digest.update(os.path.basename(filename).encode('utf-8'))
+            digest.update(b'\0')
+            with open(filename, 'rb') as fid:
+                digest.update(fid.read())
+        return digest.hexdigest()
+
+    def entry_filename(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def lookup(self, key, which):
+        try:
+            with open(self.entry_filename(key), 'rb') as fid:
+                entry = json.loads(fid.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+        for name, filename, digest in entry['includes']:
+            if which(name) != filename or file_digest(filename) != digest:
+                return None
+        return entry
+
+    def store(self, key, includes, output):
+        includes = sorted(set(includes))
+        entry = {
+            'includes': [[name, filename, file_digest(filename)] for name, filename in includes],
+            'output': output,
+        }
+        atomic_write(self.entry_filename(key), json.dumps(entry).encode('utf-8'))
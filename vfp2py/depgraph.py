@@ -0,0 +1,269 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import json
+import ntpath
+import os
+import re
+from collections import OrderedDict
+
+from . import vfptable
+from .cache import atomic_write
+
+GRAPH_VERSION = 1
+SECONDS_PER_BYTE = 2e-5
+TEXT_EXTENSIONS = ('.prg', '.mpr', '.spr', '.h')
+TABLE_EXTENSIONS = {'.scx': 'sct', '.vcx': 'vct'}
+DEFAULT_EXTENSIONS = {'include': '', 'program': '.prg', 'procedure': '.prg', 'form': '.scx', 'classlib': '.vcx'}
+OPTIONAL_KINDS = ('class', 'program')
+
+STRING = r'''(?:"([^"\n]*)"|'([^'\n]*)'|\[([^\]\n]*)\])'''
+INCLUDE_REF = re.compile(r'^[ \t]*#[ \t]*include[ \t]+' + STRING, re.I | re.M)
+DO_REF = re.compile(r'^[ \t]*do[ \t]+(?!(?:case|whil|while)\b)(form[ \t]+)?([\w.\\:]+)(?:[ \t]+in[ \t]+([\w.\\:]+))?', re.I | re.M)
+SET_REF = re.compile(r'^[ \t]*set[ \t]+(proc\w*|classl\w*)[ \t]+to[ \t]+([^\n&]*)', re.I | re.M)
+NEWOBJECT_REF = re.compile(r'(\.)?\bnewo(?:b(?:j(?:e(?:ct?)?)?)?)?[ \t]*\(((?:[ \t]*' + STRING + r'[ \t]*,?)+)', re.I)
+CLASS_REF = re.compile(r'^[ \t]*defi(?:ne?)?[ \t]+class[ \t]+(\w+)[ \t]+as[ \t]+(\w+)(?:[ \t]+of[ \t]+([\w.\\:]+))?', re.I | re.M)
+STRING_ARG = re.compile(STRING)
+
+GRAPHS = {}
+
+def strings(text):
+    return [next(group for group in match.groups() if group is not None) for match in STRING_ARG.finditer(text)]
+
+def code_refs(code):
+    '''the (kind, name) references in foxpro code along with the names of the classes it defines'''
+    refs = []
+    classes = []
+    for match in INCLUDE_REF.finditer(code):
+        refs.append(('include', strings(match.group(0))[0]))
+    for match in DO_REF.finditer(code):
+        form, name, module = match.groups()
+        if form:
+            refs.append(('form', name))
+        elif module:
+            refs.append(('procedure', module))
+        else:
+            refs.append(('program', name))
+    for match in SET_REF.finditer(code):
+        kind = 'procedure' if match.group(1).lower().startswith('proc') else 'classlib'
+        for item in match.group(2).split(','):
+            words = item.split()
+            if words and words[0].lower() not in ('additive',):
+                refs.append((kind, words[0].strip('"\'[]')))
+    for match in NEWOBJECT_REF.finditer(code):
+        args = strings(match.group(2))
+        module_arg = 2 if match.group(1) else 1
+        if len(args) > module_arg and args[module_arg]:
+            refs.append(('classlib', args[module_arg]))
+    for match in CLASS_REF.finditer(code):
+        name, parent, module = match.groups()
+        classes.append(name.lower())
+        refs.append(('classlib', module) if module else ('class', parent))
+    return refs, classes
+
+def table_refs(filename, memofile):
+    '''the references in the records of a scx or vcx along with the names of the classes a vcx defines'''
+    refs = []
+    classes = []
+    is_library = filename.lower().endswith('.vcx')
+    with vfptable.Table(filename, memofile) as table:
+        for record in table:
+            if record.deleted:
+                continue
+            code_ref, code_classes = code_refs(record.get('methods') or '')
+            refs += code_ref
+            for name in (record.get('reserved8') or '').splitlines():
+                refs.append(('include', name))
+            parent = record.get('class')
+            if not parent:
+                continue
+            if record.get('classloc'):
+                refs.append(('classlib', record.classloc))
+            else:
+                refs.append(('class', parent))
+            if is_library and record.objname and not record.parent:
+                classes.append(record.objname.lower())
+    return refs, classes
+
+def source_files(filename):
+    file_ext = os.path.splitext(filename.lower())[1]
+    if file_ext in TABLE_EXTENSIONS:
+        from .vfp2py import memo_filename
+        memofile = memo_filename(filename, TABLE_EXTENSIONS[file_ext])
+        return [filename] + ([memofile] if memofile else [])
+    return [filename]
+
+def scan_file(filename):
+    file_ext = os.path.splitext(filename.lower())[1]
+    try:
+        if file_ext in TABLE_EXTENSIONS:
+            return table_refs(*(source_files(filename) + [None])[:2])
+        elif file_ext in TEXT_EXTENSIONS:
+            with open(filename, 'rb') as fid:
+                return code_refs(fid.read().decode('cp1252'))
+    except (IOError, OSError, ValueError):
+        pass
+    return [], []
+
+def reference_name(kind, name):
+    '''the project name of a file reference, the lower case basename with the default extension of its kind'''
+    name = ntpath.basename(name.replace('/', '\\')).lower()
+    basename, ext = os.path.splitext(name)
+    if ext == '.fxp':
+        ext = '.prg'
+    return basename + (ext or DEFAULT_EXTENSIONS[kind])
+
+class ProjectGraph(object):
+    '''Dependencies between the files of a project.
+
+    Each file is scanned for the files it includes, the procedure files and
+    class libraries it uses, the forms it runs and the classes it subclasses.
+    Scans are kept along with the stamps of the scanned files, so only files
+    that changed are scanned again. The time each file took to convert is kept
+    as well to start the most expensive files first.'''
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.files = OrderedDict()
+
+    def update(self, project_files):
+        '''rescan the project files that changed, project_files maps names to paths'''
+        from .vfp2py import file_stamp
+        files = OrderedDict()
+        for name in sorted(project_files):
+            path = project_files[name]
+            old = self.files.get(name)
+            if path is None:
+                files[name] = {'path': None, 'stamps': [], 'refs': [], 'classes': [], 'cost': None}
+                continue
+            stamps = [[filename, file_stamp(filename)] for filename in source_files(path)]
+            if old and old['path'] == path and old['stamps'] == stamps:
+                files[name] = old
+                continue
+            refs, classes = scan_file(path)
+            files[name] = {'path': path, 'stamps': stamps, 'refs': [list(ref) for ref in OrderedDict.fromkeys(refs)], 'classes': classes,
+                           'cost': old['cost'] if old else None}
+        self.files = files
+        return self
+
+    def class_index(self):
+        index = {}
+        for name, info in self.files.items():
+            for class_name in info['classes']:
+                index.setdefault(class_name, name)
+        return index
+
+    def edges(self):
+        '''map each file to the project files it depends on and to the references that could not be resolved'''
+        index = self.class_index()
+        edges = OrderedDict()
+        unresolved = OrderedDict()
+        for name, info in self.files.items():
+            depends = set()
+            missing = []
+            for kind, ref in info['refs']:
+                if kind == 'class':
+                    target = index.get(ref.lower())
+                else:
+                    target = reference_name(kind, ref)
+                    if target not in self.files:
+                        if kind not in OPTIONAL_KINDS:
+                            missing.append(ref)
+                        target = None
+                if target and target != name:
+                    depends.add(target)
+            edges[name] = sorted(depends)
+            unresolved[name] = sorted(set(missing))
+        return edges, unresolved
+
+    def dependents(self, names):
+        '''the files that depend on any of the named files, directly or through other files'''
+        edges, unresolved = self.edges()
+        reverse = {}
+        for name, depends in edges.items():
+            for depend in depends:
+                reverse.setdefault(depend, set()).add(name)
+        found = set()
+        pending = list(names)
+        while pending:
+            for dependent in reverse.get(pending.pop(), ()):
+                if dependent not in found:
+                    found.add(dependent)
+                    pending.append(dependent)
+        return found - set(names)
+
+    def cost(self, name):
+        info = self.files.get(name)
+        if not info or not info['path']:
+            return 0
+        if info['cost'] is not None:
+            return info['cost']
+        return sum((stamp or [0, 0])[1] for filename, stamp in info['stamps']) * SECONDS_PER_BYTE
+
+    def schedule(self, names):
+        '''order names so the files expected to take longest to convert come first'''
+        return sorted(names, key=lambda name: (-self.cost(name), name))
+
+    def record_costs(self, records):
+        for record in records:
+            if record['file'] in self.files and not record['failed'] and not record['cached']:
+                self.files[record['file']]['cost'] = record['wall']
+
+    def export(self):
+        edges, unresolved = self.edges()
+        return OrderedDict([
+            ('project', self.filename),
+            ('files', OrderedDict((name, OrderedDict([
+                ('path', info['path']),
+                ('depends', edges[name]),
+                ('unresolved', unresolved[name]),
+                ('classes', info['classes']),
+                ('cost', self.cost(name)),
+            ])) for name, info in self.files.items())),
+        ])
+
+    def to_dot(self):
+        edges, unresolved = self.edges()
+        lines = ['digraph project {']
+        for name in self.files:
+            lines.append('    "{}";'.format(name))
+        for name, depends in edges.items():
+            for depend in depends:
+                lines.append('    "{}" -> "{}";'.format(name, depend))
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        '''export the graph as graphviz dot when filename ends in .dot, as json otherwise'''
+        if filename.lower().endswith('.dot'):
+            data = self.to_dot()
+        else:
+            data = json.dumps(self.export(), indent=2) + '\n'
+        with open(filename, 'w') as fid:
+            fid.write(data)
+
+def graph_filename(project, cache_dir):
+    key = hashlib.sha1(os.path.normcase(os.path.abspath(project)).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, 'graphs', key + '.json')
+
+def load_graph(project, project_files, cache_dir=None):
+    '''the dependency graph of a project, updated from the one kept in memory or in the cache directory'''
+    key = os.path.normcase(os.path.abspath(project))
+    graph = GRAPHS.get(key)
+    if graph is None:
+        graph = ProjectGraph(project)
+        if cache_dir:
+            try:
+                with open(graph_filename(project, cache_dir), 'rb') as fid:
+                    data = json.loads(fid.read().decode('utf-8'))
+                if data.get('version') == GRAPH_VERSION:
+                    graph.files = OrderedDict(sorted(data['files'].items()))
+            except (IOError, OSError, ValueError, KeyError):
+                pass
+    GRAPHS[key] = graph.update(project_files)
+    return graph
+
+def save_graph(graph, cache_dir):
+    data = {'version': GRAPH_VERSION, 'files': graph.files}
+    atomic_write(graph_filename(graph.filename, cache_dir), json.dumps(data).encode('utf-8'))
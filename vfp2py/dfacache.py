@@ -0,0 +1,336 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import logging
+import os
+import sys
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from antlr4.PredictionContext import PredictionContext, SingletonPredictionContext, ArrayPredictionContext
+from antlr4.atn.ATNConfig import ATNConfig, LexerATNConfig
+from antlr4.atn.ATNConfigSet import ATNConfigSet
+from antlr4.atn.ATNSimulator import ATNSimulator
+from antlr4.atn.ATNType import ATNType
+from antlr4.atn.LexerATNSimulator import LexerATNSimulator
+from antlr4.atn.LexerAction import LexerIndexedCustomAction
+from antlr4.atn.LexerActionExecutor import LexerActionExecutor
+from antlr4.atn.SemanticContext import SemanticContext, Predicate, PrecedencePredicate
+from antlr4.dfa.DFAState import DFAState, PredPrediction
+
+from .cache import atomic_write
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'VisualFoxpro9.dfa')
+
+class Unsupported(Exception):
+    pass
+
+def grammar_digest(recognizers):
+    '''hash of the serialized ATNs, which change whenever the grammar does'''
+    digest = hashlib.sha1(str(SNAPSHOT_VERSION).encode('utf-8'))
+    for recognizer in recognizers:
+        digest.update(sys.modules[recognizer.__module__].serializedATN().encode('utf-8'))
+    return digest.hexdigest()
+
+def error_state(atn):
+    return LexerATNSimulator.ERROR if atn.grammarType == ATNType.LEXER else ATNSimulator.ERROR
+
+class DFAWriter(object):
+    '''flatten the states of a DFA into tuples that refer to the ATN by number'''
+
+    def __init__(self, atn):
+        self.atn = atn
+        self.contexts = []
+        self.context_ids = {}
+
+    def context(self, context):
+        if context is None:
+            return None
+        if id(context) not in self.context_ids:
+            if context is PredictionContext.EMPTY:
+                record = ('e',)
+            elif isinstance(context, ArrayPredictionContext):
+                record = ('a', [self.context(parent) for parent in context.parents], list(context.returnStates))
+            elif isinstance(context, SingletonPredictionContext):
+                record = ('s', self.context(context.parentCtx), context.returnState)
+            else:
+                raise Unsupported(context)
+            self.context_ids[id(context)] = len(self.contexts)
+            self.contexts.append(record)
+        return self.context_ids[id(context)]
+
+    def semantic(self, semantic):
+        if semantic is SemanticContext.NONE:
+            return None
+        elif isinstance(semantic, PrecedencePredicate):
+            return ('pp', semantic.precedence)
+        elif isinstance(semantic, Predicate):
+            return ('p', semantic.ruleIndex, semantic.predIndex, semantic.isCtxDependent)
+        raise Unsupported(semantic)
+
+    def executor(self, executor):
+        if executor is None:
+            return None
+        actions = []
+        for action in executor.lexerActions:
+            if isinstance(action, LexerIndexedCustomAction):
+                actions.append((action.offset, self.action(action.action)))
+            else:
+                actions.append((None, self.action(action)))
+        return actions
+
+    def action(self, action):
+        for i, lexer_action in enumerate(self.atn.lexerActions):
+            if lexer_action is action:
+                return i
+        raise Unsupported(action)
+
+    def config(self, config):
+        return (config.state.stateNumber, config.alt, self.context(config.context), self.semantic(config.semanticContext),
+                config.reachesIntoOuterContext, config.precedenceFilterSuppressed,
+                self.executor(getattr(config, 'lexerActionExecutor', None)), getattr(config, 'passedThroughNonGreedyDecision', None))
+
+    def configs(self, configs):
+        return (configs.fullCtx, [self.config(config) for config in configs.configs], configs.uniqueAlt, configs.conflictingAlts,
+                configs.hasSemanticContext, configs.dipsIntoOuterContext)
+
+    def dfa(self, dfa):
+        states = list(dfa.states)
+        if dfa.s0 is not None and not any(state is dfa.s0 for state in states):
+            states.append(dfa.s0)
+        state_ids = {id(state): i for i, state in enumerate(states)}
+        state_ids[id(error_state(self.atn))] = -1
+        records = []
+        for state in states:
+            edges = None if state.edges is None else [None if target is None else state_ids[id(target)] for target in state.edges]
+            predicates = None if state.predicates is None else [(self.semantic(p.pred), p.alt) for p in state.predicates]
+            records.append((state.stateNumber, self.configs(state.configs), edges, state.isAcceptState, state.prediction,
+                            state.requiresFullContext, predicates, self.executor(state.lexerActionExecutor)))
+        return (dfa.decision, dfa.precedenceDfa, None if dfa.s0 is None else state_ids[id(dfa.s0)], self.contexts, records)
+
+class SnapshotDFAState(DFAState):
+    '''DFA state whose configurations are only rebuilt once the simulator looks at them'''
+
+    def __init__(self, stateNumber, reader, record):
+        self.reader = reader
+        self.record = record
+        DFAState.__init__(self, stateNumber, None)
+
+    @property
+    def configs(self):
+        if self.record is not None:
+            self._configs = self.reader.configs(self.record)
+            self.record = None
+        return self._configs
+
+    @configs.setter
+    def configs(self, configs):
+        self._configs = configs
+
+def config_key(configs):
+    return tuple((config.state.stateNumber, config.alt) for config in configs)
+
+class SnapshotStates(dict):
+    '''States of a restored DFA.
+
+    Hashing a state hashes all of its configurations, so restored states are
+    kept aside under the ATN states and alternatives of their configurations
+    and only hashed into the dict once a state with the same ones is looked up.'''
+
+    def __init__(self, states):
+        dict.__init__(self)
+        self.pending = {}
+        for state in states:
+            self.pending.setdefault(tuple(config[:2] for config in state.record[1]), []).append(state)
+        self.num_pending = len(states)
+
+    def fill(self, key=None):
+        keys = list(self.pending) if key is None else [key]
+        for key in keys:
+            for state in self.pending.pop(key, []):
+                dict.__setitem__(self, state, state)
+                self.num_pending -= 1
+
+    def get(self, key, default=None):
+        if self.pending:
+            self.fill(config_key(key.configs))
+        return dict.get(self, key, default)
+
+    def __getitem__(self, key):
+        if self.pending:
+            self.fill(config_key(key.configs))
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        if self.pending:
+            self.fill(config_key(key.configs))
+        return dict.__contains__(self, key)
+
+    def __len__(self):
+        return dict.__len__(self) + self.num_pending
+
+    def __iter__(self):
+        self.fill()
+        return dict.__iter__(self)
+
+    def keys(self):
+        self.fill()
+        return dict.keys(self)
+
+    def values(self):
+        self.fill()
+        return dict.values(self)
+
+    def items(self):
+        self.fill()
+        return dict.items(self)
+
+class DFAReader(object):
+    '''rebuild the states of a DFA against a live ATN so every hash is computed in this process'''
+
+    def __init__(self, atn, contexts):
+        self.atn = atn
+        self.context_records = contexts
+        self.contexts = None
+
+    def context(self, index):
+        if self.contexts is None:
+            self.contexts = []
+            for record in self.context_records:
+                if record[0] == 'e':
+                    context = PredictionContext.EMPTY
+                elif record[0] == 'a':
+                    context = ArrayPredictionContext([None if parent is None else self.contexts[parent] for parent in record[1]], record[2])
+                else:
+                    context = SingletonPredictionContext.create(None if record[1] is None else self.contexts[record[1]], record[2])
+                self.contexts.append(context)
+        return None if index is None else self.contexts[index]
+
+    def semantic(self, record):
+        if record is None:
+            return SemanticContext.NONE
+        elif record[0] == 'pp':
+            return PrecedencePredicate(record[1])
+        return Predicate(*record[1:])
+
+    def executor(self, record):
+        if record is None:
+            return None
+        actions = []
+        for offset, index in record:
+            action = self.atn.lexerActions[index]
+            actions.append(action if offset is None else LexerIndexedCustomAction(offset, action))
+        return LexerActionExecutor(actions)
+
+    def config(self, record):
+        state_number, alt, context, semantic, reaches, suppressed, executor, non_greedy = record
+        state = self.atn.states[state_number]
+        if self.atn.grammarType == ATNType.LEXER:
+            config = LexerATNConfig(state, alt, self.context(context), self.semantic(semantic), self.executor(executor))
+            config.passedThroughNonGreedyDecision = non_greedy
+        else:
+            config = ATNConfig(state, alt, self.context(context), self.semantic(semantic))
+        config.reachesIntoOuterContext = reaches
+        config.precedenceFilterSuppressed = suppressed
+        return config
+
+    def configs(self, record):
+        full_ctx, configs, unique_alt, conflicting_alts, has_semantic_context, dips_into_outer_context = record
+        config_set = ATNConfigSet(full_ctx)
+        config_set.configs = [self.config(config) for config in configs]
+        config_set.uniqueAlt = unique_alt
+        config_set.conflictingAlts = conflicting_alts
+        config_set.hasSemanticContext = has_semantic_context
+        config_set.dipsIntoOuterContext = dips_into_outer_context
+        config_set.setReadonly(True)
+        return config_set
+
+    def restore(self, dfa, record):
+        decision, precedence_dfa, s0, contexts, records = record
+        states = []
+        for state_number, configs, edges, accept, prediction, full_context, predicates, executor in records:
+            state = SnapshotDFAState(state_number, self, configs)
+            state.isAcceptState = accept
+            state.prediction = prediction
+            state.requiresFullContext = full_context
+            if predicates is not None:
+                state.predicates = [PredPrediction(self.semantic(pred), alt) for pred, alt in predicates]
+            state.lexerActionExecutor = self.executor(executor)
+            states.append(state)
+        for state, (state_number, configs, edges, accept, prediction, full_context, predicates, executor) in zip(states, records):
+            if edges is not None:
+                state.edges = [None if target is None else error_state(self.atn) if target == -1 else states[target] for target in edges]
+        dfa.precedenceDfa = precedence_dfa
+        dfa.s0 = None if s0 is None else states[s0]
+        dfa._states = SnapshotStates([state for state in states if not (precedence_dfa and state is dfa.s0)])
+
+def unused(dfa):
+    return dfa.s0 is None or (dfa.precedenceDfa and not dfa.s0.edges)
+
+class SnapshotDFAs(list):
+    '''Stands in for the decisionsToDFA list of a recognizer.
+
+    Each decision is rebuilt from its snapshot record the first time a
+    simulator asks for it, so only the decisions a run actually reaches pay
+    for restoring their states.'''
+
+    def __init__(self, dfas, atn, records):
+        list.__init__(self, dfas)
+        self.atn = atn
+        self.records = records
+
+    def __getitem__(self, index):
+        dfa = list.__getitem__(self, index)
+        if index in self.records:
+            record = pickle.loads(self.records.pop(index))
+            if unused(dfa):
+                DFAReader(self.atn, record[3]).restore(dfa, record)
+        return dfa
+
+    def restore_all(self):
+        for index in list(self.records):
+            self[index]
+
+def dump(recognizers):
+    snapshot = {}
+    for recognizer in recognizers:
+        dfas = recognizer.decisionsToDFA
+        if isinstance(dfas, SnapshotDFAs):
+            dfas.restore_all()
+        records = {}
+        for dfa in dfas:
+            if unused(dfa):
+                continue
+            try:
+                records[dfa.decision] = pickle.dumps(DFAWriter(recognizer.atn).dfa(dfa), 2)
+            except Unsupported as err:
+                logging.getLogger(__name__).debug('not saving decision {} of {}: {}'.format(dfa.decision, recognizer.__name__, err))
+        snapshot[recognizer.__name__] = records
+    return snapshot
+
+def save(recognizers, filename=SNAPSHOT):
+    '''write the prediction DFAs warmed up in this process to a snapshot'''
+    atomic_write(os.path.abspath(filename), pickle.dumps((grammar_digest(recognizers), dump(recognizers)), 2))
+    os.chmod(filename, 0o644)
+
+def load(recognizers, filename=SNAPSHOT):
+    '''have the recognizers take their prediction DFAs from a snapshot made from the same grammar'''
+    try:
+        with open(filename, 'rb') as fid:
+            digest, snapshot = pickle.load(fid)
+    except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return False
+    if digest != grammar_digest(recognizers):
+        logging.getLogger(__name__).debug('ignoring {}, the grammar changed since it was saved'.format(filename))
+        return False
+    for recognizer in recognizers:
+        dfas = recognizer.decisionsToDFA
+        if isinstance(dfas, SnapshotDFAs):
+            dfas.restore_all()
+        recognizer.decisionsToDFA = SnapshotDFAs(dfas, recognizer.atn, snapshot.get(recognizer.__name__, {}))
+    return True
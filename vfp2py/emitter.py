@@ -0,0 +1,237 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import __future__
+import os
+import re
+import sys
+import sysconfig
+
+FUTURE_FLAGS = sum(getattr(__future__, feature).compiler_flag for feature in ('absolute_import', 'division', 'print_function', 'unicode_literals'))
+NOQA = re.compile(r'# no(?:qa|pep8)\b', re.I)
+DOCSTRING = re.compile(r'u?r?["\']')
+STDLIB_DIR = os.path.normcase(sysconfig.get_paths()['stdlib'])
+FUTURE, STDLIB, THIRDPARTY, FIRSTPARTY = range(4)
+MODULE_SECTIONS = {}
+
+def natural_key(text):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', text)]
+
+def module_key(name):
+    return natural_key(name.lower())
+
+def name_key(name):
+    if name.isupper() and len(name) > 1:
+        prefix = 'A'
+    elif name[:1].isupper():
+        prefix = 'B'
+    else:
+        prefix = 'C'
+    return natural_key(prefix + name.lower())
+
+def find_module(name):
+    if sys.version_info < (3,):
+        import imp
+        try:
+            return imp.find_module(name)[1]
+        except ImportError:
+            return None
+    import importlib.util
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    return spec and spec.origin
+
+def module_section(name):
+    '''place a module in the future, standard library, third party or first party section'''
+    name = name.split('.')[0]
+    if name not in MODULE_SECTIONS:
+        origin = find_module(name) or ''
+        path = os.path.normcase(origin)
+        if name == '__future__':
+            MODULE_SECTIONS[name] = FUTURE
+        elif name in sys.builtin_module_names or name in getattr(sys, 'stdlib_module_names', ()) or origin in ('built-in', 'frozen'):
+            MODULE_SECTIONS[name] = STDLIB
+        elif 'site-packages' in path or 'dist-packages' in path:
+            MODULE_SECTIONS[name] = THIRDPARTY
+        elif path.startswith(STDLIB_DIR):
+            MODULE_SECTIONS[name] = STDLIB
+        else:
+            MODULE_SECTIONS[name] = FIRSTPARTY
+    return MODULE_SECTIONS[name]
+
+def sort_imports(imports):
+    '''sort and merge import lines into sections the way isort lays them out'''
+    sections = [({}, {}) for i in range(FIRSTPARTY + 1)]
+    for line in set(imports):
+        words = line.split()
+        if words[0] == 'from':
+            module, names = words[1], ' '.join(words[3:]).split(',')
+        else:
+            module, names = words[1], None
+        straight, froms = sections[module_section(module)]
+        if names is None:
+            straight.setdefault(module, set()).add(line)
+        else:
+            froms.setdefault(module, set()).update(name.strip() for name in names)
+    lines = []
+    for straight, froms in sections:
+        if not straight and not froms:
+            continue
+        if lines:
+            lines.append('')
+        for module in sorted(straight, key=module_key):
+            lines += sorted(straight[module])
+        for module in sorted(froms, key=module_key):
+            lines.append('from {} import {}'.format(module, ', '.join(sorted(froms[module], key=name_key))))
+    return lines
+
+def indent_level(line):
+    return len(line) - len(line.lstrip())
+
+def commented_code(comment):
+    comment = comment.lstrip('#').strip()
+    if ' ' not in comment or '#' in comment:
+        return False
+    try:
+        return bool(compile(comment, '<string>', 'exec', FUTURE_FLAGS, True))
+    except (SyntaxError, TypeError, ValueError, UnicodeDecodeError):
+        return False
+
+def format_comment(line):
+    '''normalize the start of a block comment to "# "'''
+    indent, comment = line[:indent_level(line)], line.lstrip()
+    if len(comment) < 2 or NOQA.search(comment) or commented_code(comment):
+        return line
+    hashes = len(comment) - len(comment.lstrip('#'))
+    if (hashes > 1 or comment[1].isalnum()) and not comment.endswith('#'):
+        comment = '# ' + comment.lstrip('# \t')
+    return indent + comment
+
+def scan_code(line, brackets):
+    '''strip u prefixes from the strings in a line of code while tracking the indent expected after open brackets'''
+    retval = []
+    start = i = 0
+    while i < len(line):
+        c = line[i]
+        if c == '#':
+            break
+        elif c in '([{':
+            column = i + 1
+            while column < len(line) and line[column] == ' ':
+                column += 1
+            brackets.append(column if column < len(line) and line[column] != '#' else indent_level(line) + 4)
+        elif c in ')]}':
+            if brackets:
+                brackets.pop()
+        elif c in '\'"':
+            prefix_start = i
+            while prefix_start > 0 and line[prefix_start-1] in 'uUrRbB':
+                prefix_start -= 1
+            if prefix_start > 0 and (line[prefix_start-1].isalnum() or line[prefix_start-1] == '_'):
+                prefix_start = i
+            if line[prefix_start:i].startswith('u'):
+                retval.append(line[start:prefix_start])
+                start = prefix_start + 1
+            quote = line[i:i+3] if line[i:i+3] in ('"""', "'''") else c
+            i += len(quote)
+            while i < len(line) and not line.startswith(quote, i):
+                i += 2 if line[i] == '\\' else 1
+            i += len(quote)
+            continue
+        i += 1
+    retval.append(line[start:])
+    return ''.join(retval)
+
+def physical_lines(struct, num_indents):
+    for item in struct:
+        if isinstance(item, list):
+            if item:
+                for line in physical_lines(item, num_indents+1):
+                    yield line
+            else:
+                yield ''
+        elif item:
+            lines = repr(item).split('\n')
+            yield ' '*4*num_indents + lines[0]
+            for line in lines[1:]:
+                yield line
+        else:
+            yield ''
+
+def logical_lines(struct):
+    '''group the visitor output into blank, comment and code lines'''
+    lines = physical_lines(struct, 0)
+    for line in lines:
+        line = line.rstrip()
+        if not line:
+            yield None, []
+        elif line.lstrip().startswith('#'):
+            yield format_comment(line), []
+        else:
+            brackets = []
+            code = scan_code(line, brackets)
+            continuation = []
+            for line in lines if brackets else ():
+                line = ' ' * brackets[-1] + line.strip()
+                continuation.append(scan_code(line.rstrip(), brackets))
+                if not brackets:
+                    break
+            yield code, continuation
+
+class Emitter(object):
+    '''pep8 blank line state carried from one piece of visitor output to the next'''
+
+    def __init__(self, previous_logical=''):
+        self.line_number = 0
+        self.previous_logical = previous_logical
+        self.previous_indent = 0
+        self.blank_lines = self.blank_before = 0
+
+    def lines(self, struct):
+        for line, continuation in logical_lines(struct):
+            if line is None:
+                self.blank_lines += 1
+                continue
+            blank_lines = self.blank_lines
+            previous_logical = self.previous_logical
+            indent = indent_level(line)
+            logical = line.lstrip() if not line.lstrip().startswith('#') else ''
+            if self.line_number + blank_lines + 1 >= 3 or previous_logical:
+                if previous_logical.startswith('@'):
+                    blank_lines = 0
+                elif blank_lines > 2 or (indent and blank_lines == 2):
+                    blank_lines = 1 if indent else 2
+                blank_before = max(self.blank_before, blank_lines)
+                if logical.startswith(('def ', 'class ', '@')) and not previous_logical.startswith('@'):
+                    if indent:
+                        if not (blank_before or self.previous_indent < indent or DOCSTRING.match(previous_logical)):
+                            blank_lines = blank_before = 1
+                    elif blank_before < 2:
+                        blank_lines = blank_before = 2
+                if previous_logical.startswith('class '):
+                    if logical.startswith(('def ', 'class ', '@')) and indent and not blank_before:
+                        blank_lines = blank_before = 1
+                elif previous_logical.startswith('def '):
+                    if DOCSTRING.match(logical):
+                        blank_lines = 0
+                elif DOCSTRING.match(previous_logical):
+                    if indent and not blank_before and logical.startswith('def ') and '(self' in logical:
+                        blank_lines = blank_before = 1
+            else:
+                blank_before = max(self.blank_before, blank_lines)
+            for output_line in [''] * blank_lines + [line] + continuation:
+                yield output_line
+            self.line_number += blank_lines + 1 + len(continuation)
+            self.blank_lines = 0
+            self.blank_before = blank_before
+            if logical:
+                self.previous_logical = logical
+                self.previous_indent = indent
+                self.blank_before = 0
+
+def emit(struct):
+    '''build pep8 formatted python source from the nested lists returned by the visitor'''
+    output = list(Emitter().lines(struct))
+    return '\n'.join(output) + '\n' if output else ''
@@ -0,0 +1,322 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+from antlr4.Token import Token
+
+from .VisualFoxpro9Parser import VisualFoxpro9Parser as P
+
+START_RULES = ('expr', 'constant')
+
+def first_tokens(rule_index):
+    return frozenset(P.atn.nextTokens(P.atn.ruleToStartState[rule_index]))
+
+IDENTIFIERS = first_tokens(P.RULE_identifier)
+PATH_ELEMENTS = first_tokens(P.RULE_pathElement)
+
+BINARY_OPERATORS = {
+    P.CARAT: (10, P.PowerContext),
+    P.ASTERISK: (9, P.MultiplicationContext),
+    P.FORWARDSLASH: (9, P.MultiplicationContext),
+    P.MODULO: (8, P.ModuloContext),
+    P.PLUS_SIGN: (7, P.AdditionContext),
+    P.MINUS_SIGN: (7, P.AdditionContext),
+    P.DOUBLEEQUALS: (6, P.ComparisonContext),
+    P.NOTEQUALS: (6, P.ComparisonContext),
+    P.EQUALS: (6, P.ComparisonContext),
+    P.HASH: (6, P.ComparisonContext),
+    P.GREATERTHAN: (6, P.ComparisonContext),
+    P.GTEQ: (6, P.ComparisonContext),
+    P.LESSTHAN: (6, P.ComparisonContext),
+    P.LTEQ: (6, P.ComparisonContext),
+    P.DOLLAR: (6, P.ComparisonContext),
+    P.OTHERAND: (5, P.BooleanAndContext),
+    P.AND: (5, P.BooleanAndContext),
+    P.OTHEROR: (4, P.BooleanOrContext),
+    P.OR: (4, P.BooleanOrContext),
+}
+OPERAND_PRECEDENCE = {P.PLUS_SIGN: 12, P.MINUS_SIGN: 12, P.EXCLAMATION: 11, P.NOT: 11}
+QUOTES = {P.SINGLEQUOTE: P.SINGLEQUOTE, P.DOUBLEQUOTE: P.DOUBLEQUOTE, P.LEFTBRACKET: P.RIGHTBRACKET}
+CLOSERS = {P.LEFTPAREN: P.RIGHTPAREN, P.LEFTBRACKET: P.RIGHTBRACKET}
+
+class Unsupported(Exception):
+    pass
+
+class ExprParser(object):
+    '''Precedence climbing parser for the expr, constant and pathname rules of the grammar.
+
+    It builds the same contexts the generated parser builds, choosing each
+    alternative from the next few tokens instead of predicting it from the
+    ATN. Where alternatives overlap, like NOT(x) as a negation or a call, it
+    takes the first one listed in the grammar, which the generated parser
+    also settles on whenever that alternative parses the whole input. Input
+    it cannot parse, including casts, raises Unsupported so the caller can
+    leave it to the generated parser.'''
+
+    def __init__(self, parser, tokens):
+        self.parser = parser
+        self.tokens = tokens
+        self.index = 0
+
+    def la(self, i=1):
+        index = self.index + i - 1
+        return self.tokens[index].type if index < len(self.tokens) else Token.EOF
+
+    def consume(self, ctx, types=None):
+        if self.index >= len(self.tokens) or (types is not None and self.tokens[self.index].type not in types):
+            raise Unsupported()
+        token = self.tokens[self.index]
+        ctx.addTokenNode(token)
+        self.index += 1
+        return token
+
+    def rule(self, cls, parent):
+        ctx = cls(self.parser, parent)
+        ctx.start = self.tokens[self.index] if self.index < len(self.tokens) else None
+        if parent is not None:
+            parent.addChild(ctx)
+        return ctx
+
+    def alternative(self, cls, base, parent):
+        ctx = cls(self.parser, base(self.parser, parent))
+        ctx.start = self.tokens[self.index] if self.index < len(self.tokens) else None
+        return ctx
+
+    def finish(self, ctx):
+        ctx.stop = self.tokens[self.index - 1]
+        return ctx
+
+    def identifier(self, parent):
+        ctx = self.rule(P.IdentifierContext, parent)
+        self.consume(ctx, IDENTIFIERS)
+        return self.finish(ctx)
+
+    def binary_operator(self):
+        if self.la() == P.ASTERISK and self.la(2) == P.ASTERISK:
+            return 10, P.PowerContext
+        return BINARY_OPERATORS.get(self.la())
+
+    def expr(self, parent, precedence=0):
+        left = self.primary(parent)
+        operator = self.binary_operator()
+        while operator and operator[0] >= precedence:
+            operator_precedence, cls = operator
+            ctx = cls(self.parser, P.ExprContext(self.parser, parent))
+            ctx.start = left.start
+            left.parentCtx = ctx
+            ctx.addChild(left)
+            if cls is P.PowerContext:
+                if self.consume(ctx).type == P.ASTERISK:
+                    self.consume(ctx)
+            elif cls in (P.BooleanAndContext, P.BooleanOrContext):
+                op = self.rule(P.AndOpContext if cls is P.BooleanAndContext else P.OrOpContext, ctx)
+                self.consume(op)
+                self.finish(op)
+            elif cls is P.ModuloContext:
+                self.consume(ctx)
+            else:
+                ctx.op = self.consume(ctx)
+            self.expr(ctx, operator_precedence + 1)
+            left = self.finish(ctx)
+            operator = self.binary_operator()
+        if parent is not None:
+            parent.addChild(left)
+        return left
+
+    def primary(self, parent):
+        la = self.la()
+        if la == P.LEFTPAREN:
+            ctx = self.alternative(P.SubExprContext, P.ExprContext, parent)
+            self.consume(ctx)
+            self.expr(ctx)
+            self.consume(ctx, (P.RIGHTPAREN,))
+        elif la in (P.PLUS_SIGN, P.MINUS_SIGN):
+            ctx = self.alternative(P.UnaryNegationContext, P.ExprContext, parent)
+            ctx.op = self.consume(ctx)
+            self.expr(ctx, OPERAND_PRECEDENCE[la])
+        elif la == P.EXCLAMATION or la == P.NOT:
+            ctx = self.alternative(P.BooleanNegationContext, P.ExprContext, parent)
+            self.consume(ctx)
+            self.expr(ctx, OPERAND_PRECEDENCE[la])
+        elif self.constant_follows():
+            ctx = self.alternative(P.ConstantExprContext, P.ExprContext, parent)
+            self.constant(ctx)
+        elif la == P.CAST and self.la(2) == P.LEFTPAREN:
+            raise Unsupported()
+        elif la in IDENTIFIERS or la in (P.PERIOD, P.COMMERCIALAT):
+            ctx = self.alternative(P.AtomExprContext, P.ExprContext, parent)
+            if la == P.PERIOD:
+                self.consume(ctx)
+            self.atom(ctx)
+            if self.trailer_follows():
+                self.trailer(ctx)
+        else:
+            raise Unsupported()
+        return self.finish(ctx)
+
+    def constant_follows(self):
+        la = self.la()
+        if la == P.DOLLAR:
+            return self.la(2) == P.NUMBER_LITERAL
+        return la in (P.NUMBER_LITERAL, P.BLOB_LITERAL, P.NULL, P.LEFTBRACE) or la in QUOTES or self.boolean_follows()
+
+    def boolean_follows(self, i=1):
+        return self.la(i) == P.PERIOD and self.la(i + 1) in (P.BOOLEANCHAR, P.NULL) and self.la(i + 2) == P.PERIOD
+
+    def trailer_follows(self, i=1):
+        return self.la(i) in CLOSERS or (self.la(i) == P.PERIOD and self.la(i + 1) in IDENTIFIERS)
+
+    def atom(self, parent):
+        ctx = self.rule(P.AtomContext, parent)
+        if self.la() == P.COMMERCIALAT:
+            reference = self.rule(P.ReferenceContext, ctx)
+            self.consume(reference)
+            self.id_attr(reference)
+            self.finish(reference)
+        else:
+            self.identifier(ctx)
+        return self.finish(ctx)
+
+    def id_attr(self, parent):
+        ctx = self.rule(P.IdAttrContext, parent)
+        if self.la() == P.PERIOD:
+            self.consume(ctx)
+        self.identifier(ctx)
+        if self.trailer_follows():
+            self.trailer(ctx)
+        return self.finish(ctx)
+
+    def trailer(self, parent):
+        la = self.la()
+        if la in CLOSERS:
+            ctx = self.alternative(P.FuncCallTrailerContext, P.TrailerContext, parent)
+            parent.addChild(ctx)
+            self.consume(ctx)
+            if self.la() != CLOSERS[la]:
+                self.args(ctx)
+            self.consume(ctx, (CLOSERS[la],))
+        else:
+            ctx = self.alternative(P.IdentTrailerContext, P.TrailerContext, parent)
+            parent.addChild(ctx)
+            self.consume(ctx)
+            self.identifier(ctx)
+        if self.trailer_follows():
+            self.trailer(ctx)
+        return self.finish(ctx)
+
+    def args(self, parent):
+        ctx = self.rule(P.ArgsContext, parent)
+        if self.la() != P.COMMA:
+            self.expr(ctx)
+        while self.la() == P.COMMA:
+            item = self.rule(P.ArgsItemContext, ctx)
+            self.consume(item)
+            if self.la() not in (P.COMMA, P.RIGHTPAREN, P.RIGHTBRACKET, Token.EOF):
+                self.expr(item)
+            self.finish(item)
+        return self.finish(ctx)
+
+    def constant(self, parent):
+        la = self.la()
+        if la in (P.DOLLAR, P.NUMBER_LITERAL):
+            ctx = self.alternative(P.NumberOrCurrencyContext, P.ConstantContext, parent)
+            if la == P.DOLLAR:
+                self.consume(ctx)
+            self.consume(ctx, (P.NUMBER_LITERAL,))
+        elif la in (P.PERIOD, P.NULL):
+            ctx = self.alternative(P.BoolOrNullContext, P.ConstantContext, parent)
+            if la == P.PERIOD:
+                self.consume(ctx)
+                self.consume(ctx, (P.BOOLEANCHAR, P.NULL))
+                self.consume(ctx, (P.PERIOD,))
+            else:
+                self.consume(ctx)
+        elif la == P.LEFTBRACE:
+            ctx = self.alternative(P.DateContext, P.ConstantContext, parent)
+            self.date(ctx)
+        elif la in QUOTES:
+            ctx = self.alternative(P.StringContext, P.ConstantContext, parent)
+            self.consume(ctx)
+            while self.la() not in (QUOTES[la], P.NL, Token.EOF):
+                self.consume(ctx)
+            self.consume(ctx, (QUOTES[la],))
+        elif la == P.BLOB_LITERAL:
+            ctx = self.alternative(P.BlobContext, P.ConstantContext, parent)
+            self.consume(ctx)
+        else:
+            raise Unsupported()
+        if parent is not None:
+            parent.addChild(ctx)
+        return self.finish(ctx)
+
+    def date(self, ctx):
+        number = (P.NUMBER_LITERAL,)
+        self.consume(ctx, (P.LEFTBRACE,))
+        la = self.la()
+        if la == P.FORWARDSLASH:
+            self.consume(ctx)
+            self.consume(ctx, (P.FORWARDSLASH,))
+        elif la == P.COLON:
+            self.consume(ctx)
+        elif la == P.CARAT:
+            self.consume(ctx)
+            self.consume(ctx, number)
+            separator = (self.la(),)
+            self.consume(ctx, (P.MINUS_SIGN, P.FORWARDSLASH))
+            self.consume(ctx, number)
+            self.consume(ctx, separator)
+            self.consume(ctx, number)
+            if self.la() in (P.COMMA, P.NUMBER_LITERAL):
+                if self.la() == P.COMMA:
+                    self.consume(ctx)
+                self.consume(ctx, number)
+                for i in range(2):
+                    if self.la() != P.COLON:
+                        break
+                    self.consume(ctx)
+                    self.consume(ctx, number)
+                self.identifier(ctx)
+        self.consume(ctx, (P.RIGHTBRACE,))
+
+    def pathname(self, stop):
+        ctx = self.rule(P.PathnameContext, None)
+        if self.la() in IDENTIFIERS and self.la(2) == P.COLON:
+            self.identifier(ctx)
+            self.consume(ctx)
+        while self.index < len(self.tokens) and self.tokens[self.index].tokenIndex <= stop and self.la() in PATH_ELEMENTS:
+            element = self.rule(P.PathElementContext, ctx)
+            if self.la() in IDENTIFIERS:
+                self.identifier(element)
+            else:
+                self.consume(element)
+            self.finish(element)
+        if not ctx.children or not isinstance(ctx.children[-1], P.PathElementContext):
+            raise Unsupported()
+        return self.finish(ctx)
+
+def parse(parser, rule):
+    '''the tree of the expr or constant making up the whole token stream of parser, or None when the generated parser has to parse it'''
+    stream = parser.getTokenStream()
+    stream.fill()
+    expr_parser = ExprParser(parser, [token for token in stream.tokens if token.channel == stream.channel])
+    try:
+        tree = expr_parser.expr(None) if rule == 'expr' else expr_parser.constant(None)
+    except Unsupported:
+        return None
+    if expr_parser.la() != Token.EOF:
+        return None
+    stream.seek(len(stream.tokens) - 1)
+    return tree
+
+def pathname(parser, start, stop):
+    '''Build the pathname context the generated parser reads from token start, ending at token stop.
+
+    The generated parser reads path elements past stop for the caller to trim,
+    so only the first token after stop is looked at, in case it is the colon
+    of a drive. Returns None when the generated parser would find an error.'''
+    stream = parser.getTokenStream()
+    tokens = [token for token in stream.tokens[start:stop+1] if token.channel == stream.channel]
+    following = next((token for token in stream.tokens[stop+1:] if token.channel == stream.channel), None)
+    try:
+        return ExprParser(parser, tokens + [following] if following else tokens).pathname(stop)
+    except Unsupported:
+        return None
@@ -0,0 +1,185 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import copy
+
+from . import timings
+from . import vfp2py
+from .emitter import Emitter, emit
+
+PREPEND = 'procedure _program_main\n'
+
+def source_lines(text, start=0):
+    '''the lines of text from an offset on, each with its newline'''
+    while start < len(text):
+        stop = text.find('\n', start) + 1 or len(text)
+        yield text[start:stop]
+        start = stop
+
+def memory_signature(memory):
+    return {name: [(token.type, token.text) for token in tokens] for name, tokens in memory.items()}
+
+def emitter_state(emitter):
+    # line_number only matters before the first line of code, and the imports always come first
+    return emitter.previous_logical, emitter.previous_indent, emitter.blank_lines, emitter.blank_before
+
+class Chunk(object):
+    '''a top level procedure or class of a program and what converting it produced'''
+
+    def __init__(self, text):
+        self.text = text
+        self.memory_before = None
+        self.memory_after = {}
+        self.first_line = None
+        self.line_count = 0
+        self.tree = None
+        self.error = None
+        self.classes = []
+        self.functions = []
+        self.context = None
+        self.class_list_after = []
+        self.imports = []
+        self.defs = None
+        self.emitter_before = None
+        self.emitter_after = None
+        self.lines = []
+
+class IncrementalProgram(object):
+    '''A converted program that converts again only the parts of it an edit touches.
+
+    The program is split into top level procedures and classes as
+    convert_prg_stream splits it. An edit is preprocessed, parsed and converted
+    from the chunk it starts in up to the first chunk boundary after it that is
+    unchanged, and later chunks only when the defines they start with changed.
+    The python of the other chunks is reused, formatted again only while the
+    blank lines before it come out differently. Adding, removing or renaming
+    a procedure or class converts every chunk from its parse tree again, since
+    the names a program defines change how calls are converted. The output
+    always equals converting the whole program with prg2py.'''
+
+    def __init__(self, source='', input_filename=''):
+        self.input_filename = input_filename
+        self.source = source
+        self.visitor = vfp2py.PythonConvertVisitor(input_filename)
+        self.names = None
+        self.chunks = [Chunk(text) for text in vfp2py.prg_chunks(source_lines(PREPEND + source))]
+        self.update(0, len(self.chunks))
+
+    def offset(self, line, character):
+        '''the offset in the source of a zero based line and character, the way editors give positions'''
+        start = 0
+        for i in range(line):
+            start = self.source.find('\n', start) + 1
+            if not start:
+                return len(self.source)
+        end = self.source.find('\n', start)
+        return min(start + character, len(self.source) if end < 0 else end)
+
+    def edit(self, start, end, text):
+        '''replace the source between two offsets with text and return the converted program'''
+        source = self.source[:start] + text + self.source[end:]
+        start += len(PREPEND)
+        end += len(PREPEND)
+        delta = len(text) - (end - start)
+        boundaries = [0]
+        for chunk in self.chunks:
+            boundaries.append(boundaries[-1] + len(chunk.text))
+        first = max(i for i, boundary in enumerate(boundaries[:-1]) if boundary <= start or i == 0)
+        if first and start < boundaries[first] + len(next(source_lines(self.chunks[first].text))):
+            # an edit to the first line of a chunk may join it to the chunk before it
+            first -= 1
+        old_starts = {boundary: i for i, boundary in enumerate(boundaries[:-1]) if boundary >= end}
+        new_end = start + len(text)
+        position = boundaries[first]
+        resume = len(self.chunks)
+        chunks = []
+        for chunk_text in vfp2py.prg_chunks(source_lines(PREPEND + source, position)):
+            if position >= new_end and position - delta in old_starts:
+                resume = old_starts[position - delta]
+                break
+            chunks.append(Chunk(chunk_text))
+            position += len(chunk_text)
+        self.source = source
+        self.chunks[first:resume] = chunks
+        self.update(first, len(chunks))
+        return self.output()
+
+    def update(self, first, count):
+        '''preprocess, parse, convert and format the count chunks from first on and whatever they affect after them'''
+        previous = self.chunks[first - 1] if first else None
+        memory = previous.memory_after if previous else {}
+        first_line = previous.first_line + previous.line_count if previous else 1
+        converted = set()
+        for i, chunk in enumerate(self.chunks[first:], first):
+            signature = memory_signature(memory)
+            if i < first + count or chunk.memory_before != signature or (chunk.error and chunk.first_line != first_line):
+                chunk.memory_before = signature
+                chunk.first_line = first_line
+                self.parse(chunk, memory)
+                converted.add(i)
+            chunk.first_line = first_line
+            memory = chunk.memory_after
+            first_line += chunk.line_count
+
+        names = ([name for chunk in self.chunks for name in chunk.classes], [name for chunk in self.chunks for name in chunk.functions])
+        if names != self.names:
+            self.names = names
+            converted = set(range(len(self.chunks)))
+        class_list, self.visitor.function_list = names
+        for i, chunk in enumerate(self.chunks):
+            if i in converted or chunk.context != class_list:
+                chunk.context = list(class_list)
+                self.convert(chunk, i == 0, class_list)
+                converted.add(i)
+            class_list = chunk.class_list_after
+
+        emitter = Emitter(previous_logical='import')
+        for i, chunk in enumerate(self.chunks):
+            if i in converted or chunk.emitter_before != emitter_state(emitter):
+                chunk.emitter_before = emitter_state(emitter)
+                with timings.stage('format'):
+                    chunk.lines = list(emitter.lines(chunk.defs or []))
+                chunk.emitter_after = copy.copy(emitter)
+            emitter = copy.copy(chunk.emitter_after)
+
+    def parse(self, chunk, memory):
+        preprocessor = vfp2py.PreprocessVisitor()
+        preprocessor.memory = dict(memory)
+        chunk.tree = chunk.error = None
+        chunk.classes = []
+        chunk.functions = []
+        try:
+            with timings.stage('preprocess'):
+                tokens = vfp2py.preprocess_code(chunk.text, preprocessor).tokens
+            chunk.line_count = sum(token.text.count('\n') for token in tokens)
+            chunk.tree = vfp2py.parse_tokens(tokens, 'prg', chunk.first_line)
+            with timings.stage('convert'):
+                chunk.classes = [self.visitor.visit(classDef.classDefStart())[0] for classDef in chunk.tree.classDef()]
+                chunk.functions = [self.visitor.visit(funcDef.funcDefStart())[0] for funcDef in chunk.tree.funcDef()]
+        except Exception as err:
+            chunk.tree = None
+            chunk.error = err
+            chunk.line_count = chunk.text.count('\n')
+        chunk.memory_after = preprocessor.memory
+
+    def convert(self, chunk, main, class_list):
+        self.visitor.class_list = list(class_list)
+        self.visitor.imports = []
+        chunk.defs = None
+        if chunk.tree is not None:
+            try:
+                with timings.stage('convert'):
+                    chunk.defs = self.visitor.prg_defs(chunk.tree, main=main)
+                chunk.error = None
+            except Exception as err:
+                chunk.error = err
+        chunk.imports = self.visitor.imports
+        chunk.class_list_after = list(self.visitor.class_list)
+
+    def output(self):
+        '''the converted program, raising the error of the first chunk that could not be converted'''
+        for chunk in self.chunks:
+            if chunk.error is not None:
+                raise chunk.error
+        self.visitor.imports = [name for chunk in self.chunks for name in chunk.imports]
+        return emit(self.visitor.prg_imports()) + ''.join(line + '\n' for chunk in self.chunks for line in chunk.lines)
@@ -0,0 +1,157 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import json
+import timeit
+from collections import OrderedDict
+
+from antlr4.atn.ParserATNSimulator import ParserATNSimulator
+
+FIELDS = ('predictions', 'lookahead', 'max_lookahead', 'seconds', 'sll_conflicts', 'full_context', 'context_sensitivities', 'ambiguities')
+PREDICTIONS, LOOKAHEAD, MAX_LOOKAHEAD, SECONDS, SLL_CONFLICTS, FULL_CONTEXT, CONTEXT_SENSITIVITIES, AMBIGUITIES = range(len(FIELDS))
+
+ENABLED = False
+DECISIONS = {}
+SLL_FAILURES = {}
+
+def decision_counts(decision):
+    counts = DECISIONS.get(decision)
+    if counts is None:
+        counts = DECISIONS[decision] = [0] * len(FIELDS)
+    return counts
+
+class ProfilingATNSimulator(ParserATNSimulator):
+    '''Parser simulator that records how each decision of the grammar is predicted.
+
+    For every decision it counts the predictions, how many tokens they looked
+    ahead, the time spent predicting, the SLL conflicts that needed the whole
+    context to resolve and the full context predictions, context
+    sensitivities and ambiguities reported by the LL simulation.'''
+
+    def adaptivePredict(self, input, decision, outerContext):
+        start_index = self.stop_index = input.index
+        start = timeit.default_timer()
+        try:
+            return ParserATNSimulator.adaptivePredict(self, input, decision, outerContext)
+        finally:
+            counts = decision_counts(decision)
+            counts[SECONDS] += timeit.default_timer() - start
+            lookahead = self.stop_index - start_index + 1
+            counts[PREDICTIONS] += 1
+            counts[LOOKAHEAD] += lookahead
+            counts[MAX_LOOKAHEAD] = max(counts[MAX_LOOKAHEAD], lookahead)
+
+    def lookahead(self, state):
+        self.stop_index = max(self.stop_index, self._input.index)
+        if state is not None and state is not self.ERROR and state.requiresFullContext:
+            decision_counts(self._dfa.decision)[SLL_CONFLICTS] += 1
+        return state
+
+    def getExistingTargetState(self, previousD, t):
+        return self.lookahead(ParserATNSimulator.getExistingTargetState(self, previousD, t))
+
+    def computeTargetState(self, dfa, previousD, t):
+        return self.lookahead(ParserATNSimulator.computeTargetState(self, dfa, previousD, t))
+
+    def computeReachSet(self, closure, t, fullCtx):
+        if fullCtx:
+            self.stop_index = max(self.stop_index, self._input.index)
+        return ParserATNSimulator.computeReachSet(self, closure, t, fullCtx)
+
+    def reportAttemptingFullContext(self, dfa, conflictingAlts, configs, startIndex, stopIndex):
+        decision_counts(dfa.decision)[FULL_CONTEXT] += 1
+        ParserATNSimulator.reportAttemptingFullContext(self, dfa, conflictingAlts, configs, startIndex, stopIndex)
+
+    def reportContextSensitivity(self, dfa, prediction, configs, startIndex, stopIndex):
+        decision_counts(dfa.decision)[CONTEXT_SENSITIVITIES] += 1
+        ParserATNSimulator.reportContextSensitivity(self, dfa, prediction, configs, startIndex, stopIndex)
+
+    def reportAmbiguity(self, dfa, D, startIndex, stopIndex, exact, ambigAlts, configs):
+        decision_counts(dfa.decision)[AMBIGUITIES] += 1
+        ParserATNSimulator.reportAmbiguity(self, dfa, D, startIndex, stopIndex, exact, ambigAlts, configs)
+
+def instrument(parser):
+    '''have a parser record its decisions, sharing the DFA of its class'''
+    if not isinstance(parser._interp, ProfilingATNSimulator):
+        interp = ProfilingATNSimulator(parser, parser.atn, parser.decisionsToDFA, parser.sharedContextCache)
+        interp.predictionMode = parser._interp.predictionMode
+        parser._interp = interp
+    return parser
+
+def sll_failure(parser, err):
+    '''count the rule a parse without full context failed in before falling back to LL'''
+    cause = err.args[0] if err.args else None
+    ctx = getattr(cause, 'ctx', None) or parser._ctx
+    rule = parser.ruleNames[ctx.getRuleIndex()] if ctx is not None else None
+    SLL_FAILURES[rule] = SLL_FAILURES.get(rule, 0) + 1
+
+def take():
+    '''the decisions recorded since the last take, keyed so the profile can be stored as json'''
+    profile = {
+        'decisions': {str(decision): counts for decision, counts in DECISIONS.items()},
+        'sll_failures': dict(SLL_FAILURES),
+    }
+    DECISIONS.clear()
+    SLL_FAILURES.clear()
+    return profile
+
+def merge(profiles):
+    decisions = {}
+    sll_failures = {}
+    for profile in profiles:
+        for decision, counts in profile['decisions'].items():
+            total = decisions.setdefault(decision, [0] * len(FIELDS))
+            for i, count in enumerate(counts):
+                total[i] = max(total[i], count) if i == MAX_LOOKAHEAD else total[i] + count
+        for rule, count in profile['sll_failures'].items():
+            sll_failures[rule] = sll_failures.get(rule, 0) + count
+    return {'decisions': decisions, 'sll_failures': sll_failures}
+
+def add_counts(stats, counts):
+    for i, name in enumerate(FIELDS):
+        stats[name] = max(stats[name], counts[i]) if i == MAX_LOOKAHEAD else stats[name] + counts[i]
+
+def report(profile, parser_class):
+    '''the decisions of a profile by rule and by decision, the ones that took longest first'''
+    decisions = []
+    rules = OrderedDict()
+    for decision, counts in profile['decisions'].items():
+        state = parser_class.atn.decisionToState[int(decision)]
+        rule = parser_class.ruleNames[state.ruleIndex]
+        stats = OrderedDict([('decision', int(decision)), ('rule', rule), ('state', state.stateNumber)])
+        stats.update(zip(FIELDS, counts))
+        stats['mean_lookahead'] = stats['lookahead'] / stats['predictions'] if stats['predictions'] else 0
+        decisions.append(stats)
+        if rule not in rules:
+            rules[rule] = OrderedDict([('rule', rule)] + [(name, 0) for name in FIELDS] + [('sll_failures', 0)])
+        add_counts(rules[rule], counts)
+    for rule, count in profile['sll_failures'].items():
+        if rule not in rules:
+            rules[rule] = OrderedDict([('rule', rule)] + [(name, 0) for name in FIELDS] + [('sll_failures', 0)])
+        rules[rule]['sll_failures'] += count
+    for stats in rules.values():
+        stats['mean_lookahead'] = stats['lookahead'] / stats['predictions'] if stats['predictions'] else 0
+    by_time = lambda stats: (-stats['seconds'], -stats['predictions'], stats['rule'])
+    return OrderedDict([
+        ('totals', OrderedDict([
+            ('predictions', sum(stats['predictions'] for stats in decisions)),
+            ('seconds', sum(stats['seconds'] for stats in decisions)),
+            ('full_context', sum(stats['full_context'] for stats in decisions)),
+            ('sll_failures', sum(profile['sll_failures'].values())),
+        ])),
+        ('rules', sorted(rules.values(), key=by_time)),
+        ('decisions', sorted(decisions, key=by_time)),
+    ])
+
+def write_report(filename, profile, parser_class):
+    with open(filename, 'w') as fid:
+        json.dump(report(profile, parser_class), fid, indent=2)
+
+def print_summary(profile, parser_class, num=10, fid=None):
+    print('slowest parser decisions:', file=fid)
+    for stats in report(profile, parser_class)['decisions'][:num]:
+        notes = ['{} predictions'.format(stats['predictions']), 'lookahead {:.1f} max {}'.format(stats['mean_lookahead'], stats['max_lookahead'])]
+        for name in ('sll_conflicts', 'full_context', 'ambiguities'):
+            if stats[name]:
+                notes.append('{} {}'.format(stats[name], name.replace('_', ' ')))
+        print('    {:8.2f}s  {} decision {}  ({})'.format(stats['seconds'], stats['rule'], stats['decision'], '; '.join(notes)), file=fid)
@@ -0,0 +1,115 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import ntpath
+import os
+import time
+from stat import S_ISDIR
+
+MTIME_RESOLUTION = 2.0
+# seconds before a path found not to be a directory is checked again
+FILE_RECHECK = 60.0
+
+DIRECTORIES = {}
+NOT_DIRECTORIES = {}
+
+def directory_key(directory):
+    return directory if os.path.isabs(directory) else os.path.abspath(directory or '.')
+
+def directory_entries(directory):
+    '''the entries of a directory by lower case name, listed again only once the directory's mtime changes'''
+    key = directory_key(directory)
+    try:
+        stat = os.stat(key)
+    except OSError:
+        DIRECTORIES.pop(key, None)
+        return {}
+    if not S_ISDIR(stat.st_mode):
+        DIRECTORIES.pop(key, None)
+        NOT_DIRECTORIES[key] = time.time()
+        return {}
+    mtime = stat.st_mtime
+    cached = DIRECTORIES.get(key)
+    if cached and cached[0] == mtime:
+        return cached[2]
+    try:
+        names = os.listdir(key)
+    except OSError:
+        return {}
+    entries = dict((name, name) for name in names)
+    for name in names:
+        entries.setdefault(name.lower(), name)
+    DIRECTORIES[key] = (mtime, time.time(), entries)
+    return entries
+
+def find_entry(name, directory):
+    '''the actual name of an entry of a directory, the one matching its case when there are several, or None'''
+    key = directory_key(directory)
+    entries = directory_entries(key)
+    entry = entries.get(name) or entries.get(name.lower())
+    if entry is None:
+        cached = DIRECTORIES.get(key)
+        if cached and cached[1] - cached[0] < MTIME_RESOLUTION:
+            # the directory may have changed since it was listed without its mtime changing
+            DIRECTORIES.pop(key)
+            entries = directory_entries(key)
+            entry = entries.get(name) or entries.get(name.lower())
+    return entry
+
+def find_ignore_case(filename, directories):
+    '''the path of filename in the first directory that has an entry by that name in any case'''
+    for directory in directories:
+        entry = find_entry(filename, directory)
+        if entry is not None:
+            return os.path.join(directory, entry)
+
+def split_path(pathname):
+    '''the components of a windows or posix path'''
+    parts = []
+    head = pathname
+    while True:
+        head, tail = ntpath.split(head)
+        if tail:
+            parts.insert(0, tail)
+        if not tail or not head:
+            return head, parts
+
+def resolve(pathname, directory):
+    '''Find a path below a directory matching each component in any case.
+
+    Returns the path and whether it could not be found, in which case the
+    components from the first one missing on are joined unchanged.'''
+    return resolve_parts(pathname, split_path(pathname), directory)
+
+def resolve_parts(pathname, split, directory):
+    root, parts = split
+    if root and not os.path.isdir(root):
+        return os.path.join(directory, pathname), True
+    path = root or directory
+    for i, part in enumerate(parts):
+        if part in ('..', '.'):
+            path = os.path.abspath(os.path.join(path, part))
+            continue
+        entry = find_entry(part, path)
+        if entry is None:
+            return os.path.join(path, *parts[i:]), True
+        path = os.path.join(path, entry)
+    return path, False
+
+def locate(filename, directories):
+    '''the first file named filename in any case below one of the directories, or None'''
+    split = root, parts = split_path(filename)
+    relative = not root and parts and parts[0] not in ('..', '.')
+    now = time.time()
+    for directory in filter(None, directories):
+        if relative:
+            # projects put their files on the search path as well as their directories
+            if now - NOT_DIRECTORIES.get(directory, 0) < FILE_RECHECK or not directory_entries(directory):
+                continue
+        path, failed = resolve_parts(filename, split, directory)
+        if not failed and os.path.isfile(path):
+            return path
+
+def clear():
+    DIRECTORIES.clear()
+    NOT_DIRECTORIES.clear()
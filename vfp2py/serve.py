@@ -0,0 +1,198 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import stat
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from . import timings
+from . import vfp2py
+from .incremental import IncrementalProgram
+
+DOCUMENT_OPS = ('open', 'edit', 'close')
+DOCUMENTS = {}
+
+def run_request(request):
+    op = request.get('op')
+    if op == 'prg2py':
+        kwargs = {key: request[key] for key in ('parser_start', 'prepend_data', 'input_filename') if key in request}
+        return {'output': vfp2py.prg2py(request['source'], **kwargs)}
+    elif op == 'convert_file':
+        return {'includes': vfp2py.convert_file(request['infile'], request['outfile']) or []}
+    elif op == 'open':
+        program = DOCUMENTS[request['document']] = IncrementalProgram(request['source'], request.get('input_filename', ''))
+        return {'output': program.output()}
+    elif op == 'edit':
+        program = DOCUMENTS.get(request['document'])
+        if program is None:
+            raise ValueError('document {} is not open'.format(request['document']))
+        start, end = [position if isinstance(position, int) else program.offset(position['line'], position['character'])
+                      for position in (request['start'], request['end'])]
+        return {'output': program.edit(start, end, request['text'])}
+    elif op == 'close':
+        DOCUMENTS.pop(request['document'], None)
+        return {}
+    raise ValueError('unknown op {}'.format(op))
+
+def handle_request(request):
+    '''run a request and return its response along with what was logged and the time spent in each stage'''
+    handler = vfp2py.DiagnosticHandler()
+    logger = logging.getLogger()
+    logger.addHandler(handler)
+    timings.reset()
+    start = time.time()
+    response = {'id': request.get('id'), 'ok': True}
+    error = None
+    try:
+        response.update(run_request(request))
+    except Exception as err:
+        error = traceback.format_exc()
+        response.update(ok=False, error='{}: {}'.format(type(err).__name__, err))
+    finally:
+        logger.removeHandler(handler)
+    response['diagnostics'] = handler.diagnostics
+    name = request.get('infile') or request.get('document') or request.get('input_filename') or '<source>'
+    response['timings'] = timings.record(name, time.time() - start, error)
+    if error:
+        response['diagnostics'].append({'level': 'ERROR', 'message': error})
+    return response
+
+def parse_request(line):
+    try:
+        request = json.loads(line)
+    except ValueError as err:
+        return None, {'id': None, 'ok': False, 'error': 'invalid request: {}'.format(err)}
+    if not isinstance(request, dict):
+        return None, {'id': None, 'ok': False, 'error': 'invalid request: expected an object'}
+    return request, None
+
+class Server(object):
+    '''Runs requests in this process or in a pool of worker processes.
+
+    Each process keeps the parser's prediction cache, the preprocessed headers
+    and the search path between requests. Requests run one at a time in this
+    process, the converter keeps its state in module globals. Requests on open
+    documents always run in this process, which keeps the documents.'''
+
+    def __init__(self, jobs=1):
+        self.lock = threading.Lock()
+        if jobs < 1:
+            jobs = multiprocessing.cpu_count()
+        self.pool = None
+        if jobs > 1:
+            self.pool = multiprocessing.Pool(jobs, vfp2py.init_project_worker, (vfp2py.SEARCH_PATH, vfp2py.CACHE_DIR, vfp2py.STREAM))
+
+    def handle(self, line):
+        '''run the request on a line and wait for its response'''
+        request, response = parse_request(line)
+        if response:
+            return response
+        if self.pool and request.get('op') not in DOCUMENT_OPS:
+            return self.pool.apply(handle_request, (request,))
+        with self.lock:
+            return handle_request(request)
+
+    def submit(self, line, callback):
+        '''run the request on a line and call back with its response once it is done'''
+        request, response = parse_request(line)
+        if response:
+            callback(response)
+        elif self.pool and request.get('op') not in DOCUMENT_OPS:
+            self.pool.apply_async(handle_request, (request,), callback=callback)
+        else:
+            with self.lock:
+                response = handle_request(request)
+            callback(response)
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+
+def serve_stream(server, infile, outfile):
+    '''answer each line of infile on outfile, responses come back as they finish and carry the id of their request'''
+    write_lock = threading.Lock()
+    def respond(response):
+        with write_lock:
+            outfile.write(json.dumps(response) + '\n')
+            outfile.flush()
+    for line in iter(infile.readline, ''):
+        if line.strip():
+            server.submit(line, respond)
+    server.close()
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, b''):
+            if line.strip():
+                response = self.server.vfp2py_server.handle(line.decode('utf-8'))
+                self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+                self.wfile.flush()
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def socket_server(server, path):
+    '''listen on a unix socket, each connection gets the responses to its requests in order'''
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.remove(path)
+    unix_server = UnixServer(path, RequestHandler)
+    unix_server.vfp2py_server = server
+    return unix_server
+
+def serve(socket_path=None, jobs=0):
+    '''answer requests from stdin, or from a unix socket, until it is closed'''
+    stdout = sys.stdout
+    if not socket_path:
+        sys.stdout = sys.stderr
+    server = Server(jobs)
+    try:
+        if socket_path:
+            unix_server = socket_server(server, socket_path)
+            try:
+                unix_server.serve_forever()
+            finally:
+                unix_server.server_close()
+                os.remove(socket_path)
+        else:
+            serve_stream(server, sys.stdin, stdout)
+    finally:
+        server.close()
+        sys.stdout = stdout
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='vfp2py serve', description='Convert Foxpro code to Python on requests sent as lines of json')
+    parser.add_argument("--socket", help="unix socket to listen on instead of stdin and stdout", type=str)
+    parser.add_argument("--jobs", "-j", help="number of worker processes running requests in parallel, all cpus by default, 1 runs "
+                                             "requests one at a time in the server process", type=int, default=0)
+    parser.add_argument("--cache-dir", help="directory used to cache converted files between runs so only changed files are converted again", type=str)
+    parser.add_argument("--logging", help="output logging information", action='store_true')
+    parser.add_argument("search", help="directory to search for included files", type=str, nargs='*')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.logging:
+        logging.basicConfig(level=logging.DEBUG)
+    vfp2py.SEARCH_PATH += args.search
+    vfp2py.CACHE_DIR = args.cache_dir
+    try:
+        serve(args.socket, args.jobs)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
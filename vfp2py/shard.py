@@ -0,0 +1,200 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import errno
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+from . import depgraph
+from . import timings
+from . import vfp2py
+from .cache import atomic_write
+
+MANIFEST_VERSION = 1
+MANIFEST = 'manifest.json'
+SHARD_SIZE = 50
+
+def manifest_path(manifest_dir, *parts):
+    return os.path.join(os.path.abspath(manifest_dir), *parts)
+
+def split_shards(names, graph, num_shards):
+    '''split files into shards of about the same expected conversion time, each listing its longest files first'''
+    shards = [[] for i in range(max(min(num_shards, len(names)), 1))]
+    costs = [0] * len(shards)
+    for name in graph.schedule(names):
+        i = min(range(len(shards)), key=lambda i: (costs[i], len(shards[i]), i))
+        shards[i].append(name)
+        costs[i] += graph.cost(name)
+    return [(shard, cost) for shard, cost in zip(shards, costs) if shard]
+
+def write_manifest(infile, outpath, manifest_dir, num_shards=None, shard_size=SHARD_SIZE):
+    '''Plan the conversion of a project as shards that workers sharing a filesystem claim and convert.
+
+    The manifest keeps every path absolute along with the search path and
+    cache directory the workers convert with. Shards are split using the
+    conversion times kept in the dependency graph, or file sizes.'''
+    project_files, main_file, directory, project_jobs = vfp2py.prepare_project(infile, outpath)
+    graph = depgraph.load_graph(infile, project_files, vfp2py.CACHE_DIR)
+    jobs = {job[0]: [job[0], os.path.abspath(job[1]) if project_files[job[0]] else job[1], os.path.abspath(job[2])] for job in project_jobs}
+    if not num_shards:
+        num_shards = (len(jobs) + shard_size - 1) // shard_size
+    shards = split_shards(sorted(jobs), graph, num_shards)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'project': os.path.abspath(infile),
+        'directory': os.path.abspath(directory),
+        'main_file': main_file,
+        'project_files': {name: path and os.path.abspath(path) for name, path in project_files.items()},
+        'search_path': [os.path.abspath(path) for path in vfp2py.SEARCH_PATH if path],
+        'cache_dir': vfp2py.CACHE_DIR and os.path.abspath(vfp2py.CACHE_DIR),
+        'stream': vfp2py.STREAM,
+        'shards': [{
+            'id': 'shard{:04d}'.format(i),
+            'cost': cost,
+            'jobs': [jobs[name] for name in names],
+        } for i, (names, cost) in enumerate(shards)],
+    }
+    for subdirectory in ('claims', 'results', 'reports'):
+        if not os.path.isdir(manifest_path(manifest_dir, subdirectory)):
+            os.makedirs(manifest_path(manifest_dir, subdirectory))
+    atomic_write(manifest_path(manifest_dir, MANIFEST), json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+def read_manifest(manifest_dir):
+    with open(manifest_path(manifest_dir, MANIFEST), 'rb') as fid:
+        manifest = json.loads(fid.read().decode('utf-8'))
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError('{} was written by another version of vfp2py'.format(manifest_path(manifest_dir, MANIFEST)))
+    return manifest
+
+def result_filename(manifest_dir, shard):
+    return manifest_path(manifest_dir, 'results', shard['id'] + '.json')
+
+def claim(manifest_dir, shard, stale=None):
+    '''Claim a shard by creating its lock file, which fails when another worker holds it.
+
+    A claim older than stale seconds is taken to belong to a worker that
+    died and is broken. Two workers breaking the same claim at once could
+    both convert the shard, which only costs time since results are written
+    whole.'''
+    lock = manifest_path(manifest_dir, 'claims', shard['id'] + '.lock')
+    for attempt in range(2):
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+            try:
+                age = time.time() - os.path.getmtime(lock)
+            except OSError:
+                continue
+            if stale is None or age < stale or attempt:
+                return False
+            try:
+                os.remove(lock)
+            except OSError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as fid:
+            fid.write('{} {}\n'.format(socket.gethostname(), os.getpid()))
+        return True
+    return False
+
+def work(manifest_dir, jobs=1, stale=None, parser_profile=False):
+    '''claim and convert shards of a manifest until every shard has been claimed, returning the ids of the converted shards'''
+    manifest = read_manifest(manifest_dir)
+    vfp2py.init_project_worker(manifest['search_path'], manifest['cache_dir'], manifest['stream'], parser_profile, True)
+    converted = []
+    for shard in manifest['shards']:
+        if os.path.exists(result_filename(manifest_dir, shard)) or not claim(manifest_dir, shard, stale):
+            continue
+        print('converting {}'.format(shard['id']))
+        failures, records = vfp2py.run_project_jobs([tuple(job) for job in shard['jobs']], jobs)
+        timings.write_report(manifest_path(manifest_dir, 'reports', shard['id'] + '.json'), records)
+        result = {
+            'shard': shard['id'],
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'failures': failures,
+            'records': records,
+        }
+        atomic_write(result_filename(manifest_dir, shard), json.dumps(result).encode('utf-8'))
+        converted.append(shard['id'])
+    return converted
+
+def merge(manifest_dir):
+    '''once every shard is converted, report on the whole project and write its package files as convert_project does'''
+    manifest = read_manifest(manifest_dir)
+    missing = [shard['id'] for shard in manifest['shards'] if not os.path.exists(result_filename(manifest_dir, shard))]
+    if missing:
+        raise ValueError('shards not converted yet: {}'.format(', '.join(missing)))
+    failures = []
+    records = []
+    for shard in manifest['shards']:
+        with open(result_filename(manifest_dir, shard), 'rb') as fid:
+            result = json.loads(fid.read().decode('utf-8'))
+        failures += [tuple(failure) for failure in result['failures']]
+        records += result['records']
+    vfp2py.init_project_worker(manifest['search_path'], manifest['cache_dir'], manifest['stream'])
+    project_files = manifest['project_files']
+    graph = depgraph.load_graph(manifest['project'], project_files, manifest['cache_dir'])
+    vfp2py.finish_project(project_files, manifest['main_file'], manifest['directory'], graph, sorted(failures), records)
+    return failures
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='vfp2py shard', description='Convert a project in shards claimed by workers on any number of hosts sharing a filesystem')
+    parser.add_argument("--logging", help="output logging information", action='store_true')
+    commands = parser.add_subparsers(dest='command')
+    plan = commands.add_parser('plan', help='write the manifest of shards for a project')
+    plan.add_argument("--shards", help="number of shards, by default one for every {} files".format(SHARD_SIZE), type=int)
+    plan.add_argument("--cache-dir", help="directory used to cache converted files between runs so only changed files are converted again", type=str)
+    plan.add_argument("--stream", help="convert prg files one procedure or class at a time to limit memory use, bypasses the cache", action='store_true')
+    plan.add_argument("infile", help="pjx file to convert", type=str)
+    plan.add_argument("outpath", help="directory to output the converted package to", type=str)
+    plan.add_argument("manifest", help="directory shared by the workers for the manifest, claims and results", type=str)
+    plan.add_argument("search", help="directory to search for included files", type=str, nargs='*')
+    work_parser = commands.add_parser('work', help='claim and convert shards until none are left')
+    work_parser.add_argument("--jobs", "-j", help="number of processes converting the files of a shard, 0 uses all cpus", type=int, default=1)
+    work_parser.add_argument("--stale", help="seconds after which the claim of a shard without results is taken over", type=float)
+    work_parser.add_argument("--parser-profile", help="record the predictions made at each decision of the grammar for the report written by merge", action='store_true')
+    work_parser.add_argument("manifest", help="manifest directory written by plan", type=str)
+    merge_parser = commands.add_parser('merge', help='report on the converted shards and write the package files')
+    merge_parser.add_argument("--timings", help="write a json report of the time, tokens, output size and peak memory of each file and list the slowest files", type=str, metavar='REPORT')
+    merge_parser.add_argument("--graph", help="write the dependencies between the files of the project to a json file, or to a graphviz file when it ends in .dot", type=str, metavar='GRAPH')
+    merge_parser.add_argument("--parser-profile", help="write a json report of the parser decisions recorded by workers run with --parser-profile and list the slowest decisions", type=str, metavar='REPORT')
+    merge_parser.add_argument("manifest", help="manifest directory written by plan", type=str)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.logging:
+        logging.basicConfig(level=logging.DEBUG)
+    if args.command == 'plan':
+        vfp2py.SEARCH_PATH += args.search
+        vfp2py.CACHE_DIR = args.cache_dir
+        vfp2py.STREAM = args.stream
+        manifest = write_manifest(args.infile, args.outpath, args.manifest, args.shards)
+        print('wrote {} shards to {}'.format(len(manifest['shards']), manifest_path(args.manifest, MANIFEST)))
+    elif args.command == 'work':
+        work(args.manifest, args.jobs, args.stale, args.parser_profile)
+    elif args.command == 'merge':
+        vfp2py.TIMINGS = args.timings
+        vfp2py.GRAPH = args.graph
+        vfp2py.PARSER_PROFILE = args.parser_profile
+        try:
+            failures = merge(args.manifest)
+        except ValueError as err:
+            print(err, file=sys.stderr)
+            return 1
+        return 1 if failures else 0
+    else:
+        parse_args(['--help'])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
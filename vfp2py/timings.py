@@ -0,0 +1,111 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import contextlib
+import json
+import sys
+import timeit
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+STAGES = OrderedDict()
+COUNTS = {}
+ACTIVE = []
+# reset the peak memory before each file of a project so its record gives the peak of that file
+MEMORY = False
+
+@contextlib.contextmanager
+def stage(name):
+    '''add the time spent in the with block to the named stage, time spent in nested stages counts toward the outer one'''
+    if ACTIVE:
+        yield
+        return
+    ACTIVE.append(name)
+    start = timeit.default_timer()
+    try:
+        yield
+    finally:
+        STAGES[name] = STAGES.get(name, 0) + timeit.default_timer() - start
+        ACTIVE.pop()
+
+def count(name, amount=1):
+    COUNTS[name] = COUNTS.get(name, 0) + amount
+
+def reset_peak_memory():
+    try:
+        with open('/proc/self/clear_refs', 'w') as fid:
+            fid.write('5')
+    except (IOError, OSError):
+        pass
+
+def peak_memory():
+    '''peak resident memory in bytes, since the last reset on platforms that allow resetting it'''
+    try:
+        with open('/proc/self/status') as fid:
+            for line in fid:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    if resource:
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == 'darwin' else usage * 1024
+    return None
+
+def reset():
+    STAGES.clear()
+    COUNTS.clear()
+
+def record(filename, wall, error=None):
+    '''timings of the file converted since the last reset'''
+    return OrderedDict([
+        ('file', filename),
+        ('wall', wall),
+        ('stages', OrderedDict(STAGES)),
+        ('tokens', COUNTS.get('tokens', 0)),
+        ('ll_fallbacks', COUNTS.get('ll_fallbacks', 0)),
+        ('cached', bool(COUNTS.get('cache_hits'))),
+        ('output_bytes', COUNTS.get('output_bytes', 0)),
+        ('peak_memory', peak_memory()),
+        ('failed', error is not None),
+    ])
+
+def slowest(records, num=10):
+    return sorted(records, key=lambda record: -record['wall'])[:num]
+
+def write_report(filename, records):
+    stages = OrderedDict()
+    for record in records:
+        for name, seconds in record['stages'].items():
+            stages[name] = stages.get(name, 0) + seconds
+    report = OrderedDict([
+        ('files', records),
+        ('totals', OrderedDict([
+            ('files', len(records)),
+            ('wall', sum(record['wall'] for record in records)),
+            ('stages', stages),
+            ('tokens', sum(record['tokens'] for record in records)),
+            ('ll_fallbacks', sum(record['ll_fallbacks'] for record in records)),
+            ('output_bytes', sum(record['output_bytes'] for record in records)),
+        ])),
+        ('slowest', [record['file'] for record in slowest(records)]),
+    ])
+    with open(filename, 'w') as fid:
+        json.dump(report, fid, indent=2)
+
+def print_summary(records, num=10, fid=None):
+    print('slowest files:', file=fid)
+    for record in slowest(records, num):
+        stages = ', '.join('{} {:.2f}s'.format(name, seconds) for name, seconds in sorted(record['stages'].items(), key=lambda item: -item[1])[:3])
+        notes = [stages] if stages else []
+        if record['ll_fallbacks']:
+            notes.append('{} LL fallbacks'.format(record['ll_fallbacks']))
+        if record['cached']:
+            notes.append('cached')
+        if record['failed']:
+            notes.append('failed')
+        print('    {:8.2f}s  {}'.format(record['wall'], record['file']) + ('  ({})'.format('; '.join(notes)) if notes else ''), file=fid)
@@ -4,37 +4,73 @@ from __future__ import absolute_import, division, print_function
 import sys
 import logging
 import os
-import ntpath
 import time
 import re
 import tempfile
 import shutil
-import tokenize
 import io
-
-import dbf
+import itertools
+import multiprocessing
+import traceback
+import hashlib
+from collections import OrderedDict
 
 import antlr4
-
-import autopep8
+from antlr4.Token import CommonToken
+from antlr4.ListTokenSource import ListTokenSource
 
 from .VisualFoxpro9Lexer import VisualFoxpro9Lexer
 from .VisualFoxpro9Parser import VisualFoxpro9Parser
 from .VisualFoxpro9Visitor import VisualFoxpro9Visitor
 
-from . import vfpfunc
-from .vfp2py_convert_visitor import PythonConvertVisitor, CodeStr
+from . import timings
+from . import dfacache
+from . import vfptable
+from . import depgraph
+from . import pathindex
+from . import parseprofile
+from . import exprparser
+from .vfp2py_convert_visitor import PythonConvertVisitor, CodeStr, create_string
+from .cache import ConversionCache
+from .emitter import Emitter, emit
 
 SEARCH_PATH = ['.']
 INCLUDE = {}
+CLASSLIBS = {}
+CONSTANT_PARSER = None
+PROPERTY_PARSER = None
+CACHE_DIR = None
+STREAM = False
+TIMINGS = None
+GRAPH = None
+PARSER_PROFILE = None
+
+PRG_PROCEDURE = re.compile(r'\s*(?:(?:prot(?:e(?:c(?:t(?:ed?)?)?)?)?|hidd(?:en?)?|publ(?:ic?)?|priv(?:a(?:te?)?)?|local)\s+)?(?:proc(?:e(?:d(?:u(?:re?)?)?)?)?|func(?:t(?:i(?:on?)?)?)?)\s+[a-z_]', re.I)
+PRG_CLASS = re.compile(r'\s*defi(?:ne?)?\s+class\s', re.I)
+PRG_ENDCLASS = re.compile(r'\s*endde(?:f(?:i(?:ne?)?)?)?\b', re.I)
+PRG_TEXT = re.compile(r'\s*text\b', re.I)
+PRG_ENDTEXT = re.compile(r'\s*endt(?:e(?:xt?)?)?\b', re.I)
+PRG_IF = re.compile(r'\s*#\s*if', re.I)
+PRG_ENDIF = re.compile(r'\s*#\s*endif?\b', re.I)
+PRG_DIRECTIVE = re.compile(r'^\s*#', re.M)
+PRG_TEXT_OPTIONS = (VisualFoxpro9Lexer.TO, VisualFoxpro9Lexer.ADDITIVE, VisualFoxpro9Lexer.TEXTMERGE, VisualFoxpro9Lexer.NOSHOW,
+                    VisualFoxpro9Lexer.FLAGS, VisualFoxpro9Lexer.PRETEXT)
+
+VCX_IDENTIFIER = re.compile(r'[A-Za-z_]')
+VCX_NUMBER = re.compile(r'\.?[0-9]')
+VCX_BOOLEAN = re.compile(r'\.(?:[ftny]|null)\.', re.I)
+VCX_DATE = re.compile(r'\{(?:\^[0-9]+-[0-9]+-[0-9]+)?\}')
+VCX_QUOTES = {'"': '"', "'": "'", '[': ']'}
+VCX_BOOLEANS = {'.t.': True, '.y.': True, '.f.': False, '.n.': False, '.null.': None}
+SCX_PROPERTY = re.compile(r'\s*([A-Za-z_][A-Za-z0-9_]*) = (-?)(.*)$')
+SCX_DECIMAL = re.compile(r'(?:[0-9]+\.?[0-9]*|\.[0-9]+)$')
+VCX_CODE_FIELDS = ('reserved8', 'objname', 'class', 'properties', 'methods')
+
+dfacache.load([VisualFoxpro9Lexer, VisualFoxpro9Parser])
 
 def which(filename):
     '''find file on path'''
-    for path in filter(None, SEARCH_PATH):
-        testpath = os.path.join(path, filename)
-        if os.path.isfile(testpath):
-            return testpath
-    return filename
+    return pathindex.locate(filename, SEARCH_PATH) or filename
 
 
 
@@ -42,6 +78,7 @@ class PreprocessVisitor(VisualFoxpro9Visitor):
     def __init__(self):
         self.tokens = None
         self.memory = {}
+        self.includes = []
 
     def visitPreprocessorCode(self, ctx):
         return self.visit(ctx.preprocessorLines())
@@ -72,23 +109,20 @@ class PreprocessVisitor(VisualFoxpro9Visitor):
     def visitPreprocessorInclude(self, ctx):
         visitor = PythonConvertVisitor('')
         visitor.scope = {}
-        TreeCleanVisitor().visit(ctx.specialExpr())
         filename = visitor.visit(ctx.specialExpr())
         if isinstance(filename, CodeStr):
             filename = eval(filename)
+        include_name = filename
         filename = which(filename)
-        if filename in INCLUDE:
-            include_visitor = INCLUDE[filename]
-        else:
-            include_visitor = preprocess_file(filename)
-            INCLUDE[filename] = include_visitor
+        include_visitor = include_file(filename)
+        self.includes.append((include_name, filename))
+        self.includes += include_visitor.includes
         self.memory.update(include_visitor.memory)
         return include_visitor.tokens
 
     def visitPreprocessorIf(self, ctx):
         if ctx.IF():
-            ifexpr = ''.join(x.text for x in self.replace_define_tokens(ctx.expr()))
-            ifexpr = eval(repr(prg2py_after_preproc(ifexpr, 'expr', '')))
+            ifexpr = eval(repr(convert_tokens(self.replace_define_tokens(ctx.expr()), 'expr', '')))
         else:
             name = ctx.identifier().getText().lower()
             ifexpr = name in self.memory
@@ -110,8 +144,7 @@ class PreprocessVisitor(VisualFoxpro9Visitor):
                 retval += self.memory[tok.text.lower()]
             else:
                 if tok.type == ctx.parser.COMMENT:
-                    tok.text = '*' + tok.text[2:] + '\n'
-                    hidden_tokens.append(tok)
+                    hidden_tokens += line_comment_tokens(tok)
                     continue
                 retval.append(tok)
         return hidden_tokens + retval
@@ -119,79 +152,61 @@ class PreprocessVisitor(VisualFoxpro9Visitor):
     def visitNonpreprocessorLine(self, ctx):
         return self.replace_define_tokens(ctx)
 
-def add_indents(struct, num_indents):
-    retval = []
-    for item in struct:
-        if isinstance(item, list):
-            retval.append(add_indents(item, num_indents+1))
-        elif item:
-            retval.append(' '*4*num_indents + repr(item))
-        else:
-            retval.append('')
-    return '\n'.join(retval)
+def line_comment_tokens(comment):
+    '''the tokens of a * comment line with the text of a && comment, the text is kept in one hidden token'''
+    tokens = []
+    for token_type, channel, text in ((VisualFoxpro9Lexer.ASTERISK, 0, '*'), (VisualFoxpro9Lexer.WS, 1, comment.text[2:]), (VisualFoxpro9Lexer.NL, 0, '\n')):
+        if text:
+            token = CommonToken(type=token_type, channel=channel)
+            token.text = text
+            token.line = comment.line
+            token.column = comment.column
+            tokens.append(token)
+    return tokens
 
-def contains_exceptions(ctx):
-    return (isinstance(ctx, ctx.parser.AtomExprContext) and ctx.trailer() and isinstance(ctx.trailer(), ctx.parser.FuncCallTrailerContext)) or \
-           isinstance(ctx, ctx.parser.ConstantExprContext) or \
-           isinstance(ctx, ctx.parser.SubExprContext) or \
-           any(contains_exceptions(c) for c in ctx.children if isinstance(c, ctx.parser.ExprContext))
+def lex_code(data):
+    '''the tokens of a short piece of code, without the EOF token'''
+    stream = antlr4.CommonTokenStream(VisualFoxpro9Lexer(antlr4.InputStream(data)))
+    stream.fill()
+    return stream.tokens[:-1]
 
-class TreeCleanVisitor(VisualFoxpro9Visitor):
-    def visitSpecialExpr(self, ctx):
-        if ctx.pathname():
-            return
+def program_tokens(tokens, first_line=1):
+    '''Copy the tokens of preprocessed code for the parser.
 
-        start, stop = ctx.getSourceInterval()
-        stream = ctx.parser._input
-        tokens = stream.tokens[start:stop+1]
-
-        if not (any(tok.type == ctx.parser.WS for tok in tokens) or contains_exceptions(ctx)):
-            stream.seek(start)
-            ctx.removeLastChild()
-            pathname = VisualFoxpro9Parser(stream).pathname()
-            ctx.addChild(pathname)
-            pathname.stop = stream.tokens[stop]
-            while pathname.children and pathname.children[-1].getSourceInterval()[0] > stop:
-                pathname.removeLastChild()
-
-        self.visitChildren(ctx)
-
-    def visitSubExpr(self, ctx):
-        self.visit(ctx.expr())
-        if isinstance(ctx.expr(), ctx.parser.SubExprContext):
-            ctx.removeLastChild()
-            newexpr = ctx.expr().expr()
-            ctx.removeLastChild()
-            ctx.addChild(newexpr)
-
-    def visitPower(self, ctx):
-        self.visitChildren(ctx)
-        left, right = ctx.expr()
-        if isinstance(right, ctx.parser.SubExprContext) and isinstance(right.expr(), ctx.parser.PowerContext):
-            ctx.removeLastChild()
-            right = right.expr()
-            ctx.addChild(right)
-        if isinstance(left, ctx.parser.PowerContext):
-            newleft = ctx.parser.SubExprContext(ctx.parser, ctx.parser.ExprContext(ctx.parser, ctx))
-            newleft.addChild(left)
-            while ctx.children:
-                ctx.removeLastChild()
-            ctx.addChild(newleft)
-            ctx.addChild(right)
-
-    def visitUnaryNegation(self, ctx):
-        self.visit(ctx.expr())
-        if ctx.op.type == ctx.parser.MINUS_SIGN and isinstance(ctx.expr(), ctx.parser.UnaryNegationContext):
-            ctx.expr().op.type = ctx.parser.PLUS_SIGN
-            ctx.op.type = ctx.parser.PLUS_SIGN
-
-def preprocess_code(data):
+    Tokens of headers and macros show up more than once, so each gets a copy
+    of its own. Carriage returns are dropped and lines and columns are counted
+    as if the tokens had been joined and lexed again.'''
+    copies = []
+    line = first_line
+    column = 0
+    for token in tokens:
+        text = token.text
+        if token.type == antlr4.Token.EOF:
+            continue
+        if '\r' in text:
+            text = text.replace('\r', '')
+            if not text:
+                continue
+        copy = CommonToken(token.source, token.type, token.channel, token.start, token.stop)
+        copy.text = text
+        copy.line = line
+        copy.column = column
+        newlines = text.count('\n')
+        if newlines:
+            line += newlines
+            column = len(text) - text.rfind('\n') - 1
+        else:
+            column += len(text)
+        copies.append(copy)
+    return copies
+
+def preprocess_code(data, visitor=None):
     input_stream = antlr4.InputStream(data)
     lexer = VisualFoxpro9Lexer(input_stream)
     stream = antlr4.CommonTokenStream(lexer)
     parser = VisualFoxpro9Parser(stream)
     tree = run_parser(stream, parser, 'preprocessorCode')
-    visitor = PreprocessVisitor()
+    visitor = visitor or PreprocessVisitor()
     visitor.tokens = visitor.visit(tree)
     return visitor
 
@@ -200,11 +215,57 @@ def preprocess_file(filename):
         data = fid.read().decode('cp1252')
     return preprocess_code(data)
 
+def serialize_tokens(tokens):
+    return [[token.type, token.channel, token.text, token.line, token.column] for token in tokens]
+
+def deserialize_tokens(data):
+    tokens = []
+    for token_type, channel, text, line, column in data:
+        token = CommonToken(type=token_type, channel=channel)
+        token.text = text
+        token.line = line
+        token.column = column
+        tokens.append(token)
+    return tokens
+
+def file_stamp(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+def include_file(filename):
+    '''preprocess an included file, reusing the in memory or precompiled header when still valid'''
+    include_visitor = INCLUDE.get(filename)
+    if include_visitor and all(file_stamp(name) == stamp for name, stamp in include_visitor.stamps):
+        return include_visitor
+    include_visitor = None
+    if CACHE_DIR:
+        header_cache = ConversionCache(os.path.join(CACHE_DIR, 'headers'))
+        cache_key = header_cache.key([filename], SEARCH_PATH)
+        entry = header_cache.lookup(cache_key, which)
+        if entry is not None:
+            header = entry['output']
+            include_visitor = PreprocessVisitor()
+            include_visitor.tokens = deserialize_tokens(header['tokens'])
+            include_visitor.memory = {name: deserialize_tokens(tokens) for name, tokens in header['memory'].items()}
+            include_visitor.includes = [tuple(include) for include in header['includes']]
+    if include_visitor is None:
+        include_visitor = preprocess_file(filename)
+        if CACHE_DIR:
+            header = {
+                'tokens': serialize_tokens(include_visitor.tokens),
+                'memory': {name: serialize_tokens(tokens) for name, tokens in include_visitor.memory.items()},
+                'includes': include_visitor.includes,
+            }
+            header_cache.store(cache_key, include_visitor.includes, header)
+    include_visitor.stamps = [(name, file_stamp(name)) for name in [filename] + [path for _, path in include_visitor.includes]]
+    INCLUDE[filename] = include_visitor
+    return include_visitor
+
 def find_file_ignore_case(filename, directories):
-    for directory in directories:
-        for testfile in os.listdir(directory):
-            if testfile.lower() == filename.lower():
-                return os.path.join(directory, testfile)
+    return pathindex.find_ignore_case(filename, directories)
 
 def memo_filename(filename, ext):
     directory = os.path.dirname(filename) or '.'
@@ -212,87 +273,142 @@ def memo_filename(filename, ext):
     memofile = os.path.splitext(basename)[0] + '.' + ext
     return find_file_ignore_case(memofile, [directory])
 
-def copy_obscured_dbf(filename, memo_ext, dbf_basename):
-    memofile = memo_filename(filename, memo_ext)
-    dbffile = dbf_basename + '.dbf'
-    shutil.copy(filename, dbffile)
-    if memofile:
-        shutil.copy(memofile, dbf_basename + '.fpt')
-    return dbffile
+class RuleParser(object):
+    '''one lexer and parser reused to parse many short texts'''
 
-def convert_vcx_to_vfp_code(mnxfile):
-    with tempfile.NamedTemporaryFile() as tmpfile:
-        pass
-    tmpfile = tmpfile.name
-    dbffile = copy_obscured_dbf(mnxfile, 'vct', tmpfile)
+    def __init__(self):
+        self.lexer = VisualFoxpro9Lexer(antlr4.InputStream(''))
+        self.parser = VisualFoxpro9Parser(antlr4.CommonTokenStream(self.lexer))
+        self.parser._interp.PredictionMode = antlr4.PredictionMode.SLL
+        self.parser.removeErrorListeners()
+        self.parser._errHandler = antlr4.error.ErrorStrategy.BailErrorStrategy()
+
+    def parse(self, text, parser_start):
+        self.lexer.inputStream = antlr4.InputStream(text)
+        stream = antlr4.CommonTokenStream(self.lexer)
+        self.parser.setTokenStream(stream)
+        tree = exprparser.parse(self.parser, parser_start) if parser_start in exprparser.START_RULES else None
+        if tree is None:
+            tree = getattr(self.parser, parser_start)()
+        return tree, stream
+
+class ConstantParser(RuleParser):
+    '''checks whether property values are constants'''
+
+    def parses(self, text):
+        try:
+            tree, stream = self.parse(text, 'constant')
+            PythonConvertVisitor('').visit(tree)
+        except Exception:
+            return False
+        return True
+
+def classify_constant(text):
+    '''whether the start of text parses as a constant, or None when only the parser can tell'''
+    if not text or text[:4].lower() == 'null':
+        return None
+    if VCX_IDENTIFIER.match(text):
+        return False
+    if '&' in text:
+        return None
+    if VCX_NUMBER.match(text) or VCX_BOOLEAN.match(text) or VCX_DATE.match(text):
+        return True
+    if text[0] in VCX_QUOTES:
+        return VCX_QUOTES[text[0]] in text[1:]
+    return None
+
+def vcx_property_value(value):
+    '''a vcx property value as foxpro code, values that are not constants are quoted'''
+    global CONSTANT_PARSER
+    if not value:
+        return '""'
+    elif re.match(r'^[0-9]*,[0-9]*,[0-9]*$', value):
+        return 'RGB({})'.format(value)
+    elif re.match(r'^\(.*\)$', value):
+        return value
+    text = value[1:] if value.startswith('-') else value
+    is_constant = classify_constant(text)
+    if is_constant is None:
+        if CONSTANT_PARSER is None:
+            CONSTANT_PARSER = ConstantParser()
+        is_constant = CONSTANT_PARSER.parses(text)
+    if is_constant:
+        return value
+    if '"' not in value:
+        format_string = '"{}"'
+    elif "'" not in value:
+        format_string = "'{}'"
+    elif '[' not in value and ']' not in value:
+        format_string = '[{}]'
+    else:
+        format_string = '{}'
+    return format_string.format(value)
+
+def vcx_class_code(record):
+    '''foxpro code defining the class stored in a vcx record'''
+    code = '\n'.join('#include "{}"'.format(x) for x in record.reserved8.splitlines()) + '\n'
+    code += 'DEFINE CLASS {} AS {}\n'.format(record.objname, record['class'])
+    props = []
+    for line in record.properties.splitlines():
+        if not line:
+            props.append('')
+            continue
+        prop, value = line.split(' = ', 1)
+        value = vcx_property_value(value)
+        props.append('{} = {}'.format(prop.strip(), value))
+
+    code += '\n'.join(props) + '\n\n'
+    code += '\n'.join(record.methods.splitlines()) + '\n'
+    code += 'ENDDEFINE\n\n'
+    return code
+
+def vcx_record_key(record):
+    data = '\x00'.join(record[name] for name in VCX_CODE_FIELDS)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+class ClassLibrary(object):
+    '''The foxpro code of the classes of a vcx, kept by the contents of their records.'''
 
-    codes = []
-    with dbf.Table(dbffile) as table:
+    def __init__(self, filename):
+        self.filename = filename
+        self.stamps = []
+        self.records = []
+        self.code = {}
+
+    def codes(self):
+        return [self.code[record_key] for record_key in self.records]
+
+def load_class_library(filename):
+    '''Read a vcx once, reusing the code of every class whose record has not changed since it was last read.
+
+    The code of each class is kept in its library by the contents of its
+    record, so replacing a library that changed drops the code of the classes
+    it no longer has.'''
+    key = os.path.normcase(os.path.abspath(filename))
+    previous = CLASSLIBS.get(key)
+    if previous and all(file_stamp(name) == stamp for name, stamp in previous.stamps):
+        return previous
+    memofile = memo_filename(filename, 'vct')
+    library = ClassLibrary(filename)
+    library.stamps = [(name, file_stamp(name)) for name in (filename, memofile) if name]
+    with vfptable.Table(filename, memofile) as table:
         for record in table:
-            code = '\n'.join('#include "{}"'.format(x) for x in record.reserved8.splitlines()) + '\n'
             if not (record.objname and record['class']):
                 continue
-            code += 'DEFINE CLASS {} AS {}\n'.format(record.objname, record['class'])
-            props = []
-            for line in record.properties.splitlines():
-                if not line:
-                    props.append('')
-                    continue
-                prop, value = line.split(' = ', 1)
-                if not value:
-                    value = '""'
-                elif re.match(r'^[0-9]*,[0-9]*,[0-9]*$', value):
-                    value = 'RGB({})'.format(value)
-                elif re.match(r'^\(.*\)$', value):
-                    pass
-                else:
-                    if value.startswith('-'):
-                        input_stream = antlr4.InputStream(value[1:])
-                    else:
-                        input_stream = antlr4.InputStream(value)
-                    lexer = VisualFoxpro9Lexer(input_stream)
-                    stream = antlr4.CommonTokenStream(lexer)
-                    parser = VisualFoxpro9Parser(stream)
-                    parser._interp.PredictionMode = antlr4.PredictionMode.SLL
-                    parser.removeErrorListeners()
-                    parser._errHandler = antlr4.error.ErrorStrategy.BailErrorStrategy()
-                    try:
-                        tree = parser.constant()
-                        TreeCleanVisitor().visit(tree)
-                        output_tree = PythonConvertVisitor('').visit(tree)
-                    except:
-                        if '"' not in value:
-                            format_string = '"{}"'
-                        else:
-                            if "'" not in value:
-                                format_string = "'{}'"
-                            else:
-                                if '[' not in value and ']' not in value:
-                                    format_string = '[{}]'
-                                else:
-                                    format_string = '{}'
-                        value = format_string.format(value)
-
-                props.append('{} = {}'.format(prop.strip(), value))
-
-            code += '\n'.join(props) + '\n\n'
-            code += '\n'.join(record.methods.splitlines()) + '\n'
-            code += 'ENDDEFINE\n\n'
-            codes.append(code)
-
-    os.remove(table.filename)
-    os.remove(table.memoname)
-
-    return codes
+            record_key = vcx_record_key(record)
+            if record_key not in library.code:
+                library.code[record_key] = previous.code[record_key] if previous and record_key in previous.code else vcx_class_code(record)
+            library.records.append(record_key)
+    CLASSLIBS[key] = library
+    return library
 
-def convert_scx_to_vfp_code(scxfile):
-    with tempfile.NamedTemporaryFile() as tmpfile:
-        pass
-    tmpfile = tmpfile.name
-    dbffile = copy_obscured_dbf(scxfile, 'sct', tmpfile)
+def convert_vcx_to_vfp_code(mnxfile):
+    return load_class_library(mnxfile).codes()
 
-    table = dbf.Table(dbffile)
-    table.open()
+def scx_form_lines(scxfile):
+    '''(line, owner) pairs of the foxpro code defining the forms in a scx, the owner of a property line is the form or
+    form.object it sets a property of and is empty for any other line'''
+    table = vfptable.Table(scxfile, memo_filename(scxfile, 'sct'))
 
     children = [list() for record in table]
     names = [record.objname for record in table]
@@ -313,9 +429,9 @@ def convert_scx_to_vfp_code(scxfile):
         code.append('DEFINE CLASS {} AS {}'.format(record.objname, record['class']))
         subcode = []
         for line in record.properties.split('\r\n'):
-            subcode.append(line)
+            subcode.append((line, record.objname))
         for child_record in child:
-            subcode.append('ADD OBJECT {} AS {}'.format(child_record.objname, child_record['class']))
+            subcode.append(('ADD OBJECT {} AS {}'.format(child_record.objname, child_record['class']), ''))
             for line in child_record.properties.split('\r\n'):
                 line = line.strip()
                 if not line:
@@ -325,7 +441,7 @@ def convert_scx_to_vfp_code(scxfile):
                     value = '"{}"'.format(value)
                 elif prop.endswith('Color'):
                     value = 'RGB({})'.format(value)
-                subcode.append(child_record.objname + '.' + prop + ' = ' + value)
+                subcode.append((child_record.objname + '.' + prop + ' = ' + value, record.objname + '.' + child_record.objname))
             subcode.append('')
 
         for line in record.methods.split('\r\n'):
@@ -343,54 +459,137 @@ def convert_scx_to_vfp_code(scxfile):
         code.append('')
 
     def add_indent(code, level):
-        retval = ''
         for line in code:
             if isinstance(line, list):
-                retval += add_indent(line, level+1)
+                for subline in add_indent(line, level+1):
+                    yield subline
             else:
-                retval += '   '*level + line + '\n'
-        return retval
+                line, owner = line if isinstance(line, tuple) else (line, '')
+                yield '   '*level + line, owner
 
     table.close()
-    os.remove(table.filename)
-    os.remove(table.memoname)
 
-    code = add_indent(code, 0)
+    lines = []
+    for line, owner in add_indent(code, 0):
+        if line.strip():
+            lines.append((line, owner))
+        elif not lines or lines[-1][0]:
+            lines.append(('', owner))
+    return lines
 
-    code = re.sub(r'(\n\s*)+\n+', '\n\n', code)
-    return code
+def convert_scx_to_vfp_code(scxfile):
+    return '\n'.join(line for line, owner in scx_form_lines(scxfile)) + '\n'
 
-def find_full_path(pathname, start_directory):
-    name_parts = ntpath.split(pathname)
-    while ntpath.split(name_parts[0])[1]:
-        name_parts = ntpath.split(name_parts[0]) + name_parts[1:]
-    pathname = start_directory
-    for part in name_parts:
-        if part in ('..', '.', ''):
-            pathname = os.path.abspath(os.path.join(pathname, part))
+def form_property_value(text):
+    '''python code for a number, string or logical constant as the converter writes it, or None'''
+    if not classify_constant(text):
+        return None
+    if text.lower() in VCX_BOOLEANS:
+        return repr(VCX_BOOLEANS[text.lower()])
+    if text[0] in VCX_QUOTES and text.find(VCX_QUOTES[text[0]], 1) == len(text) - 1:
+        return repr(create_string(text[1:-1]))
+    if SCX_DECIMAL.match(text):
+        try:
+            return repr(int(text).real)
+        except ValueError:
+            return repr(float(text))
+    return None
+
+def form_property_assignment(line):
+    '''the statement setting a property to a constant, built without the parser, or None when it has to be parsed'''
+    match = SCX_PROPERTY.match(line)
+    if not match:
+        return None
+    name, sign, text = match.groups()
+    if name.lower() == 'do':
+        # DO = 1 is read as a DO command
+        return None
+    value = form_property_value(text)
+    if value is None:
+        return None
+    name = name.lower()
+    return CodeStr('self.{} = {}{}'.format('classtype' if name == 'class' else name, sign, value))
+
+def parse_form_property(line):
+    '''parse a property line of a form on its own'''
+    global PROPERTY_PARSER
+    if PROPERTY_PARSER is None:
+        PROPERTY_PARSER = RuleParser()
+    try:
+        if '&&' in line or '\r' in line:
+            raise ValueError('comment or carriage return')
+        tree, stream = PROPERTY_PARSER.parse(line + '\n', 'classProperty')
+        if stream.LA(1) != antlr4.Token.EOF or not (tree.lineComment() or isinstance(tree.cmd(), VisualFoxpro9Parser.AssignContext)):
+            raise ValueError('not a single assignment')
+    except Exception:
+        raise FormPropertyError(line.strip())
+    return tree
+
+def form_property_code(converter, lines):
+    '''the python statements setting the properties of a form, each line is converted before the next one is read
+    and only lines that do not set a property to a constant are parsed'''
+    for line in lines:
+        if not line.strip():
+            yield CodeStr('')
+            continue
+        code = form_property_assignment(line)
+        if code is not None:
+            yield code
             continue
-        next_part = find_file_ignore_case(part, [pathname])
-        if next_part is None:
-            badind = name_parts.index(part)
-            return os.path.join(pathname, *name_parts[badind:]), True
-        pathname = next_part
-    return pathname, False
+        tree = parse_form_property(line)
+        for code in converter.class_property_assignments(tree.lineComment() or tree.cmd()):
+            yield code
+
+class FormPropertyError(Exception):
+    pass
+
+def convert_scx_lines(lines, input_filename):
+    '''Convert the lines of a form without parsing its property lines as part of the code.
+
+    Each property line of a form is converted on its own while the converter
+    builds the form class, the properties of added objects are not passed on
+    by the converter so they are left out. Returns the preprocessor visitor and
+    the python code, or None when the form has preprocessor directives that
+    might change its properties or properties the converter did not use.'''
+    skeleton = '\n'.join(line for line, owner in lines if not owner) + '\n'
+    if PRG_DIRECTIVE.search(skeleton):
+        return None
+    properties = OrderedDict()
+    for line, owner in lines:
+        if owner and '.' not in owner:
+            if owner.lower() in properties and owner.lower() != next(reversed(properties)):
+                return None
+            properties.setdefault(owner.lower(), []).append(line)
+    with timings.stage('preprocess'):
+        visitor = preprocess_code(skeleton)
+    tree = parse_tokens(lex_code('procedure _program_main\n') + visitor.tokens, 'prg')
+    with timings.stage('convert'):
+        converter = PythonConvertVisitor(input_filename)
+        converter.class_properties = {form: form_property_code(converter, form_lines) for form, form_lines in properties.items()}
+        try:
+            output_tree = converter.visit(tree)
+        except FormPropertyError as err:
+            logging.getLogger(__name__).debug('converting %s from its code, cannot parse the property line %r', input_filename, err.args[0])
+            return None
+        if converter.class_properties:
+            logging.getLogger(__name__).debug('converting %s from its code, no class uses the properties of %s', input_filename, ', '.join(converter.class_properties))
+            return None
+    with timings.stage('format'):
+        return visitor, emit(output_tree)
+
+def find_full_path(pathname, start_directory):
+    pathname, failed = pathindex.resolve(pathname, start_directory)
+    return os.path.abspath(pathname), failed
 
 def read_vfp_project(pjxfile):
     directory = os.path.dirname(pjxfile)
-    with tempfile.NamedTemporaryFile() as tmpfile:
-        pass
-    tmpfile = tmpfile.name
-    dbffile = copy_obscured_dbf(pjxfile, 'pjt', tmpfile)
-
-    table = dbf.Table(dbffile)
-    table.open()
+    table = vfptable.Table(pjxfile, memo_filename(pjxfile, 'pjt'))
 
     files = {}
     main_file = ''
 
     for record in table:
-        if dbf.is_deleted(record) or record.exclude is None or record.exclude:
+        if record.deleted or record.exclude is None or record.exclude:
             continue
         name, failed = find_full_path(record.name.rstrip('\x00'), directory)
         if failed:
@@ -401,31 +600,144 @@ def read_vfp_project(pjxfile):
             main_file = os.path.basename(name).lower()
 
     table.close()
-    os.remove(table.filename)
-    os.remove(table.memoname)
 
     return files, main_file
 
-def convert_project(infile, directory):
+def init_project_worker(search_path, cache_dir, stream, parser_profile=False, peak_memory=False):
+    global SEARCH_PATH, CACHE_DIR, STREAM
+    SEARCH_PATH = search_path
+    CACHE_DIR = cache_dir
+    STREAM = stream
+    parseprofile.ENABLED = parser_profile
+    timings.MEMORY = peak_memory
+
+class DiagnosticHandler(logging.Handler):
+    '''collects the messages logged while a file is converted or a request runs'''
+
+    def __init__(self, level=logging.WARNING):
+        logging.Handler.__init__(self, level)
+        self.diagnostics = []
+
+    def emit(self, record):
+        diagnostic = {'level': record.levelname, 'message': record.getMessage()}
+        if record.exc_info:
+            diagnostic['traceback'] = ''.join(traceback.format_exception(*record.exc_info))
+        self.diagnostics.append(diagnostic)
+
+def convert_project_file(job):
+    '''Convert a file of a project and return its timings along with what was logged while converting it.
+
+    The messages are kept in the record instead of being written as they are
+    logged, so files converted at the same time by other workers do not mix
+    their output.'''
+    name, infile, outfile = job
+    timings.reset()
+    if timings.MEMORY:
+        timings.reset_peak_memory()
+    start = time.time()
+    error = None
+    logger = logging.getLogger()
+    handler = DiagnosticHandler(logger.getEffectiveLevel())
+    handlers = logger.handlers[:]
+    logger.handlers[:] = [handler]
+    try:
+        convert_file(infile, outfile)
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        logger.handlers[:] = handlers
+    record = timings.record(name, time.time() - start, error)
+    record['diagnostics'] = handler.diagnostics
+    if parseprofile.ENABLED:
+        record['parser_profile'] = parseprofile.take()
+    return name, error, record
+
+def prepare_project(infile, directory):
+    '''read a project, add its files to the search path and create the package directory its files are converted into'''
     project_files, main_file = read_vfp_project(infile)
     global SEARCH_PATH
     search = SEARCH_PATH
-    search += [project_files[name] for name in project_files]
+    search += [project_files[name] for name in sorted(project_files) if project_files[name] not in search]
     if not os.path.isdir(directory):
         os.mkdir(directory)
     directory = os.path.join(directory, os.path.basename(directory))
     if not os.path.isdir(directory):
         os.mkdir(directory)
-    for name in project_files:
-        outfile = directory
-        args = [project_files[name], outfile] + search
-        try:
+    SEARCH_PATH = search
+    project_jobs = [(name, project_files[name] or name, directory) for name in sorted(project_files)]
+    return project_files, main_file, directory, project_jobs
+
+def run_project_jobs(project_jobs, jobs=1):
+    '''convert the files of a project, in a pool of worker processes when jobs is not 1, returning the failures and timing records'''
+    if jobs < 1:
+        jobs = multiprocessing.cpu_count()
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, init_project_worker, (SEARCH_PATH, CACHE_DIR, STREAM, parseprofile.ENABLED, timings.MEMORY))
+        results = pool.imap(convert_project_file, project_jobs)
+    else:
+        pool = None
+        results = (convert_project_file(job) for job in project_jobs)
+    failures = []
+    records = []
+    try:
+        for name, error, record in results:
             print('processing {}'.format(name))
-            SEARCH_PATH = search
-            convert_file(project_files[name] or name, outfile)
-        except Exception as err:
-            logging.getLogger().exception(err)
-            print('failed to convert {}'.format(name))
+            for diagnostic in record.get('diagnostics', ()):
+                message = '{}: {}'.format(name, diagnostic['message'])
+                if 'traceback' in diagnostic:
+                    message += '\n' + diagnostic['traceback'].rstrip()
+                logging.getLogger(__name__).log(getattr(logging, diagnostic['level']), message)
+            if error:
+                failures.append((name, error))
+            records.append(record)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return failures, records
+
+def finish_project(project_files, main_file, directory, graph, failures, records):
+    '''report the files that failed and the timings, keep the conversion times in the graph and write the package files'''
+    profiles = [record.pop('parser_profile') for record in records if 'parser_profile' in record]
+    for name, error in failures:
+        logging.getLogger().error('failed to convert {}:\n{}'.format(name, error))
+    if failures:
+        print('failed to convert {} of {} files:'.format(len(failures), len(records)))
+        for name, error in failures:
+            print('    {}: {}'.format(name, error.strip().splitlines()[-1]))
+    diagnostics = [(record['file'], diagnostic) for record in records for diagnostic in record.get('diagnostics', ())
+                   if getattr(logging, diagnostic['level']) >= logging.WARNING]
+    if diagnostics:
+        print('{} warnings and errors logged while converting:'.format(len(diagnostics)))
+        for name, diagnostic in diagnostics:
+            print('    {}: {}'.format(name, diagnostic['message'].strip().splitlines()[0]))
+    if TIMINGS:
+        timings.write_report(TIMINGS, records)
+        timings.print_summary(records)
+    if PARSER_PROFILE:
+        write_parser_profile(profiles)
+    graph.record_costs(records)
+    if CACHE_DIR:
+        depgraph.save_graph(graph, CACHE_DIR)
+    if GRAPH:
+        graph.write(GRAPH)
+    write_project_package(project_files, main_file, directory)
+
+def write_parser_profile(profiles):
+    '''write the parser decisions recorded while converting to the PARSER_PROFILE report and list the slowest'''
+    profile = parseprofile.merge(profiles)
+    parseprofile.write_report(PARSER_PROFILE, profile, VisualFoxpro9Parser)
+    parseprofile.print_summary(profile, VisualFoxpro9Parser)
+
+def convert_project(infile, directory, jobs=1):
+    project_files, main_file, directory, project_jobs = prepare_project(infile, directory)
+    graph = depgraph.load_graph(infile, project_files, CACHE_DIR)
+    order = {name: i for i, name in enumerate(graph.schedule(project_files))}
+    project_jobs.sort(key=lambda job: order[job[0]])
+    failures, records = run_project_jobs(project_jobs, jobs)
+    finish_project(project_files, main_file, directory, graph, failures, records)
+
+def write_project_package(project_files, main_file, directory):
     if 'config.fpw' in project_files:
         with open(project_files['config.fpw']) as fid:
             import ConfigParser
@@ -437,7 +749,7 @@ def convert_project(infile, directory):
     else:
         config = {}
     name = os.path.splitext(main_file)[0]
-    with open(os.path.join(directory, '__main__.py'), 'wb') as fid:
+    with open(os.path.join(directory, '__main__.py'), 'w') as fid:
         import pprint
         pp = pprint.PrettyPrinter(indent=4)
         print('import {}'.format(name, name), file=fid)
@@ -445,24 +757,93 @@ def convert_project(infile, directory):
         print('config = {}'.format(pp.pformat(config)), file=fid)
         print(file=fid)
         print('{}.MAIN()'.format(name), file=fid)
-    with open(os.path.join(directory, '__init__.py'), 'wb') as fid:
+    with open(os.path.join(directory, '__init__.py'), 'w') as fid:
         pass
     directory = os.path.dirname(directory)
-    with open(os.path.join(directory, 'setup.py'), 'wb') as fid:
+    with open(os.path.join(directory, 'setup.py'), 'w') as fid:
         pass
 
 class ParseKill(antlr4.error.ErrorListener.ErrorListener):
     def syntaxError(self, parser, token, line, char, msg, unknown):
-        linetxt = token.getInputStream().strdata.splitlines()[line - 1].strip()
+        stream = parser.getTokenStream()
+        stream.fill()
+        text = ''.join(tok.text for tok in stream.tokens if tok.type != antlr4.Token.EOF)
+        linetxt = text.splitlines()[line - stream.tokens[0].line].strip()
         raise Exception('Syntax Error on line {}: {}'.format(line, linetxt))
 
-def run_parser(stream, parser, parser_start):
+def split_prg_tokens(tokens):
+    '''split the tokens of a program at each top level PROCEDURE and DEFINE CLASS'''
+    boundaries = []
+    line_start = 0
+    line = []
+    in_class = False
+    in_text = False
+    for i, token in enumerate(tokens):
+        if token.channel != antlr4.Token.DEFAULT_CHANNEL:
+            continue
+        if in_text:
+            # the lines of a TEXT block are text up to the first ENDTEXT
+            if token.type == VisualFoxpro9Lexer.ENDTEXT:
+                in_text = False
+                line = [token.type]
+            continue
+        if token.type == VisualFoxpro9Lexer.NL:
+            in_text = line[:1] == [VisualFoxpro9Lexer.TEXT] and (len(line) == 1 or line[1] in PRG_TEXT_OPTIONS)
+            line_start = i + 1
+            line = []
+            continue
+        line.append(token.type)
+        if line == [VisualFoxpro9Lexer.ENDDEFINE]:
+            in_class = False
+        elif not in_class and line in ([VisualFoxpro9Lexer.PROCEDURE], [VisualFoxpro9Lexer.SCOPE, VisualFoxpro9Lexer.PROCEDURE]):
+            boundaries.append(line_start)
+        elif not in_class and line == [VisualFoxpro9Lexer.DEFINE, VisualFoxpro9Lexer.CLASS]:
+            boundaries.append(line_start)
+            in_class = True
+    boundaries = sorted(set([0] + boundaries + [len(tokens)]))
+    return [tokens[start:stop] for start, stop in zip(boundaries, boundaries[1:])]
+
+def parse_prg_chunks(tokens):
+    '''parse each procedure and class on its own so only the chunks that need it fall back to LL'''
+    tree = None
+    for chunk in split_prg_tokens(tokens):
+        stream = antlr4.CommonTokenStream(ListTokenSource(chunk))
+        parser = VisualFoxpro9Parser(stream)
+        chunk_tree = run_parser(stream, parser, 'prg', split=False)
+        if tree is None:
+            tree = chunk_tree
+            continue
+        tree.removeLastChild()
+        for child in chunk_tree.children:
+            child.parentCtx = tree
+            tree.addChild(child)
+        tree.stop = chunk_tree.stop
+    return tree
+
+def run_parser(stream, parser, parser_start, split=True):
+    if parseprofile.ENABLED:
+        parseprofile.instrument(parser)
+    if split and parser_start == 'prg':
+        stream.fill()
+        try:
+            return parse_prg_chunks(stream.tokens)
+        except Exception:
+            for i, token in enumerate(stream.tokens):
+                token.tokenIndex = i
+            stream.reset()
+    if parser_start in exprparser.START_RULES:
+        tree = exprparser.parse(parser, parser_start)
+        if tree is not None:
+            return tree
     parser._interp.PredictionMode = antlr4.PredictionMode.SLL
     parser.removeErrorListeners()
     parser._errHandler = antlr4.error.ErrorStrategy.BailErrorStrategy()
     try:
         return getattr(parser, parser_start)()
     except antlr4.error.Errors.ParseCancellationException as err:
+        timings.count('ll_fallbacks')
+        if parseprofile.ENABLED:
+            parseprofile.sll_failure(parser, err)
         stream.reset();
         parser.reset();
         parser.addErrorListener(ParseKill())
@@ -470,53 +851,184 @@ def run_parser(stream, parser, parser_start):
         parser._interp.PredictionMode = antlr4.PredictionMode.LL
         return getattr(parser, parser_start)()
 
-def prg2py_after_preproc(data, parser_start, input_filename):
-    input_stream = antlr4.InputStream(data)
-    lexer = VisualFoxpro9Lexer(input_stream)
-    stream = antlr4.CommonTokenStream(lexer)
-    parser = VisualFoxpro9Parser(stream)
-    tree = run_parser(stream, parser, parser_start)
-    TreeCleanVisitor().visit(tree)
-    output_tree = PythonConvertVisitor(input_filename).visit(tree)
+def parse_code(data, parser_start, first_line=1):
+    with timings.stage('lex'):
+        lexer = VisualFoxpro9Lexer(antlr4.InputStream(data))
+        lexer.line = first_line
+        stream = antlr4.CommonTokenStream(lexer)
+        stream.fill()
+    return parse_stream(stream, parser_start)
+
+def parse_tokens(tokens, parser_start, first_line=1):
+    '''parse the tokens of preprocessed code as they are, without lexing the code again'''
+    with timings.stage('lex'):
+        stream = antlr4.CommonTokenStream(ListTokenSource(program_tokens(tokens, first_line)))
+        stream.fill()
+    return parse_stream(stream, parser_start)
+
+def parse_stream(stream, parser_start):
+    timings.count('tokens', len(stream.tokens))
+    with timings.stage('parse'):
+        parser = VisualFoxpro9Parser(stream)
+        return run_parser(stream, parser, parser_start)
+
+def convert_tree(tree, input_filename):
+    with timings.stage('convert'):
+        output_tree = PythonConvertVisitor(input_filename).visit(tree)
     if not isinstance(output_tree, list):
         return output_tree
-    output = add_indents(output_tree, 0)
-    options = autopep8.parse_args(['--max-line-length', '100000', '-'])
-    output = autopep8.fix_code(output, options)
-    tokens = list(tokenize.generate_tokens(io.StringIO(output).readline))
-    for i, token in enumerate(tokens):
-        token = list(token)
-        if token[0] == tokenize.STRING and token[1].startswith('u'):
-            token[1] = token[1][1:]
-        tokens[i] = tuple(token)
-    return tokenize.untokenize(tokens)
+    with timings.stage('format'):
+        return emit(output_tree)
+
+def prg2py_after_preproc(data, parser_start, input_filename):
+    return convert_tree(parse_code(data, parser_start), input_filename)
+
+def convert_tokens(tokens, parser_start, input_filename):
+    return convert_tree(parse_tokens(tokens, parser_start), input_filename)
 
 def prg2py(data, parser_start='prg', prepend_data='procedure _program_main\n', input_filename=''):
     tokens = preprocess_code(data).tokens
-    data = prepend_data + ''.join(token.text.replace('\r', '') for token in tokens)
-    return prg2py_after_preproc(data, parser_start, input_filename)
+    return convert_tokens(lex_code(prepend_data) + tokens, parser_start, input_filename)
+
+def scan_prg_lines(lines):
+    '''mark the lines of a program that start a top level procedure or class'''
+    in_class = in_text = continued = False
+    if_depth = 0
+    for line in lines:
+        start = None
+        if in_text:
+            in_text = not PRG_ENDTEXT.match(line)
+        elif not continued:
+            if PRG_IF.match(line):
+                if_depth += 1
+            elif PRG_ENDIF.match(line):
+                if_depth = max(if_depth - 1, 0)
+            elif PRG_TEXT.match(line):
+                in_text = True
+            elif in_class:
+                in_class = not PRG_ENDCLASS.match(line)
+            elif PRG_CLASS.match(line):
+                start = 'classDefStart'
+                in_class = True
+            elif PRG_PROCEDURE.match(line):
+                start = 'funcDefStart'
+        continued = line.rstrip().endswith(';')
+        yield line, start, if_depth == 0
+
+def prg_chunks(lines):
+    '''group the lines of a program into top level procedures and classes'''
+    chunk = []
+    for line, start, toplevel in scan_prg_lines(lines):
+        if start and toplevel and chunk:
+            yield ''.join(chunk)
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        yield ''.join(chunk)
 
-def convert_file(infile, outfile):
+def prg_definitions(lines, input_filename):
+    '''collect class and function names from the start lines of a program'''
+    visitor = PythonConvertVisitor(input_filename)
+    class_list = []
+    function_list = []
+    start_lines = []
+    for line, start, toplevel in scan_prg_lines(lines):
+        if start:
+            rule = start
+            start_lines = []
+        elif not start_lines:
+            continue
+        start_lines.append(line)
+        if not line.rstrip().endswith(';'):
+            tree = parse_code(''.join(start_lines).rstrip('\r\n') + '\n', rule)
+            names = class_list if rule == 'classDefStart' else function_list
+            names.append(visitor.visit(tree)[0])
+            start_lines = []
+    return class_list, function_list
+
+def convert_prg_stream(infile, outfile):
+    '''convert a program one top level procedure or class at a time so memory use is bounded by the largest one'''
+    input_filename = os.path.splitext(os.path.basename(infile))[0]
+    def read_lines(fid):
+        return itertools.chain(['procedure _program_main\n'], fid)
+    visitor = PythonConvertVisitor(input_filename)
+    with io.open(infile, encoding='cp1252', newline='') as fid:
+        visitor.class_list, visitor.function_list = prg_definitions(read_lines(fid), input_filename)
+    preprocessor = PreprocessVisitor()
+    emitter = Emitter(previous_logical='import')
+    first_line = 1
+    with io.open(infile, encoding='cp1252', newline='') as fid, tempfile.TemporaryFile() as body:
+        for i, chunk in enumerate(prg_chunks(read_lines(fid))):
+            with timings.stage('preprocess'):
+                tokens = preprocess_code(chunk, preprocessor).tokens
+            tree = parse_tokens(tokens, 'prg', first_line)
+            with timings.stage('convert'):
+                defs = visitor.prg_defs(tree, main=i == 0)
+            with timings.stage('format'):
+                lines = list(emitter.lines(defs))
+            with timings.stage('write'):
+                for line in lines:
+                    body.write((line + '\n').encode('utf-8'))
+            first_line += sum(token.text.count('\n') for token in tokens)
+        with timings.stage('write'), open(outfile, 'wb') as out:
+            out.write(('# coding=utf-8\n' + emit(visitor.prg_imports())).encode('utf-8'))
+            body.seek(0)
+            shutil.copyfileobj(body, out)
+            timings.count('output_bytes', out.tell())
+    return preprocessor.includes
+
+def output_filename(infile, directory):
+    '''name of the python file that a prg, mpr, spr, scx or vcx file is converted to in a directory'''
+    basename, file_ext = os.path.splitext(os.path.basename(infile).lower())
+    suffix = '' if file_ext == '.prg' else file_ext.replace('.', '_')
+    return os.path.join(directory, basename + suffix + '.py')
+
+def convert_file(infile, outfile, jobs=1):
+    '''convert a file, returning the (name, filename) pairs of the files it includes when it is code'''
     file_ext = os.path.splitext(infile.lower())[1]
     if file_ext == '.pjx':
-        convert_project(infile, outfile)
+        convert_project(infile, outfile, jobs=jobs)
         return
     elif file_ext in ('.prg', '.mpr', '.spr', '.scx', '.vcx'):
         if os.path.isdir(outfile):
-            basename = os.path.splitext(os.path.basename(infile).lower())[0]
-            suffix = '' if file_ext == '.prg' else file_ext.replace('.', '_')
-            name = basename + suffix + '.py'
-            outfile = os.path.join(outfile, name)
-            if os.path.isfile(outfile):
+            outfile = output_filename(infile, outfile)
+            if os.path.isfile(outfile) and not CACHE_DIR:
                 return
+        if STREAM and file_ext in ('.prg', '.mpr', '.spr'):
+            return convert_prg_stream(infile, outfile)
+        if CACHE_DIR:
+            cache = ConversionCache(CACHE_DIR)
+            source_files = [infile]
+            if file_ext in ('.scx', '.vcx'):
+                source_files.append(memo_filename(infile, {'.scx': 'sct', '.vcx': 'vct'}[file_ext]))
+            cache_key = cache.key([filename for filename in source_files if filename], SEARCH_PATH)
+            entry = cache.lookup(cache_key, which)
+            if entry is not None:
+                output = entry['output']
+                timings.count('cache_hits')
+                timings.count('output_bytes', len(output.encode('utf-8')))
+                with timings.stage('write'), open(outfile, 'wb') as fid:
+                    fid.write(output.encode('utf-8'))
+                return [(name, filename) for name, filename, digest in entry['includes']]
+        output = None
         if file_ext == '.scx':
-            data = convert_scx_to_vfp_code(infile)
-            tokens = preprocess_code(data).tokens
+            with timings.stage('read'):
+                lines = scx_form_lines(infile)
+            converted = convert_scx_lines(lines, os.path.splitext(os.path.basename(infile))[0])
+            if converted:
+                visitors, output = [converted[0]], converted[1]
+            else:
+                with timings.stage('preprocess'):
+                    visitors = [preprocess_code('\n'.join(line for line, owner in lines) + '\n')]
         elif file_ext == '.vcx':
-            datas = convert_vcx_to_vfp_code(infile)
-            tokens = [token for data in datas for token in preprocess_code(data).tokens]
+            with timings.stage('read'):
+                datas = convert_vcx_to_vfp_code(infile)
+            with timings.stage('preprocess'):
+                visitors = [preprocess_code(data) for data in datas]
         else:
-            tokens = preprocess_file(infile).tokens
+            with timings.stage('preprocess'):
+                visitors = [preprocess_file(infile)]
+        tokens = [token for visitor in visitors for token in visitor.tokens]
     elif file_ext in ('.frx', '.mnx', '.fll', '.app'):
         print('{} files not currently supported'.format(file_ext))
         return
@@ -527,11 +1039,14 @@ def convert_file(infile, outfile):
             name = os.path.basename(infile).lower()
             shutil.copy(infile, os.path.join(outfile, name))
         return
-    data = 'procedure _program_main\n' + ''.join(token.text.replace('\r', '') for token in tokens)
-    with tempfile.NamedTemporaryFile(suffix='.prg') as fid:
-        pass
-    with open(fid.name, 'wb') as fid:
-        fid.write(data.encode('cp1252'))
-    output = prg2py_after_preproc(data, 'prg', os.path.splitext(os.path.basename(infile))[0])
-    with open(outfile, 'wb') as fid:
-        fid.write(('# coding=utf-8\n' + output).encode('utf-8'))
+    if output is None:
+        tokens = lex_code('procedure _program_main\n') + tokens
+        output = convert_tokens(tokens, 'prg', os.path.splitext(os.path.basename(infile))[0])
+    output = '# coding=utf-8\n' + output
+    timings.count('output_bytes', len(output.encode('utf-8')))
+    with timings.stage('write'), open(outfile, 'wb') as fid:
+        fid.write(output.encode('utf-8'))
+    includes = [include for visitor in visitors for include in visitor.includes]
+    if CACHE_DIR:
+        cache.store(cache_key, includes, output)
+    return includes
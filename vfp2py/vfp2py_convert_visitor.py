@@ -11,16 +11,16 @@ import tokenize
 import keyword
 from collections import OrderedDict
 
-import isort
-
 import antlr4
 
 from .VisualFoxpro9Visitor import VisualFoxpro9Visitor
 
-from . import vfpfunc
-from .vfpfunc import DB
+from . import exprparser
+
+from .vfpnames import vfpfunc_names, database_names
 
 from .function_abbreviations import expander as function_expander
+from .emitter import sort_imports
 
 if sys.version_info < (3,):
     str=unicode
@@ -28,6 +28,13 @@ if sys.version_info < (3,):
     def chr(x):
         return CHR(x).decode('ascii')
 
+PRG_IMPORTS = [
+    'from __future__ import division, print_function',
+    'from vfp2py import vfpfunc',
+    'from vfp2py.vfpfunc import DB, Array, C, F, M, S',
+    'from vfp2py.vfpfunc import parameters, lparameters, vfpclass',
+]
+
 class CodeStr(str):
     def __repr__(self):
         return str(self)
@@ -126,6 +133,63 @@ def add_args_to_code(codestr, args):
 def valid_identifier(name):
     return re.match(tokenize.Name + '$', name) and not keyword.iskeyword(name)
 
+def contains_exceptions(ctx):
+    return (isinstance(ctx, ctx.parser.AtomExprContext) and ctx.trailer() and isinstance(ctx.trailer(), ctx.parser.FuncCallTrailerContext)) or \
+           isinstance(ctx, ctx.parser.ConstantExprContext) or \
+           isinstance(ctx, ctx.parser.SubExprContext) or \
+           any(contains_exceptions(c) for c in ctx.children if isinstance(c, ctx.parser.ExprContext))
+
+def special_pathname(ctx):
+    '''the pathname a special expression written without spaces, function calls, constants or parentheses is read as'''
+    start, stop = ctx.getSourceInterval()
+    stream = ctx.parser.getTokenStream()
+    if any(tok.type == ctx.parser.WS for tok in stream.tokens[start:stop+1]) or contains_exceptions(ctx):
+        return None
+    pathname = exprparser.pathname(ctx.parser, start, stop)
+    if pathname is None:
+        stream.seek(start)
+        pathname = type(ctx.parser)(stream).pathname()
+        while pathname.children and pathname.children[-1].getSourceInterval()[0] > stop:
+            pathname.removeLastChild()
+    return pathname
+
+def inner_expr(ctx):
+    while isinstance(ctx, ctx.parser.SubExprContext):
+        ctx = ctx.expr()
+    return ctx
+
+FUNCTION_RENAMES = {
+    'at_c': 'at',
+    'atcc': 'atc',
+    'atcline': 'atline',
+    'chrtranc': 'chrtran',
+    'leftc': 'left',
+    'lenc': 'len',
+    'likec': 'like',
+    'ratc': 'rat',
+    'rightc': 'right',
+    'select': 'select_function',
+    'stuffc': 'stuff',
+    'substrc': 'substr',
+    'sys': 'vfp_sys',
+}
+FUNCTION_ALIASES = dict(FUNCTION_RENAMES)
+FUNCTION_ALIASES.update((abbr, FUNCTION_RENAMES.get(name, name)) for abbr, name in function_expander.items())
+FUNCTION_HANDLERS = {}
+
+def converts_function(*funcnames):
+    '''Register a method as the conversion of calls to the given functions.
+
+    The method is called with the function name, the list of converted
+    arguments and the keyword arguments. It returns the converted call, or
+    None to have the call converted as a call into the runtime after it has
+    adjusted the arguments.'''
+    def register(method):
+        for funcname in funcnames:
+            FUNCTION_HANDLERS[funcname] = method
+        return method
+    return register
+
 class PythonConvertVisitor(VisualFoxpro9Visitor):
     def __init__(self, filename):
         super(PythonConvertVisitor, self).__init__()
@@ -137,6 +201,7 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
         self.class_list = []
         self.function_list = []
         self.skip_extract = False
+        self.class_properties = {}
 
     def visit(self, ctx):
         if ctx:
@@ -162,16 +227,19 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
         if ctx.funcDef():
             self.function_list = [self.visit(funcdef.funcDefStart())[0] for funcdef in ctx.funcDef()]
 
-        self.imports = ['from __future__ import division, print_function']
-        self.imports.append('from vfp2py import vfpfunc')
-        self.imports.append('from vfp2py.vfpfunc import DB, Array, C, F, M, S')
-        self.imports.append('from vfp2py.vfpfunc import parameters, lparameters, vfpclass')
-        defs = []
+        self.imports = []
+        defs = self.prg_defs(ctx)
+        return self.prg_imports() + defs
+
+    def prg_imports(self):
+        return [CodeStr(imp) for imp in sort_imports(PRG_IMPORTS + self.imports)]
 
+    def prg_defs(self, ctx, main=True):
+        defs = []
         for i, child in enumerate(ctx.children):
             if isinstance(child, ctx.parser.FuncDefContext):
                 funcname, decorator, funcbody = self.visit(child)
-                if i == 0 and funcname == '_program_main':
+                if main and i == 0 and funcname == '_program_main':
                     funcname = CodeStr('MAIN')
                 defs += [
                     add_args_to_code('@{}', (decorator,)),
@@ -182,9 +250,7 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
                     defs += sum((self.visit(comment) for comment in child.lineComment()), [])
             elif not isinstance(child, antlr4.tree.Tree.TerminalNodeImpl):
                 defs += self.visit(child)
-
-        imports = isort.SortImports(file_contents='\n'.join(set(self.imports)), line_length=100000).output.splitlines()
-        return  [CodeStr(imp) for imp in imports] + defs
+        return defs
 
     def visitLine(self, ctx):
         try:
@@ -195,9 +261,8 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
                 else:
                     raise Exception('just to jump to except block')
         except Exception as err:
-            logging.getLogger(__name__).exception(str(err))
             lines = self.getCtxText(ctx)
-            print(lines)
+            logging.getLogger(__name__).exception('could not convert "{}": {}'.format(' '.join(lines.split()), err))
             retval = [CodeStr('#FIX ME: {}'.format(line)) for line in lines.split('\n') if line]
         return retval if isinstance(retval, list) else [retval]
 
@@ -217,7 +282,10 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
         return [CodeStr(fixer.sub(repl, comment)) for comment in comments]
 
     def visitLines(self, ctx):
-        retval = sum((self.visit(line) for line in ctx.line()), [])
+        return self.lines_code(ctx.line())
+
+    def lines_code(self, lines):
+        retval = sum((self.visit(line) for line in lines), [])
         def badline(line):
             return line.startswith('#') or not line if hasattr(line, 'startswith') else not line
         if not retval or all(badline(l) for l in retval):
@@ -228,7 +296,7 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
         return self.visitLines(ctx)
 
     def modify_superclass(self, supername):
-        if hasattr(vfpfunc, supername):
+        if supername in vfpfunc_names():
             supername = add_args_to_code('{}.{}', (CodeStr('vfpfunc'), supername))
         elif supername in self.class_list:
             supername = add_args_to_code('{}Type()', (supername,))
@@ -236,18 +304,23 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
             supername = add_args_to_code('C[{}]', (str(supername),))
         return supername
 
+    def class_property_assignments(self, stmt):
+        if isinstance(stmt, stmt.parser.LineCommentContext):
+            return self.visit(stmt)
+        return [CodeStr('self.' + ident + value) for (ident, value) in self.visitClassAssign(stmt) if '.' not in ident]
+
     def visitClassDef(self, ctx):
         assignments = []
         subclasses = {}
 
+        assignments += self.class_properties.pop(ctx.classDefStart().identifier().getText().lower(), ())
+
         funcdefs = [x.funcDef() for x in ctx.classProperty() if x.funcDef()]
         classassigns = [self.visitClassAssign(stmt.cmd()) for stmt in ctx.classProperty() if isinstance(stmt.cmd(), ctx.parser.AssignContext)]
         for stmt in ctx.classProperty():
             stmt = stmt.lineComment() or stmt.cmd()
-            if isinstance(stmt, ctx.parser.LineCommentContext):
-                assignments += self.visit(stmt)
-            elif isinstance(stmt, ctx.parser.AssignContext):
-                assignments += [CodeStr('self.' + ident + value) for (ident, value) in self.visitClassAssign(stmt) if '.' not in ident]
+            if isinstance(stmt, (ctx.parser.LineCommentContext, ctx.parser.AssignContext)):
+                assignments += self.class_property_assignments(stmt)
             elif isinstance(stmt, ctx.parser.AddObjectContext):
                 name, obj = self.visit(stmt)
                 for assignment in classassigns:
@@ -330,7 +403,7 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
         if len(names) < 2:
             names.append('Custom')
         classname, supername = names
-        if hasattr(vfpfunc, classname):
+        if classname in vfpfunc_names():
             raise Exception(str(classname) + ' is a reserved classname')
         supername = self.modify_superclass(supername)
         return classname, supername
@@ -375,6 +448,7 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
 
     def visitFuncDef(self, ctx):
         name, parameters = self.visit(ctx.funcDefStart())
+        parameter_line = None
         if parameters:
             parameter_type = 'l'
         else:
@@ -383,13 +457,8 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
                 parameter_cmd = parameter_line.cmd()
                 parameter_type = parameter_cmd.PARAMETER().symbol.text.lower()[0]
                 parameters = [self.visit_with_disabled_scope(p)[0] for p in parameter_cmd.declarationItem()]
-                lines = ctx.lines()
-                children = [c for c in lines.children if c is not parameter_line]
-                while lines.children:
-                    lines.removeLastChild()
-                for child in children:
-                    lines.addChild(child)
             except (StopIteration, AttributeError):
+                parameter_line = None
                 parameters = []
                 parameter_type = 'l'
         if parameter_type != 'l':
@@ -400,7 +469,8 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
         global FUNCNAME
         FUNCNAME = name
 #        body = self.modify_func_body(self.visit(ctx.lines()))
-        body = self.visit(ctx.lines())
+        # the tree is left as it is so converting it again gives the same code
+        body = self.lines_code(line for line in ctx.lines().line() if line is not parameter_line)
         return name, decorator, body
 
     def visitPrintStmt(self, ctx):
@@ -419,7 +489,7 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
             func = make_func_code('print', self.visit(ctx.sayExpr))
         else:
             func = make_func_code('print')
-        return add_args_to_code('{} # {}', [func, CodeStr(self.getCtxText(ctx))])
+        return add_args_to_code('{}  # {}', [func, CodeStr(self.getCtxText(ctx))])
 
     def visitIfStart(self, ctx):
         return self.visit(ctx.expr())
@@ -570,7 +640,7 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
             if len(trailer) > 0 and isinstance(trailer[-1], list):
                 identifier = self.visit(ctx.idAttr()[0].identifier())
                 arg = self.createIdAttr(identifier, trailer[:-1])
-                args.append('{}[{}]'.format(arg, ','.join(repr(x) for x in trailer[-1])))
+                args.append('{}[{}]'.format(arg, ', '.join(repr(x) for x in trailer[-1])))
             else:
                 args.append(self.visit(var))
         if len(args) == 1:
@@ -623,351 +693,460 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
         return AndExpr(left, right)
 
     def visitUnaryNegation(self, ctx):
-        return add_args_to_code('{}' if ctx.op.type == ctx.parser.PLUS_SIGN else '-{}', (self.visit(ctx.expr()),))
+        return self.unary_negation(ctx, False)
+
+    def unary_negation(self, ctx, negated):
+        # a minus followed by another sign drops both signs, and is dropped itself when a minus comes before it
+        expr = ctx.expr()
+        minus = ctx.op.type == ctx.parser.MINUS_SIGN
+        if isinstance(expr, ctx.parser.UnaryNegationContext):
+            return self.unary_negation(expr, minus)
+        return add_args_to_code('-{}' if minus and not negated else '{}', (self.visit(expr),))
 
     def visitBooleanNegation(self, ctx):
         return NotExpr(self.visit(ctx.expr()))
 
     def func_call(self, funcname, *args, **kwargs):
         funcname = str(funcname)
-        funcname = function_expander.get(funcname, funcname)
+        funcname = FUNCTION_ALIASES.get(funcname, funcname)
         if not kwargs and len(args) == 1 and isinstance(args[0], (list, tuple)):
             args = args[0]
         args = list(args)
-        funcname = {
-            'at_c': 'at',
-            'atcc': 'atc',
-            'atcline': 'atline',
-            'chrtranc': 'chrtran',
-            'leftc': 'left',
-            'lenc': 'len',
-            'likec': 'like',
-            'ratc': 'rat',
-            'rightc': 'right',
-            'select': 'select_function',
-            'stuffc': 'stuff',
-            'substrc': 'substr',
-            'sys': 'vfp_sys',
-        }.get(funcname, funcname)
         if funcname == 'dodefault':
             return make_func_code('super(type(self), self).{}'.format(FUNCNAME), *args)
         if funcname in self.function_list:
             return make_func_code(funcname, *args)
-        if funcname == 'chr' and len(args) == 1:
+        handler = FUNCTION_HANDLERS.get(funcname)
+        if handler:
+            retval = handler(self, funcname, args, kwargs)
+            if retval is not None:
+                return retval
+        if funcname in vfpfunc_names():
+            funcname = 'vfpfunc.' + funcname
+        elif funcname in database_names():
+            funcname = 'DB.' + funcname
+        else:
+            funcname = self.scopeId(funcname, 'func')
+        return make_func_code(funcname, *args)
+
+    @converts_function('chr')
+    def convert_chr(self, funcname, args, kwargs):
+        if len(args) == 1:
             return chr(int(args[0]))
-        if funcname == 'val' and len(args) == 1:
+
+    @converts_function('val')
+    def convert_val(self, funcname, args, kwargs):
+        if len(args) == 1:
             return float(args[0])
-        if funcname == 'space' and len(args) == 1:
+
+    @converts_function('space')
+    def convert_space(self, funcname, args, kwargs):
+        if len(args) == 1:
             args[0] = int(args[0])
             if isinstance(args[0], int) and args[0] > 8:
                 args[0] = CodeStr(args[0])
             return args[0] * ' '
-        if funcname == 'asc':
-            return make_func_code('ord', CodeStr(str(repr(args[0])) + '[0]'))
-        if funcname == 'len':
+
+    @converts_function('asc')
+    def convert_asc(self, funcname, args, kwargs):
+        return make_func_code('ord', CodeStr(str(repr(args[0])) + '[0]'))
+
+    @converts_function('len')
+    def convert_len(self, funcname, args, kwargs):
+        return make_func_code('len', *args)
+
+    @converts_function('alen')
+    def convert_alen(self, funcname, args, kwargs):
+        if len(args) == 1:
             return make_func_code('len', *args)
-        if funcname == 'alen':
-            if len(args) == 1:
-                return make_func_code('len', *args)
-            else:
-                args[1] = int(args[1])
-                return add_args_to_code('{}.alen({})', args)
-        if funcname == 'ascan':
-            if len(args) == 3:
-                args = [add_args_to_code('{}[{}:]', [args[0], args[2]]), args[1]]
-            elif len(args) == 4:
-                args = [add_args_to_code('{}[{}:({} + {})]', [args[0], args[2], args[2], args[3]]), args[1]]
-            if len(args) == 2:
-                return add_args_to_code('{}.index({})', args)
-        if funcname == 'ains':
-            return make_func_code(add_args_to_code('{}.insert', args[:1]), *([None] + args[1:]))
-        if funcname == 'afields':
-            localscode = make_func_code('locals')
-            arrname = args.pop(0)
-            if not args:
-                args.append(None)
-            replace_string = 'S.'
-            if arrname.startswith(replace_string):
-                arrname = str(arrname[len(replace_string):]) #FIXME
-            else:
-                arrname = str(arrname)
-            args.append(arrname)
-            args.append((localscode, CodeStr('S')))
-        if funcname == 'acopy':
-            func = add_args_to_code('{}.copy', (args[0],))
-            arrname = args[1]
-            replace_string = 'S.'
-            if arrname.startswith(replace_string):
-                arrname = str(arrname[len(replace_string):]) #FIXME
-            else:
-                arrname = str(arrname)
-            return make_func_code(func, arrname, *args[2:])
-        if funcname == 'empty':
-            return add_args_to_code('(not {} if {} is not None else False)', args + args)
-        if funcname == 'occurs':
-            return add_args_to_code('{}.count({})', reversed(args))
-        if funcname in ('atc',):
-            funcname = funcname[:-1]
-            args[0] = add_args_to_code('{}.lower()', [args[0]])
-            args[1] = add_args_to_code('{}.lower()', [args[1]])
-        if funcname in ('at', 'rat'):
-            funcname = {
-                'at': 'find',
-                'rat': 'rfind',
-            }[funcname]
-            return add_args_to_code('{}.{}({})', [args[1], CodeStr(funcname), args[0]]) + 1
-        if funcname == 'replicate' and len(args) == 2:
+        else:
+            args[1] = int(args[1])
+            return add_args_to_code('{}.alen({})', args)
+
+    @converts_function('ascan')
+    def convert_ascan(self, funcname, args, kwargs):
+        if len(args) == 3:
+            args = [add_args_to_code('{}[{}:]', [args[0], args[2]]), args[1]]
+        elif len(args) == 4:
+            args = [add_args_to_code('{}[{}:({} + {})]', [args[0], args[2], args[2], args[3]]), args[1]]
+        if len(args) == 2:
+            return add_args_to_code('{}.index({})', args)
+
+    @converts_function('ains')
+    def convert_ains(self, funcname, args, kwargs):
+        return make_func_code(add_args_to_code('{}.insert', args[:1]), *([None] + args[1:]))
+
+    @converts_function('afields')
+    def convert_afields(self, funcname, args, kwargs):
+        localscode = make_func_code('locals')
+        arrname = args.pop(0)
+        if not args:
+            args.append(None)
+        replace_string = 'S.'
+        if arrname.startswith(replace_string):
+            arrname = str(arrname[len(replace_string):]) #FIXME
+        else:
+            arrname = str(arrname)
+        args.append(arrname)
+        args.append((localscode, CodeStr('S')))
+
+    @converts_function('acopy')
+    def convert_acopy(self, funcname, args, kwargs):
+        func = add_args_to_code('{}.copy', (args[0],))
+        arrname = args[1]
+        replace_string = 'S.'
+        if arrname.startswith(replace_string):
+            arrname = str(arrname[len(replace_string):]) #FIXME
+        else:
+            arrname = str(arrname)
+        return make_func_code(func, arrname, *args[2:])
+
+    @converts_function('empty')
+    def convert_empty(self, funcname, args, kwargs):
+        return add_args_to_code('(not {} if {} is not None else False)', args + args)
+
+    @converts_function('occurs')
+    def convert_occurs(self, funcname, args, kwargs):
+        return add_args_to_code('{}.count({})', reversed(args))
+
+    @converts_function('atc')
+    def convert_atc(self, funcname, args, kwargs):
+        args[0] = add_args_to_code('{}.lower()', [args[0]])
+        args[1] = add_args_to_code('{}.lower()', [args[1]])
+        return self.convert_at('at', args, kwargs)
+
+    @converts_function('at', 'rat')
+    def convert_at(self, funcname, args, kwargs):
+        funcname = {
+            'at': 'find',
+            'rat': 'rfind',
+        }[funcname]
+        return add_args_to_code('{}.{}({})', [args[1], CodeStr(funcname), args[0]]) + 1
+
+    @converts_function('replicate')
+    def convert_replicate(self, funcname, args, kwargs):
+        if len(args) == 2:
             args[1] = int(args[1])
             return add_args_to_code('{}', args[:1]) * add_args_to_code('{}', args[1:])
-        if funcname in ('date', 'datetime', 'time', 'dtot'):
-            self.imports.append('import datetime as dt')
-            if len(args) == 0:
-                if funcname == 'date':
-                    return make_func_code('dt.datetime.now().date')
-                elif funcname == 'datetime':
-                    return make_func_code('dt.datetime.now')
-                elif funcname == 'time':
-                    return make_func_code('dt.datetime.now().time().strftime', '%H:%M:%S')
-            else:
-                if funcname == 'date':
-                    return make_func_code('dt.date', *args)
-                elif funcname == 'datetime':
-                    return make_func_code('dt.datetime', *args)
-                elif funcname == 'time':
-                    return add_args_to_code('{}[:11]', [make_func_code('dt.datetime.now().time().strftime', '%H:%M:%S.%f')])
-            if funcname == 'dtot':
-                return make_func_code('dt.datetime.combine', args[0], make_func_code('dt.datetime.min.time'))
-        if funcname in ('year', 'month', 'day', 'hour', 'minute', 'sec', 'dow', 'cdow', 'cmonth', 'dmy'):
-            self.imports.append('import datetime as dt')
-            funcname = {
-                'sec': 'second',
-                'dow': 'weekday()',
-                'cdow': "strftime('%A')",
-                'cmonth': "strftime('%B')",
-                'dmy': "strftime('%d %B %Y')",
-            }.get(funcname, funcname)
-            retval = add_args_to_code('{}.{}', [args[0], CodeStr(funcname)])
-            if funcname == 'weekday()':
-                return make_func_code('vfpfunc.dow_fix', retval, *args[1:])
-            return retval
-        if funcname in ('dtoc', 'dtos'):
-            if len(args) == 1 or args[1] == 1:
-                if len(args) < 2:
-                    args.append('')
-                if args[1] == 1 or funcname == 'dtos':
-                    if args[0] == 'dt.datetime.now()':
-                        args[1] = '%Y%m%d%H%M%S'
-                    elif args[0] == 'dt.datetime.now().date()':
-                        args[0] = CodeStr('dt.datetime.now()')
-                        args[1] = '%Y%m%d'
-                    else:
-                        return make_func_code('vfpfunc.dtos', args[0])
+
+    @converts_function('date', 'datetime', 'time', 'dtot')
+    def convert_date(self, funcname, args, kwargs):
+        self.imports.append('import datetime as dt')
+        if len(args) == 0:
+            if funcname == 'date':
+                return make_func_code('dt.datetime.now().date')
+            elif funcname == 'datetime':
+                return make_func_code('dt.datetime.now')
+            elif funcname == 'time':
+                return make_func_code('dt.datetime.now().time().strftime', '%H:%M:%S')
+        else:
+            if funcname == 'date':
+                return make_func_code('dt.date', *args)
+            elif funcname == 'datetime':
+                return make_func_code('dt.datetime', *args)
+            elif funcname == 'time':
+                return add_args_to_code('{}[:11]', [make_func_code('dt.datetime.now().time().strftime', '%H:%M:%S.%f')])
+        return make_func_code('dt.datetime.combine', args[0], make_func_code('dt.datetime.min.time'))
+
+    @converts_function('year', 'month', 'day', 'hour', 'minute', 'sec', 'dow', 'cdow', 'cmonth', 'dmy')
+    def convert_date_part(self, funcname, args, kwargs):
+        self.imports.append('import datetime as dt')
+        funcname = {
+            'sec': 'second',
+            'dow': 'weekday()',
+            'cdow': "strftime('%A')",
+            'cmonth': "strftime('%B')",
+            'dmy': "strftime('%d %B %Y')",
+        }.get(funcname, funcname)
+        retval = add_args_to_code('{}.{}', [args[0], CodeStr(funcname)])
+        if funcname == 'weekday()':
+            return make_func_code('vfpfunc.dow_fix', retval, *args[1:])
+        return retval
+
+    @converts_function('dtoc', 'dtos')
+    def convert_dtoc(self, funcname, args, kwargs):
+        if len(args) == 1 or args[1] == 1:
+            if len(args) < 2:
+                args.append('')
+            if args[1] == 1 or funcname == 'dtos':
+                if args[0] == 'dt.datetime.now()':
+                    args[1] = '%Y%m%d%H%M%S'
+                elif args[0] == 'dt.datetime.now().date()':
+                    args[0] = CodeStr('dt.datetime.now()')
+                    args[1] = '%Y%m%d'
                 else:
-                    return make_func_code('vfpfunc.dtoc', args[0])
-                return make_func_code('{}.{}'.format(args[0], 'strftime'), args[1])
-        if funcname == 'iif' and len(args) == 3:
+                    return make_func_code('vfpfunc.dtos', args[0])
+            else:
+                return make_func_code('vfpfunc.dtoc', args[0])
+            return make_func_code('{}.{}'.format(args[0], 'strftime'), args[1])
+
+    @converts_function('iif')
+    def convert_iif(self, funcname, args, kwargs):
+        if len(args) == 3:
             return add_args_to_code('({} if {} else {})', [args[i] for i in (1, 0, 2)])
-        if funcname == 'between':
-            return add_args_to_code('({} <= {} <= {})', [args[i] for i in (1, 0, 2)])
-        if funcname == 'nvl':
-            return add_args_to_code('({} if {} is not None else {})', [args[0], args[0], args[1]])
-        if funcname == 'evl':
-            return add_args_to_code('({} or {})', args)
-        if funcname == 'sign':
-            return add_args_to_code('1 if {} > 0 else (-1 if {} < 0 else 0)', [args[0], args[0]])
-        if funcname in ('alltrim', 'ltrim', 'rtrim', 'lower', 'upper', 'padr', 'padl', 'padc', 'proper'):
-            funcname = {
-                'alltrim': 'strip',
-                'ltrim': 'lstrip',
-                'rtrim': 'rstrip',
-                'padr': 'ljust',
-                'padl': 'rjust',
-                'padc': 'center',
-                'proper': 'title',
-            }.get(funcname, funcname)
-            funcname = '{}.{}'.format(repr(args[0]), funcname)
-            return make_func_code(funcname, *args[1:])
-        if funcname == 'strtran':
-            args = args[:6]
-            if len(args) > 3:
-                args[3:] = [int(arg) for arg in args[3:]]
-            if len(args) == 6 and int(args[5]) in (0, 2):
-                args.pop()
-            if len(args) == 2:
-                args.append('')
-            str_replace = add_args_to_code('{}.replace', [args[0]])
-            if len(args) == 3:
-                return make_func_code(str_replace, *args[1:])
-            elif len(args) == 4 and args[3] < 2:
-                args.pop()
-                return make_func_code(str_replace, *args[1:])
-            elif len(args) == 5 and args[3] < 2:
-                args[3] = args[4]
-                args.pop()
-                return make_func_code(str_replace, *args[1:])
-        if funcname == 'strconv' and len(args) == 2:
+
+    @converts_function('between')
+    def convert_between(self, funcname, args, kwargs):
+        return add_args_to_code('({} <= {} <= {})', [args[i] for i in (1, 0, 2)])
+
+    @converts_function('nvl')
+    def convert_nvl(self, funcname, args, kwargs):
+        return add_args_to_code('({} if {} is not None else {})', [args[0], args[0], args[1]])
+
+    @converts_function('evl')
+    def convert_evl(self, funcname, args, kwargs):
+        return add_args_to_code('({} or {})', args)
+
+    @converts_function('sign')
+    def convert_sign(self, funcname, args, kwargs):
+        return add_args_to_code('1 if {} > 0 else (-1 if {} < 0 else 0)', [args[0], args[0]])
+
+    @converts_function('alltrim', 'ltrim', 'rtrim', 'lower', 'upper', 'padr', 'padl', 'padc', 'proper')
+    def convert_string_method(self, funcname, args, kwargs):
+        funcname = {
+            'alltrim': 'strip',
+            'ltrim': 'lstrip',
+            'rtrim': 'rstrip',
+            'padr': 'ljust',
+            'padl': 'rjust',
+            'padc': 'center',
+            'proper': 'title',
+        }.get(funcname, funcname)
+        funcname = '{}.{}'.format(repr(args[0]), funcname)
+        return make_func_code(funcname, *args[1:])
+
+    @converts_function('strtran')
+    def convert_strtran(self, funcname, args, kwargs):
+        del args[6:]
+        if len(args) > 3:
+            args[3:] = [int(arg) for arg in args[3:]]
+        if len(args) == 6 and int(args[5]) in (0, 2):
+            args.pop()
+        if len(args) == 2:
+            args.append('')
+        str_replace = add_args_to_code('{}.replace', [args[0]])
+        if len(args) == 3:
+            return make_func_code(str_replace, *args[1:])
+        elif len(args) == 4 and args[3] < 2:
+            args.pop()
+            return make_func_code(str_replace, *args[1:])
+        elif len(args) == 5 and args[3] < 2:
+            args[3] = args[4]
+            args.pop()
+            return make_func_code(str_replace, *args[1:])
+
+    @converts_function('strconv')
+    def convert_strconv(self, funcname, args, kwargs):
+        if len(args) == 2:
             self.imports.append('import base64')
             if args[1] == 13:
                 return make_func_code('base64.b64encode', args[0])
             if args[1] == 14:
                 return make_func_code('base64.b64decode', args[0])
-        if funcname == 'right':
-            args[1] = int(args[1])
-            return add_args_to_code('{}[-{}:]', args)
-        if funcname == 'left' and len(args) == 2:
+
+    @converts_function('right')
+    def convert_right(self, funcname, args, kwargs):
+        args[1] = int(args[1])
+        return add_args_to_code('{}[-{}:]', args)
+
+    @converts_function('left')
+    def convert_left(self, funcname, args, kwargs):
+        if len(args) == 2:
             args[1] = int(args[1])
             return add_args_to_code('{}[:{}]', args)
-        if funcname == 'substr':
-            args[1:] = [int(arg) for arg in args[1:]]
-            args[1] -= 1
-            if len(args) < 3:
-                return add_args_to_code('{}[{}:]', args)
-            if args[2] == 1:
-                return add_args_to_code('{}[{}]', args[:2])
-            if args[1] == 0:
-               return add_args_to_code('{}[:{}]', (args[0], args[2]))
-            args[2] += args[1]
-            return add_args_to_code('{}[{}:{}]', args)
-        if funcname == 'getenv':
-            args.append('')
-            args[0] = args[0].upper() if string_type(args[0]) else add_args_to_code('{}.upper()', args[0])
-            return make_func_code('os.environ.get', *args)
-        if funcname == 'getwordcount':
-            if len(args) < 2:
-                args.append(CodeStr(''))
-            return add_args_to_code('len([w for w in {}.split({}) if w])', args)
-        if funcname == 'rand':
-            self.imports.append('import random')
-            return make_func_code('random.random')
-        if funcname in ('ceiling', 'exp', 'log', 'log10', 'sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2', 'pi', 'sqrt', 'dtor', 'rtod'):
-            self.imports.append('import math')
-            if funcname == 'pi':
-                return CodeStr('math.pi')
-            funcname = {
-                'ceiling': 'ceil',
-                'atn2': 'atan2',
-                'rtod': 'degrees',
-                'dtor': 'radians',
-            }.get(funcname, funcname)
-            funcname = 'math.' + funcname
-            return make_func_code(funcname, *args)
-        if funcname in ('bitand', 'bitclear', 'bitlshift', 'bitnot', 'bitor', 'bitrshift', 'bitset', 'bittest', 'bitxor'):
-            op = {
-                'bitand': '({} & {})',
-                'bitclear': '({} & ((1 << {}) ^ 0xffffffff))',
-                'bitlshift': '({} << {})',
-                'bitnot': '~{}',
-                'bitor': '({} | {})',
-                'bitrshift': '({} >> {})',
-                'bitset': '({} | (1 << {}))',
-                'bittest': '(({} & (1 << {})) > 0)',
-                'bitxor': '({} ^ {})'
-            }
-            return add_args_to_code(op[funcname], [int(arg) for arg in args])
-        if funcname in ('abs', 'round', 'max', 'min'):
-            return make_func_code(funcname, *args)
-        if funcname == 'mod':
-            return add_args_to_code('({} % {})', args)
-        if funcname == 'int':
-            return int(args[0])
-        if funcname == 'isnull':
-            return add_args_to_code('{} == {}', [args[0], None])
-        if funcname in ('isalpha', 'islower', 'isdigit', 'isupper'):
-            return add_args_to_code('{}[:1].{}()', [args[0], CodeStr(funcname)])
-        if funcname == 'inlist':
-            return add_args_to_code('({} in {})', [args[0], tuple(args[1:])])
-        if funcname == 'parameters':
-            return CodeStr('vfpfunc.PARAMETERS')
-        if funcname == 'pythonfunctioncall' and len(args) == 3:
+
+    @converts_function('substr')
+    def convert_substr(self, funcname, args, kwargs):
+        args[1:] = [int(arg) for arg in args[1:]]
+        args[1] -= 1
+        if len(args) < 3:
+            return add_args_to_code('{}[{}:]', args)
+        if args[2] == 1:
+            return add_args_to_code('{}[{}]', args[:2])
+        if args[1] == 0:
+           return add_args_to_code('{}[:{}]', (args[0], args[2]))
+        args[2] += args[1]
+        return add_args_to_code('{}[{}:{}]', args)
+
+    @converts_function('getenv')
+    def convert_getenv(self, funcname, args, kwargs):
+        args.append('')
+        args[0] = args[0].upper() if string_type(args[0]) else add_args_to_code('{}.upper()', args[0])
+        return make_func_code('os.environ.get', *args)
+
+    @converts_function('getwordcount')
+    def convert_getwordcount(self, funcname, args, kwargs):
+        if len(args) < 2:
+            args.append(CodeStr(''))
+        return add_args_to_code('len([w for w in {}.split({}) if w])', args)
+
+    @converts_function('rand')
+    def convert_rand(self, funcname, args, kwargs):
+        self.imports.append('import random')
+        return make_func_code('random.random')
+
+    @converts_function('ceiling', 'exp', 'log', 'log10', 'sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2', 'pi', 'sqrt', 'dtor', 'rtod')
+    def convert_math(self, funcname, args, kwargs):
+        self.imports.append('import math')
+        if funcname == 'pi':
+            return CodeStr('math.pi')
+        funcname = {
+            'ceiling': 'ceil',
+            'atn2': 'atan2',
+            'rtod': 'degrees',
+            'dtor': 'radians',
+        }.get(funcname, funcname)
+        funcname = 'math.' + funcname
+        return make_func_code(funcname, *args)
+
+    @converts_function('bitand', 'bitclear', 'bitlshift', 'bitnot', 'bitor', 'bitrshift', 'bitset', 'bittest', 'bitxor')
+    def convert_bit(self, funcname, args, kwargs):
+        op = {
+            'bitand': '({} & {})',
+            'bitclear': '({} & ((1 << {}) ^ 0xffffffff))',
+            'bitlshift': '({} << {})',
+            'bitnot': '~{}',
+            'bitor': '({} | {})',
+            'bitrshift': '({} >> {})',
+            'bitset': '({} | (1 << {}))',
+            'bittest': '(({} & (1 << {})) > 0)',
+            'bitxor': '({} ^ {})'
+        }
+        return add_args_to_code(op[funcname], [int(arg) for arg in args])
+
+    @converts_function('abs', 'round', 'max', 'min')
+    def convert_builtin(self, funcname, args, kwargs):
+        return make_func_code(funcname, *args)
+
+    @converts_function('mod')
+    def convert_mod(self, funcname, args, kwargs):
+        return add_args_to_code('({} % {})', args)
+
+    @converts_function('int')
+    def convert_int(self, funcname, args, kwargs):
+        return int(args[0])
+
+    @converts_function('isnull')
+    def convert_isnull(self, funcname, args, kwargs):
+        return add_args_to_code('{} == {}', [args[0], None])
+
+    @converts_function('isalpha', 'islower', 'isdigit', 'isupper')
+    def convert_is(self, funcname, args, kwargs):
+        return add_args_to_code('{}[:1].{}()', [args[0], CodeStr(funcname)])
+
+    @converts_function('inlist')
+    def convert_inlist(self, funcname, args, kwargs):
+        return add_args_to_code('({} in {})', [args[0], tuple(args[1:])])
+
+    @converts_function('parameters')
+    def convert_parameters(self, funcname, args, kwargs):
+        return CodeStr('vfpfunc.PARAMETERS')
+
+    @converts_function('pythonfunctioncall')
+    def convert_pythonfunctioncall(self, funcname, args, kwargs):
+        if len(args) == 3:
             self.imports.append('import {}'.format(args[0]))
             if isinstance(args[2], tuple):
                 return make_func_code('{}.{}'.format(args[0], args[1]), *args[2])
             else:
                 return make_func_code('{}.{}'.format(args[0], args[1]), add_args_to_code('*{}', (args[2],)))
-        if funcname == 'createobject':
-            if len(args) > 0 and string_type(args[0]) and args[0].lower() == 'pythontuple':
-                return tuple(args[1:])
-            elif len(args) > 0 and string_type(args[0]) and args[0].lower() == 'pythonlist':
-                if len(args) > 1 and isinstance(args[1], list):
-                    return add_args_to_code('{}.data[:]', args[1])
-                return []
-            elif len(args) > 0 and string_type(args[0]) and args[0].lower() == 'pythondictionary':
-                return {}
-            elif len(args) > 0 and string_type(args[0]):
-                objtype = args[0]
-                if not objtype.startswith('self.'):
-                    objtype = objtype.title()
-                args = args[1:]
-                if objtype in self.class_list:
-                    return make_func_code(objtype, *args, **kwargs)
-                elif hasattr(vfpfunc, objtype):
-                    objtype = 'vfpfunc.{}'.format(objtype)
-                    return make_func_code(objtype, *args, **kwargs)
-                else:
-                    return make_func_code('vfpfunc.create_object', *([objtype] + args), **kwargs)
-            else:
-                return make_func_code('vfpfunc.create_object', *args, **kwargs)
-        if funcname in ('fcreate', 'fopen'):
-            opentypes = ('w', 'r') if funcname == 'fcreate' else ('r', 'w', 'r+')
-            if len(args) > 1 and args[1] <= len(opentypes):
-                args[1] = int(args[1])
-                if isinstance(args[1], int):
-                    args[1] = opentypes[args[1]]
-                else:
-                    args[1] = add_args_to_code({}[{}]).format(opentypes, args[1])
-            else:
-                args.append(opentypes[0])
-            return make_func_code('open', *args)
-        if funcname == 'fclose':
-            return add_args_to_code('{}.close()', args)
-        if funcname in ('fputs', 'fwrite'):
-            if len(args) == 3:
-                args[2] = int(args[2])
-                args[1] = add_args_to_code('{}[:{}]', args[1:])
-            if funcname == 'fputs':
-                args[1] += '\r\n'
-            return add_args_to_code('{}.write({})', args)
-        if funcname in ('fgets', 'fread'):
-            if funcname == 'fgets':
-                code = '{}.readline({}).strip(\'\\r\\n\')'
+
+    @converts_function('createobject')
+    def convert_createobject(self, funcname, args, kwargs):
+        if len(args) > 0 and string_type(args[0]) and args[0].lower() == 'pythontuple':
+            return tuple(args[1:])
+        elif len(args) > 0 and string_type(args[0]) and args[0].lower() == 'pythonlist':
+            if len(args) > 1 and isinstance(args[1], list):
+                return add_args_to_code('{}.data[:]', args[1])
+            return []
+        elif len(args) > 0 and string_type(args[0]) and args[0].lower() == 'pythondictionary':
+            return {}
+        elif len(args) > 0 and string_type(args[0]):
+            objtype = args[0]
+            if not objtype.startswith('self.'):
+                objtype = objtype.title()
+            args = args[1:]
+            if objtype in self.class_list:
+                return make_func_code(objtype, *args, **kwargs)
+            elif objtype in vfpfunc_names():
+                objtype = 'vfpfunc.{}'.format(objtype)
+                return make_func_code(objtype, *args, **kwargs)
             else:
-                code = '{}.read({})'
-            if len(args) < 2:
-                args.append(CodeStr(''))
+                return make_func_code('vfpfunc.create_object', *([objtype] + args), **kwargs)
+        else:
+            return make_func_code('vfpfunc.create_object', *args, **kwargs)
+
+    @converts_function('fcreate', 'fopen')
+    def convert_fopen(self, funcname, args, kwargs):
+        opentypes = ('w', 'r') if funcname == 'fcreate' else ('r', 'w', 'r+')
+        if len(args) > 1 and args[1] <= len(opentypes):
+            args[1] = int(args[1])
+            if isinstance(args[1], int):
+                args[1] = opentypes[args[1]]
             else:
-                args[1] = int(args[1])
-            return add_args_to_code(code, args)
-        if funcname == 'fseek':
-            funcname = '{}.seek'.format(args[0])
-            return make_func_code(funcname, *args[1:])
-        if funcname in ('file', 'directory', 'justdrive', 'justpath', 'justfname', 'juststem', 'justext', 'forceext', 'addbs', 'curdir'):
-            if self.filesystem_caseless:
-                args = [arg.lower() if string_type(arg) else arg for arg in args]
-            self.imports.append('import os')
-            operation = {
-                'file': [make_func_code, ['os.path.isfile'] + args],
-                'directory': [make_func_code, ['os.path.isdir'] + args],
-                'justdrive': [add_args_to_code, ('os.path.splitdrive({})[0]', args)],
-                'justpath': [make_func_code, ['os.path.dirname'] + args],
-                'justfname': [make_func_code, ['os.path.basename'] + args],
-                'juststem': [add_args_to_code, ('os.path.splitext(os.path.basename({}))[0]', args)],
-                'justext': [add_args_to_code, ('os.path.splitext({})[1][1:]', args)],
-                'forceext': [add_args_to_code, ('os.path.splitext({})[0] + \'.\' + {}', args)],
-                'addbs': [make_func_code, ['os.path.join'] + args + ['']],
-                'curdir': [make_func_code, ['os.getcwd']],
-            }[funcname]
-            return operation[0](*operation[1])
-        if funcname == 'set' and len(args) > 0 and string_type(args[0]):
-            args[0] = args[0].lower()
-        if funcname == 'select_function' and not args:
-            args = (add_args_to_code('{} if {} else {}', (0, CodeStr('vfpfunc.set(\'compatible\') == \'OFF\''), None)),)
-        if funcname in dir(vfpfunc):
-            funcname = 'vfpfunc.' + funcname
-        elif funcname in dir(DB):
-            funcname = 'DB.' + funcname
+                args[1] = add_args_to_code({}[{}]).format(opentypes, args[1])
         else:
-            funcname = self.scopeId(funcname, 'func')
-        return make_func_code(funcname, *args)
+            args.append(opentypes[0])
+        return make_func_code('open', *args)
+
+    @converts_function('fclose')
+    def convert_fclose(self, funcname, args, kwargs):
+        return add_args_to_code('{}.close()', args)
+
+    @converts_function('fputs', 'fwrite')
+    def convert_fwrite(self, funcname, args, kwargs):
+        if len(args) == 3:
+            args[2] = int(args[2])
+            args[1] = add_args_to_code('{}[:{}]', args[1:])
+        if funcname == 'fputs':
+            args[1] += '\r\n'
+        return add_args_to_code('{}.write({})', args)
+
+    @converts_function('fgets', 'fread')
+    def convert_fread(self, funcname, args, kwargs):
+        if funcname == 'fgets':
+            code = '{}.readline({}).strip(\'\\r\\n\')'
+        else:
+            code = '{}.read({})'
+        if len(args) < 2:
+            args.append(CodeStr(''))
+        else:
+            args[1] = int(args[1])
+        return add_args_to_code(code, args)
+
+    @converts_function('fseek')
+    def convert_fseek(self, funcname, args, kwargs):
+        funcname = '{}.seek'.format(args[0])
+        return make_func_code(funcname, *args[1:])
+
+    @converts_function('file', 'directory', 'justdrive', 'justpath', 'justfname', 'juststem', 'justext', 'forceext', 'addbs', 'curdir')
+    def convert_path_function(self, funcname, args, kwargs):
+        if self.filesystem_caseless:
+            args = [arg.lower() if string_type(arg) else arg for arg in args]
+        self.imports.append('import os')
+        operation = {
+            'file': [make_func_code, ['os.path.isfile'] + args],
+            'directory': [make_func_code, ['os.path.isdir'] + args],
+            'justdrive': [add_args_to_code, ('os.path.splitdrive({})[0]', args)],
+            'justpath': [make_func_code, ['os.path.dirname'] + args],
+            'justfname': [make_func_code, ['os.path.basename'] + args],
+            'juststem': [add_args_to_code, ('os.path.splitext(os.path.basename({}))[0]', args)],
+            'justext': [add_args_to_code, ('os.path.splitext({})[1][1:]', args)],
+            'forceext': [add_args_to_code, ('os.path.splitext({})[0] + \'.\' + {}', args)],
+            'addbs': [make_func_code, ['os.path.join'] + args + ['']],
+            'curdir': [make_func_code, ['os.getcwd']],
+        }[funcname]
+        return operation[0](*operation[1])
+
+    @converts_function('set')
+    def convert_set(self, funcname, args, kwargs):
+        if len(args) > 0 and string_type(args[0]):
+            args[0] = args[0].lower()
+
+    @converts_function('select_function')
+    def convert_select(self, funcname, args, kwargs):
+        if not args:
+            args.append(add_args_to_code('{} if {} else {}', (0, CodeStr('vfpfunc.set(\'compatible\') == \'OFF\''), None)))
 
     def scopeId(self, identifier, vartype):
         scope = CodeStr({
@@ -1150,7 +1329,7 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
         return make_func_code(funcname, self.visit(ctx.specialExpr()))
 
     def visitSpecialExpr(self, ctx):
-        expr = self.visit(ctx.pathname() or ctx.expr())
+        expr = self.visit(ctx.pathname() or special_pathname(ctx) or ctx.expr())
         return expr.lower() if string_type(expr) else expr
 
     def visitPathname(self, ctx):
@@ -1205,7 +1384,14 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
         return create_string(self.getCtxText(ctx)[1:-1])
 
     def visitPower(self, ctx):
-        return self.operationExpr(ctx, '**')
+        # foxpro powers group from the left and python powers from the right
+        left, right = ctx.expr()
+        left = self.visit(left) if not isinstance(left, (ctx.parser.SubExprContext, ctx.parser.PowerContext)) else add_args_to_code('({})', (self.visit(left),))
+        if isinstance(right, ctx.parser.SubExprContext) and not isinstance(inner_expr(right), ctx.parser.PowerContext):
+            right = add_args_to_code('({})', (self.visit(right),))
+        else:
+            right = self.visit(right)
+        return add_args_to_code('{} ** {}', (left, right))
 
     def visitMultiplication(self, ctx):
         return self.operationExpr(ctx, ctx.op.type)
@@ -1240,7 +1426,6 @@ class PythonConvertVisitor(VisualFoxpro9Visitor):
             return expr
         left, right = [add_parens(ctx, expr) for expr in ctx.expr()]
         symbols = {
-            '**': '**',
             '%': '%',
             ctx.parser.ASTERISK: '*',
             ctx.parser.FORWARDSLASH: '/',
@@ -24,6 +24,7 @@ except ImportError:
     pass
 
 from .vfpdatabase import DatabaseContext
+from . import pathindex
 
 SET_PROPS = {
     'bell': ['ON', ''],
@@ -1265,10 +1266,9 @@ def locfile(filename, ext='', caption=''):
         return os.path.abspath(filename)
     dirname = os.path.dirname(filename)
     filename = os.path.basename(filename)
-    for path in SEARCH_PATH:
-        testpath = os.path.join(path, filename)
-        if os.path.isfile(testpath):
-            return os.path.abspath(testpath)
+    testpath = pathindex.locate(filename, SEARCH_PATH)
+    if testpath:
+        return os.path.abspath(testpath)
     return getfile(file_ext=ext, title=caption)
 
 def message(flag=None):
@@ -0,0 +1,56 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import ast
+import os
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_ATTRIBUTES = ('__builtins__', '__cached__', '__doc__', '__file__', '__loader__', '__name__', '__package__', '__spec__')
+CLASS_ATTRIBUTES = ('__dict__', '__module__', '__weakref__')
+
+NAMES = {}
+
+def read_module(filename):
+    with open(os.path.join(MODULE_DIR, filename), 'rb') as fid:
+        return ast.parse(fid.read(), filename)
+
+def bound_names(statements):
+    '''names bound by a block of statements, following every branch of an if or try since either could run'''
+    names = set()
+    for statement in statements:
+        if isinstance(statement, (ast.FunctionDef, ast.ClassDef)):
+            names.add(statement.name)
+        elif isinstance(statement, (ast.Import, ast.ImportFrom)):
+            for alias in statement.names:
+                names.add(alias.asname or alias.name.split('.')[0])
+        elif isinstance(statement, (ast.Assign, ast.AugAssign, ast.For)):
+            targets = statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+            for target in targets:
+                names.update(node.id for node in ast.walk(target) if isinstance(node, ast.Name))
+        for field in ('body', 'orelse', 'finalbody', 'handlers'):
+            block = getattr(statement, field, None)
+            if block and not isinstance(statement, (ast.FunctionDef, ast.ClassDef)):
+                names.update(bound_names(block))
+    return names
+
+def instance_names(classdef):
+    '''methods and class attributes of a class along with the attributes its methods assign to self'''
+    names = bound_names(classdef.body) | set(dir(object)) | set(CLASS_ATTRIBUTES)
+    for node in ast.walk(classdef):
+        if isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Store) and \
+                isinstance(node.value, ast.Name) and node.value.id == 'self':
+            names.add(node.attr)
+    return names
+
+def vfpfunc_names():
+    '''names defined at the top of the vfpfunc runtime, read from its source so it need not be imported'''
+    if 'vfpfunc' not in NAMES:
+        NAMES['vfpfunc'] = frozenset(bound_names(read_module('vfpfunc.py').body) | set(MODULE_ATTRIBUTES))
+    return NAMES['vfpfunc']
+
+def database_names():
+    '''names available on vfpfunc.DB, an instance of vfpdatabase.DatabaseContext'''
+    if 'DB' not in NAMES:
+        classes = [node for node in read_module('vfpdatabase.py').body if isinstance(node, ast.ClassDef)]
+        NAMES['DB'] = frozenset(next(instance_names(node) for node in classes if node.name == 'DatabaseContext'))
+    return NAMES['DB']
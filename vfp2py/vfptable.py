@@ -0,0 +1,186 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import datetime as dt
+import errno
+import mmap
+import struct
+
+CODE_PAGES = {
+    0x01: 'cp437',
+    0x02: 'cp850',
+    0x03: 'cp1252',
+    0x04: 'mac_roman',
+    0x64: 'cp852',
+    0x65: 'cp866',
+    0x66: 'cp865',
+    0x67: 'cp861',
+    0x7d: 'cp1255',
+    0x7e: 'cp1256',
+    0xc8: 'cp1250',
+    0xc9: 'cp1251',
+    0xca: 'cp1254',
+    0xcb: 'cp1253',
+}
+DEFAULT_CODE_PAGE = 'cp1252'
+MEMO_TYPES = 'MGW'
+BINARY_FLAG = 0x04
+JULIAN_ORDINAL_OFFSET = 1721425
+
+def map_file(filename):
+    with open(filename, 'rb') as fid:
+        try:
+            return mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b''
+
+class Field(object):
+    def __init__(self, name, field_type, offset, length, decimals, flags):
+        self.name = name
+        self.type = field_type
+        self.offset = offset
+        self.length = length
+        self.decimals = decimals
+        self.flags = flags
+
+class Table(object):
+    '''Read only view of a Visual Foxpro table such as a scx, vcx or pjx and its memo file.
+
+    Both files are mapped into memory and read in place, a field is only
+    decoded when a record is asked for it.'''
+
+    def __init__(self, filename, memofile=None):
+        self.filename = filename
+        self.memoname = memofile
+        self.data = map_file(filename)
+        self.memo_data = None
+        if len(self.data) < 32:
+            self.close()
+            raise IOError(errno.EINVAL, 'not a foxpro table', filename)
+        num_records, header_length, self.record_length = struct.unpack('<IHH', self.data[4:12])
+        self.header_length = header_length
+        self.encoding = CODE_PAGES.get(struct.unpack('<B', self.data[29:30])[0], DEFAULT_CODE_PAGE)
+        self.num_records = min(num_records, max(len(self.data) - header_length, 0) // max(self.record_length, 1))
+        self.fields = []
+        offset = 1
+        for start in range(32, header_length - 31, 32):
+            descriptor = self.data[start:start+32]
+            if descriptor[:1] == b'\r':
+                break
+            name = descriptor[:11].split(b'\x00')[0].decode('ascii').lower()
+            field_type = descriptor[11:12].decode('ascii').upper()
+            length, decimals, flags = struct.unpack('<BBB', descriptor[16:19])
+            self.fields.append(Field(name, field_type, offset, length, decimals, flags))
+            offset += length
+        self.field_map = {field.name: field for field in self.fields}
+        if any(field.type in MEMO_TYPES for field in self.fields):
+            if not memofile:
+                self.close()
+                raise IOError(errno.ENOENT, 'memo file not found', filename)
+            self.memo_data = map_file(memofile)
+            self.block_size = struct.unpack('>H', self.memo_data[6:8])[0] or 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for data in (self.data, self.memo_data):
+            if isinstance(data, mmap.mmap):
+                data.close()
+        self.data = self.memo_data = None
+
+    def __len__(self):
+        return self.num_records
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.num_records
+        if not 0 <= index < self.num_records:
+            raise IndexError('record {} out of range'.format(index))
+        return Record(self, self.header_length + index * self.record_length)
+
+    def __iter__(self):
+        for index in range(self.num_records):
+            yield self[index]
+
+    @property
+    def field_names(self):
+        return [field.name for field in self.fields if not field.flags & 0x01]
+
+    def memo(self, block):
+        start = block * self.block_size
+        length = struct.unpack('>I', self.memo_data[start+4:start+8])[0]
+        return self.memo_data[start+8:start+8+length]
+
+    def decode(self, field, raw):
+        if field.type in MEMO_TYPES:
+            block = struct.unpack('<i', raw)[0] if field.length == 4 else int(raw.strip() or 0)
+            if not block:
+                return b'' if field.type != 'M' or field.flags & BINARY_FLAG else ''
+            raw = self.memo(block)
+            return raw if field.type != 'M' or field.flags & BINARY_FLAG else raw.decode(self.encoding)
+        elif field.type == 'C':
+            return raw if field.flags & BINARY_FLAG else raw.decode(self.encoding)
+        elif field.type == 'L':
+            if raw in (b'T', b't', b'Y', b'y'):
+                return True
+            elif raw in (b'F', b'f', b'N', b'n'):
+                return False
+            return None
+        elif field.type in 'NF':
+            raw = raw.strip()
+            if not raw:
+                return None
+            return float(raw) if field.decimals or b'.' in raw else int(raw)
+        elif field.type == 'I':
+            return struct.unpack('<i', raw)[0]
+        elif field.type == 'B':
+            return struct.unpack('<d', raw)[0]
+        elif field.type == 'Y':
+            return struct.unpack('<q', raw)[0] / 10000
+        elif field.type == 'D':
+            raw = raw.strip()
+            return dt.datetime.strptime(raw.decode('ascii'), '%Y%m%d').date() if raw.strip(b'0') else None
+        elif field.type == 'T':
+            days, milliseconds = struct.unpack('<ii', raw)
+            if not days:
+                return None
+            return dt.datetime.fromordinal(days - JULIAN_ORDINAL_OFFSET) + dt.timedelta(milliseconds=milliseconds)
+        return raw
+
+class Record(object):
+    '''one record of a Table, fields are read by name as items or attributes'''
+
+    def __init__(self, table, offset):
+        self._table = table
+        self._offset = offset
+        self._values = {}
+
+    @property
+    def deleted(self):
+        return self._table.data[self._offset:self._offset+1] == b'*'
+
+    def __getitem__(self, name):
+        name = name.lower()
+        if name not in self._values:
+            try:
+                field = self._table.field_map[name]
+            except KeyError:
+                raise KeyError('{} has no field {}'.format(self._table.filename, name))
+            start = self._offset + field.offset
+            self._values[name] = self._table.decode(field, self._table.data[start:start+field.length])
+        return self._values[name]
+
+    def get(self, name, default=None):
+        return self[name] if name.lower() in self._table.field_map else default
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError as err:
+            raise AttributeError(str(err))
@@ -0,0 +1,109 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+import logging
+import os
+import time
+import traceback
+
+from . import depgraph
+from . import vfp2py
+
+CODE_EXTENSIONS = ('.prg', '.mpr', '.spr', '.scx', '.vcx')
+MEMO_EXTENSIONS = {'.scx': 'sct', '.vcx': 'vct'}
+
+def source_files(infile):
+    '''the file along with the memo file of a form or class library'''
+    file_ext = os.path.splitext(infile.lower())[1]
+    if file_ext in MEMO_EXTENSIONS and os.path.isdir(os.path.dirname(infile) or '.'):
+        memofile = vfp2py.memo_filename(infile, MEMO_EXTENSIONS[file_ext])
+        if memofile:
+            return [infile, memofile]
+    return [infile]
+
+class Watcher(object):
+    '''Converts a file or project and then only the files that changed since.
+
+    The stamps of each source file and of every file it included are kept from
+    its last conversion. A file is converted again once any of those stamps
+    change, so editing a header converts every file that includes it. Files of a
+    project that depend on a changed file, such as the subclasses of a class in
+    a changed class library, are converted again as well. The converter stays
+    loaded between polls, keeping the parser's prediction cache and the
+    preprocessed headers warm.'''
+
+    def __init__(self, infile, outpath):
+        self.infile = infile
+        self.outpath = outpath
+        self.project = infile.lower().endswith('.pjx')
+        self.search_path = vfp2py.SEARCH_PATH[:]
+        self.project_stamp = None
+        self.jobs = []
+        self.stamps = {}
+        self.project_files = {}
+        self.graph = None
+
+    def load_jobs(self):
+        if not self.project:
+            outfile = self.outpath
+            if os.path.isdir(outfile):
+                outfile = vfp2py.output_filename(self.infile, outfile)
+            return [(os.path.basename(self.infile).lower(), self.infile, outfile)]
+        vfp2py.SEARCH_PATH[:] = self.search_path
+        project_files, main_file, directory, project_jobs = vfp2py.prepare_project(self.infile, self.outpath)
+        vfp2py.write_project_package(project_files, main_file, directory)
+        self.project_files = project_files
+        self.graph = depgraph.load_graph(self.infile, project_files, vfp2py.CACHE_DIR)
+        jobs = []
+        for name, infile, directory in project_jobs:
+            if os.path.splitext(infile.lower())[1] in CODE_EXTENSIONS:
+                jobs.append((name, infile, vfp2py.output_filename(infile, directory)))
+            else:
+                jobs.append((name, infile, directory))
+        return jobs
+
+    def changed(self):
+        '''the jobs whose files changed along with the jobs of every file that depends on them'''
+        changed = [job for job in self.jobs if job[0] not in self.stamps or
+                   any(vfp2py.file_stamp(filename) != stamp for filename, stamp in self.stamps[job[0]].items())]
+        if self.graph and changed:
+            names = set(job[0] for job in changed)
+            names |= self.graph.update(self.project_files).dependents(names)
+            changed = [job for job in self.jobs if job[0] in names]
+        return changed
+
+    def convert(self, name, infile, outfile):
+        print('processing {}'.format(name))
+        stamps = {filename: vfp2py.file_stamp(filename) for filename in source_files(infile)}
+        try:
+            includes = vfp2py.convert_file(infile, outfile) or []
+        except Exception:
+            logging.getLogger().error('failed to convert {}:\n{}'.format(name, traceback.format_exc()))
+            sources, stamps = stamps, dict(self.stamps.get(name, {}))
+            stamps.update(sources)
+        else:
+            for include_name, filename in includes:
+                stamps[filename] = vfp2py.file_stamp(filename)
+        self.stamps[name] = stamps
+
+    def poll(self):
+        '''convert every file that changed since the last poll and return their names'''
+        project_stamp = vfp2py.file_stamp(self.infile)
+        if project_stamp != self.project_stamp:
+            self.project_stamp = project_stamp
+            self.jobs = self.load_jobs()
+            names = set(job[0] for job in self.jobs)
+            self.stamps = {name: stamps for name, stamps in self.stamps.items() if name in names}
+        jobs = self.changed()
+        for job in jobs:
+            self.convert(*job)
+        return [job[0] for job in jobs]
+
+def watch(infile, outpath, interval=1.0):
+    '''convert a file or project and keep converting the files that change until interrupted'''
+    watcher = Watcher(infile, outpath)
+    watcher.poll()
+    print('watching {} for changes'.format(infile))
+    while True:
+        time.sleep(interval)
+        watcher.poll()